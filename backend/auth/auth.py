@@ -40,29 +40,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+def decode_access_token(token: str) -> Optional[str]:
+    """User ID from a JWT access token, or None if it is invalid or expired"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = TokenData(user_id=user_id)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    
-    return token_data
+        return None
+    return payload.get("sub")
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Verify JWT token"""
+    user_id = decode_access_token(credentials.credentials)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return TokenData(user_id=user_id)
 
 async def get_current_user(token_data: TokenData = Depends(verify_token)):
     """Get current user from token"""
     from services.user_service import UserService
+    from database.database import Database
     
+    # Later reads in this request see the user's own recent writes
+    Database.bind_session(token_data.user_id)
     user = UserService.get_user_by_id(token_data.user_id)
     if user is None:
         raise HTTPException(
@@ -108,10 +108,11 @@ async def find_or_create_user(email: str, name: str, google_id: str, picture: Op
     
     try:
         # Check if user already exists by email
-        existing_user = Database.execute_single_query(
-            "SELECT * FROM users WHERE email = %s", 
-            (email,)
-        )
+        with Database.primary():
+            existing_user = Database.execute_single_query(
+                "SELECT * FROM users WHERE email = %s", 
+                (email,)
+            )
         
         if existing_user:
             # Update Google ID if not set
@@ -130,10 +131,11 @@ async def find_or_create_user(email: str, name: str, google_id: str, picture: Op
             )
         
         # Check if user exists by Google ID (shouldn't happen but just in case)
-        existing_google_user = Database.execute_single_query(
-            "SELECT * FROM users WHERE google_id = %s", 
-            (google_id,)
-        )
+        with Database.primary():
+            existing_google_user = Database.execute_single_query(
+                "SELECT * FROM users WHERE google_id = %s", 
+                (google_id,)
+            )
         
         if existing_google_user:
             return UserResponse(
@@ -147,25 +149,26 @@ async def find_or_create_user(email: str, name: str, google_id: str, picture: Op
         # Create new user
         user_id = str(uuid.uuid4())
         
-        Database.execute_query(
-            """
-            INSERT INTO users (id, email, name, google_id, password_hash)
-            VALUES (%s, %s, %s, %s, %s)
-            """,
-            (user_id, email, name, google_id, 'oauth_user')  # Empty password for OAuth users
-        )
-        
-        # Create user settings
-        Database.execute_query(
-            "INSERT INTO user_settings (user_id) VALUES (%s)",
-            (user_id,)
-        )
-        
-        # Get the created user
-        new_user = Database.execute_single_query(
-            "SELECT * FROM users WHERE id = %s", 
-            (user_id,)
-        )
+        with Database.transaction():
+            Database.execute_query(
+                """
+                INSERT INTO users (id, email, name, google_id, password_hash)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (user_id, email, name, google_id, 'oauth_user')  # Empty password for OAuth users
+            )
+            
+            # Create user settings
+            Database.execute_query(
+                "INSERT INTO user_settings (user_id) VALUES (%s)",
+                (user_id,)
+            )
+            
+            # Get the created user
+            new_user = Database.execute_single_query(
+                "SELECT * FROM users WHERE id = %s", 
+                (user_id,)
+            )
         
         if not new_user:
             raise HTTPException(
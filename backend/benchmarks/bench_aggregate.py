@@ -0,0 +1,89 @@
+"""Group-by and pivot queries over a large spreadsheet
+
+Run from the backend directory; the sheet is generated in memory, so no
+database is needed:
+
+    python benchmarks/bench_aggregate.py [--rows 1000000] [--stores 500] [--repeat 5]
+
+The sheet has a header row and Region, Store, Month, Units and Revenue
+columns. Reported: the time to evaluate the workbook (what the first query on
+a new document version pays), then for each query the first run, which
+factorizes the columns it touches, and the median of the repeats that reuse
+them. Results served from the per-query cache skip all of this.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import AggregationQuery
+from services.aggregation import aggregate
+from services.formulas import Workbook
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+QUERIES = {
+    "total": AggregationQuery(measures=[{"function": "sum", "column": "Revenue"}, {"function": "count"}]),
+    "by region": AggregationQuery(
+        group_by=["Region"],
+        measures=[{"function": "avg", "column": "Revenue"}, {"function": "max", "column": "Units"}, {"function": "count"}],
+        sort=[{"by": "count", "descending": True}]
+    ),
+    "filtered by store": AggregationQuery(
+        group_by=["Region", "Store"],
+        measures=[{"function": "sum", "column": "Revenue", "alias": "revenue"}],
+        filters=[{"column": "Units", "op": "gt", "value": 10}, {"column": "Region", "op": "ne", "value": "West"}],
+        sort=[{"by": "revenue", "descending": True}], limit=20
+    ),
+    "pivot by month": AggregationQuery(
+        group_by=["Region", "Store"], pivot="Month",
+        measures=[{"function": "sum", "column": "Revenue"}], limit=100
+    ),
+}
+
+def build_rows(count: int, stores: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rows = [["Region", "Store", "Month", "Units", "Revenue"]]
+    for _ in range(count):
+        rows.append([
+            rng.choice(REGIONS), f"S{rng.randrange(stores)}", rng.randrange(1, 13),
+            rng.randrange(100), round(rng.random() * 1000, 2)
+        ])
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spreadsheet aggregation")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--stores", type=int, default=500, help="distinct values in the Store column")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows, args.stores, args.seed)
+    started = time.perf_counter()
+    workbook = Workbook([{"name": "Sales", "data": rows}])
+    build = time.perf_counter() - started
+    sheet = workbook.sheets["Sales"]
+    columns = {}
+
+    print(f"{args.rows:,} rows, {args.stores} stores\n")
+    print(f"evaluate workbook    {build * 1000:8.0f} ms\n")
+    print(f"{'query':<20} {'first ms':>9} {'warm ms':>9} {'groups':>8} {'matched':>10}")
+    for name, query in QUERIES.items():
+        started = time.perf_counter()
+        result = aggregate(sheet, query, columns)
+        first = time.perf_counter() - started
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            aggregate(sheet, query, columns)
+            timings.append(time.perf_counter() - started)
+        print(f"{name:<20} {first * 1000:>9.0f} {statistics.median(timings) * 1000:>9.1f} "
+              f"{result['total_groups']:>8,} {result['matched_rows']:>10,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Throughput of the collaboration service with many editors per document
+
+Run from the backend directory; documents are kept in memory, so no database
+is needed:
+
+    python benchmarks/bench_collab.py [--documents 4] [--editors 50] [--ops-per-second 10]
+
+Every editor types into one shared string of its document: each op is an
+insert or delete based on the last revision the editor has seen, so ops race
+and get transformed like real concurrent edits. Editors are in-process fake
+sockets, so the numbers exclude network I/O but include the editors' own JSON
+parsing. Reported: ops applied per second, time from sending an op to seeing
+it acknowledged, frames sent, and database writes per second (with a
+simulated write latency) compared to one write per op.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from services.collaboration import CollaborationService
+
+class BenchCollaborationService(CollaborationService):
+    """Keeps documents in memory and sleeps instead of writing to MySQL"""
+
+    def __init__(self, write_latency: float, **kwargs):
+        super().__init__(**kwargs)
+        self.write_latency = write_latency
+        self.saved = {}
+        self.versions = {}
+
+    def _load_document(self, document_id):
+        return {"text": "Shared document. "}, self.versions.setdefault(document_id, 1)
+
+    def _save_document(self, document_id, content_json, expected_version):
+        time.sleep(self.write_latency)
+        self.saved[document_id] = content_json
+        self.versions[document_id] = expected_version + 1
+        return self.versions[document_id]
+
+    def _stored_version(self, document_id):
+        return self.versions.get(document_id)
+
+class FakeEditor:
+    """Stands in for a browser: a socket the service talks to plus a typist"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.client = None
+        self.revision = 0
+        self.length = 0
+        self.next_id = 0
+        self.sent = {}
+        self.latencies = []
+        self.frames = 0
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send_text(self, text: str):
+        self.frames += 1
+        message = orjson.loads(text)
+        if message["type"] == "snapshot":
+            self.client = message["client"]
+            self.revision = message["rev"]
+            self.length = len(message["content"]["text"])
+            return
+        if message["type"] != "batch":
+            return
+        now = time.perf_counter()
+        for change in message["messages"]:
+            if change["type"] != "change" or change["rev"] <= self.revision:
+                continue
+            self.revision = change["rev"]
+            for op in change["ops"]:
+                self.length += len(op["text"]) if op["op"] == "insert" else -op["length"]
+            if change["client"] == self.client and change["id"] in self.sent:
+                self.latencies.append(now - self.sent.pop(change["id"]))
+
+    async def close(self, code: int = 1000):
+        await self.inbox.put({"type": "websocket.disconnect", "code": code})
+
+    def type_once(self):
+        if self.client is None:
+            return
+        if self.length > 20 and self.rng.random() < 0.3:
+            offset = self.rng.randrange(self.length - 1)
+            op = {"op": "delete", "path": ["text"], "offset": offset, "length": 1}
+        else:
+            op = {"op": "insert", "path": ["text"], "offset": self.rng.randint(0, self.length),
+                  "text": self.rng.choice("abcdefghij ")}
+        self.next_id += 1
+        self.sent[self.next_id] = time.perf_counter()
+        message = {"type": "ops", "rev": self.revision, "id": self.next_id, "ops": [op]}
+        self.inbox.put_nowait({"type": "websocket.receive", "text": orjson.dumps(message).decode()})
+
+async def type_loop(editor: FakeEditor, interval: float, stop_at: float):
+    # Spread editors out instead of having them all type on the same tick
+    await asyncio.sleep(editor.rng.uniform(0, interval))
+    while time.perf_counter() < stop_at:
+        editor.type_once()
+        await asyncio.sleep(interval)
+
+async def run(args) -> dict:
+    service = BenchCollaborationService(
+        args.write_latency_ms / 1000,
+        broadcast_interval_ms=args.broadcast_interval_ms,
+        persist_interval=args.persist_interval
+    )
+    await service.start()
+    rng = random.Random(args.seed)
+    editors = []
+    serving = []
+    for document in range(args.documents):
+        for _ in range(args.editors):
+            editor = FakeEditor(random.Random(rng.random()))
+            editors.append(editor)
+            serving.append(asyncio.create_task(service.serve(editor, f"doc-{document}", "bench-user", True)))
+    await asyncio.sleep(0.2)
+
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    await asyncio.gather(*(type_loop(editor, 1 / args.ops_per_second, stop_at) for editor in editors))
+    # Let the last acknowledgements arrive
+    await asyncio.sleep(max(0.2, args.broadcast_interval_ms / 1000 * 4))
+    elapsed = time.perf_counter() - started
+    stats = service.stats()
+
+    for editor in editors:
+        await editor.close()
+    await asyncio.gather(*serving)
+    await service.stop()
+
+    latencies = sorted(latency for editor in editors for latency in editor.latencies)
+    unacknowledged = sum(len(editor.sent) for editor in editors)
+    return {
+        "elapsed": elapsed,
+        "stats": stats,
+        "latencies": latencies,
+        "unacknowledged": unacknowledged,
+        "frames": sum(editor.frames for editor in editors),
+    }
+
+def percentile(ordered, pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark real-time collaboration")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--editors", type=int, default=50, help="editors per document")
+    parser.add_argument("--ops-per-second", type=float, default=10, help="typing rate per editor")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--broadcast-interval-ms", type=float, default=25)
+    parser.add_argument("--persist-interval", type=float, default=2)
+    parser.add_argument("--write-latency-ms", type=float, default=5, help="simulated database write time")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    stats = result["stats"]
+    elapsed = result["elapsed"]
+    latencies = result["latencies"]
+    ops = stats["ops_applied"]
+    writes = stats["persist_writes"]
+
+    print(f"{args.documents} documents x {args.editors} editors at {args.ops_per_second:g} ops/s each, "
+          f"{args.duration:g}s, broadcast every {args.broadcast_interval_ms:g} ms\n")
+    print(f"ops applied          {ops} ({ops / elapsed:,.0f}/s)")
+    print(f"changes              {stats['changes']} ({stats['resyncs']} resyncs, {result['unacknowledged']} unacknowledged)")
+    print(f"ack latency          p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"frames sent          {result['frames']} ({result['frames'] / elapsed:,.0f}/s, "
+          f"{result['frames'] / max(ops, 1):.1f} per op)")
+    print(f"database writes      {writes} ({writes / elapsed:.2f}/s, {stats['persist_bytes'] / 1024:.0f} KB)")
+    print(f"ops per write        {ops / max(writes, 1):,.0f} (writing per keystroke would be 1)")
+    if latencies:
+        print(f"mean ack latency     {statistics.mean(latencies) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Cold-start cost of importing the app: import time, heaviest modules and memory
+
+Run from the backend directory (no database or Gemini needed; importing the
+app must not connect to either):
+
+    python benchmarks/bench_import.py [--runs 5] [--budget-ms 900] [--budget-rss-mb 100] [--top 15]
+
+Each run imports ``main`` in a fresh interpreter under ``-X importtime`` with
+a GEMINI_API_KEY set, so AI would be enabled. Reported: the median time to
+import ``main``, import time per top-level package, and the
+child's peak RSS. Exits with status 1 if either median is over its budget or if
+a module that should load on first use (the Gemini SDK, openpyxl,
+python-docx, PyPDF2, NumPy) was imported.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use; importing any of these at startup is a regression
+LAZY_MODULES = ("google.generativeai", "openpyxl", "docx", "PyPDF2", "numpy")
+
+CHILD = """
+import resource, sys
+import main
+print("rss_kb", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def parse_importtime(stderr: str):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def run_once():
+    env = {**os.environ, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "bench-import")}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"Importing main failed:\n{result.stderr[-2000:]}")
+    rss_kb = next(int(line.split()[1]) for line in result.stdout.splitlines() if line.startswith("rss_kb"))
+    return parse_importtime(result.stderr), rss_kb
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and memory")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=900, help="fail above this median import time")
+    parser.add_argument("--budget-rss-mb", type=float, default=100, help="fail above this median peak RSS")
+    parser.add_argument("--top", type=int, default=15, help="heaviest modules to list")
+    args = parser.parse_args()
+
+    # The first import after a change also compiles bytecode; don't count it
+    run_once()
+    runs = [run_once() for _ in range(args.runs)]
+    main_ms = sorted(modules["main"][1] / 1000 for modules, _ in runs)
+    rss_mb = statistics.median(rss_kb for _, rss_kb in runs) / 1024
+    median_ms = statistics.median(main_ms)
+    modules = runs[len(runs) // 2][0]
+
+    print(f"import main          median {median_ms:.0f} ms (min {main_ms[0]:.0f}, max {main_ms[-1]:.0f}) "
+          f"over {args.runs} runs, budget {args.budget_ms:.0f} ms")
+    print(f"peak RSS             {rss_mb:.0f} MB, budget {args.budget_rss_mb:.0f} MB\n")
+    print(f"{'ms':>8} {'modules':>8}  package")
+    # Own time summed per top-level package, so nesting order doesn't decide who gets charged
+    packages = {}
+    for name, (self_us, _) in modules.items():
+        package = name.split(".")[0]
+        total, count = packages.get(package, (0, 0))
+        packages[package] = (total + self_us, count + 1)
+    for package, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{self_us / 1000:>8.1f} {count:>8}  {package}")
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    failed = False
+    if eager:
+        print(f"\nImported at startup but should load on first use: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"\nImport time {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if rss_mb > args.budget_rss_mb:
+        print(f"\nPeak RSS {rss_mb:.0f} MB is over the {args.budget_rss_mb:.0f} MB budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Compare document response serialization paths on large documents
+
+Run from the backend directory; no database is needed:
+
+    python benchmarks/bench_json.py [--size-mb 5] [--iterations 20]
+
+Builds a TipTap-style document of about --size-mb megabytes, stored the way
+MySQL returns a JSON column, and times turning that row into response bytes:
+
+- validate: json.loads, a validated DocumentResponse, then FastAPI's default
+  JSON response (the path GET /api/documents/{id} used to take)
+- construct: orjson.loads, DocumentResponse.model_construct, then the same
+  response_model handling rendered with ORJSONResponse (search and writes)
+- raw: the stored content spliced into the response unparsed (document GETs
+  and the document list)
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from models.models import DocumentResponse
+from services.document_service import DocumentService
+
+WORDS = (
+    "quarterly revenue forecast review meeting notes action items owner deadline "
+    "budget hiring roadmap launch customer feedback metrics retention growth"
+).split()
+
+def build_content(size_bytes: int, seed: int) -> dict:
+    """TipTap document with paragraphs, marks and the odd heading"""
+    rng = random.Random(seed)
+    nodes = []
+    size = 0
+    while size < size_bytes:
+        if rng.random() < 0.1:
+            node = {"type": "heading", "attrs": {"level": rng.randint(1, 3)},
+                    "content": [{"type": "text", "text": " ".join(rng.choices(WORDS, k=5))}]}
+        else:
+            node = {"type": "paragraph", "content": [
+                {"type": "text", "text": " ".join(rng.choices(WORDS, k=rng.randint(8, 30)))},
+                {"type": "text", "marks": [{"type": "bold"}], "text": rng.choice(WORDS)},
+                {"type": "text", "text": " ".join(rng.choices(WORDS, k=rng.randint(4, 20))) + "."},
+            ]}
+        nodes.append(node)
+        size += len(json.dumps(node)) + 2
+    return {"type": "doc", "content": nodes}
+
+def build_row(size_bytes: int, seed: int) -> dict:
+    now = datetime.now().replace(microsecond=0)
+    return {
+        "id": "5b6f1c1e-6a8e-4f0e-9d0a-3a1c2f7e9b10",
+        "user_id": "0f9c2d4e-1b3a-4c5d-8e7f-6a5b4c3d2e1f",
+        "title": "Large benchmark document",
+        "document_type": "writer",
+        # MySQL returns JSON columns in this normalized form
+        "content": json.dumps(build_content(size_bytes, seed)),
+        "file_path": None,
+        "file_size": None,
+        "version": 7,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+_response_adapter = TypeAdapter(DocumentResponse)
+
+def render(document: DocumentResponse, response_class) -> bytes:
+    """What FastAPI does with a model returned from a response_model route"""
+    validated = _response_adapter.validate_python(document.model_dump())
+    return response_class(_response_adapter.dump_python(validated, mode="json")).body
+
+def validate_path(row: dict) -> bytes:
+    content = json.loads(row["content"])
+    return render(DocumentResponse(**{**row, "content": content}), JSONResponse)
+
+def construct_path(row: dict) -> bytes:
+    return render(DocumentService._map_document_response(row), ORJSONResponse)
+
+def raw_path(row: dict) -> bytes:
+    return DocumentService._document_json(row)
+
+PATHS = (("validate", validate_path), ("construct", construct_path), ("raw", raw_path))
+
+def time_path(fn, row: dict, iterations: int):
+    fn(row)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(row)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document JSON serialization paths")
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    row = build_row(int(args.size_mb * 1024 * 1024), args.seed)
+    size_mb = len(row["content"]) / (1024 * 1024)
+    print(f"document content: {size_mb:.2f} MB, {args.iterations} iterations per path\n")
+
+    reference = json.loads(validate_path(row))
+    for name, fn in PATHS[1:]:
+        assert json.loads(fn(row)) == reference, f"{name} output differs from validate"
+
+    print(f"{'path':<10} {'p50 ms':>9} {'min ms':>9} {'MB/s':>9} {'speedup':>9}")
+    baseline = None
+    for name, fn in PATHS:
+        samples = time_path(fn, row, args.iterations)
+        p50 = statistics.median(samples)
+        baseline = baseline or p50
+        print(f"{name:<10} {p50 * 1000:>9.1f} {min(samples) * 1000:>9.1f} "
+              f"{size_mb / p50:>9.0f} {baseline / p50:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
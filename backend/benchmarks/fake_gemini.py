@@ -0,0 +1,119 @@
+"""Local stand-in for the Gemini generateContent REST API
+
+Answers like the real service closely enough for google-generativeai with
+transport="rest", while making latency reproducible: every reply waits a
+fixed base latency plus the time to "generate" its tokens at a fixed rate.
+
+    python benchmarks/fake_gemini.py --port 9100 --latency-ms 400 --tokens-per-second 80
+
+Then start the API with GEMINI_API_ENDPOINT=http://127.0.0.1:9100 and
+GEMINI_TRANSPORT=rest (run_benchmark.py does this for you).
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ITEM_PATTERN = re.compile(r"<<<ITEM (\d+)>>>[ \t]*\n(.*?)(?=\n<<<ITEM \d+>>>|\Z)", re.S)
+SINGLE_RESULT_MARKER = "Return only the result:"
+FILLER_WORDS = (
+    "the document outlines key points about planning budgets timelines and review steps "
+    "with clear owners measurable outcomes and follow up actions for the team"
+).split()
+
+app = FastAPI(title="Fake Gemini")
+settings = {"latency_ms": 400.0, "jitter_ms": 50.0, "tokens_per_second": 80.0, "output_tokens": 120, "error_rate": 0.0}
+stats = {"requests": 0, "errors": 0, "started": time.time()}
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def reply_text(prompt: str) -> str:
+    """Echo items back for packed and single-result prompts, filler text otherwise"""
+    if "<<<ITEM" in prompt:
+        items = ITEM_PATTERN.findall(prompt.split("\n\n", 1)[-1])
+        return "\n".join(f"<<<ITEM {number}>>>\n{text.strip()}" for number, text in items)
+    if SINGLE_RESULT_MARKER in prompt:
+        return prompt.split(SINGLE_RESULT_MARKER, 1)[1].strip()
+    count = settings["output_tokens"]
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(count)) + "."
+
+def generate_response(text: str, prompt_tokens: int) -> Dict[str, Any]:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+            "safetyRatings": []
+        }],
+        "promptFeedback": {"safetyRatings": []},
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": estimate_tokens(text),
+            "totalTokenCount": prompt_tokens + estimate_tokens(text)
+        }
+    }
+
+@app.post("/{version}/models/{model}:generateContent")
+async def generate_content(version: str, model: str, request: Request):
+    body = await request.json()
+    prompt = "\n".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    stats["requests"] += 1
+
+    if settings["error_rate"] and random.random() < settings["error_rate"]:
+        stats["errors"] += 1
+        await asyncio.sleep(settings["latency_ms"] / 1000)
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}
+        )
+
+    text = reply_text(prompt)
+    delay_ms = (
+        settings["latency_ms"]
+        + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+        + estimate_tokens(text) / settings["tokens_per_second"] * 1000
+    )
+    await asyncio.sleep(max(delay_ms, 0) / 1000)
+    return generate_response(text, estimate_tokens(prompt))
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "uptime_s": round(time.time() - stats["started"], 1), "settings": settings}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"], help="base latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=settings["jitter_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"])
+    parser.add_argument("--output-tokens", type=int, default=settings["output_tokens"],
+                        help="reply length for free-form prompts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    settings.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
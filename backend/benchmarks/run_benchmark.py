@@ -0,0 +1,346 @@
+"""Load benchmark for the API against local MySQL and the fake Gemini server
+
+Boots fake_gemini.py and the FastAPI app (unless --base-url is given), seeds
+users and documents, then runs a weighted mix of scenarios from concurrent
+virtual users and reports throughput and latency percentiles per endpoint.
+
+    python benchmarks/run_benchmark.py --duration 60 --concurrency 32
+    python benchmarks/run_benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmark.py --baseline benchmarks/baseline.json
+
+See benchmarks/README.md for the MySQL setup and every option.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "autosave=40,list=25,search=15,open=10,chat=10"
+SEARCH_WORDS = ["report", "budget", "plan", "notes", "review", "draft", "summary", "proposal"]
+
+class Recorder:
+    """Latency samples per endpoint label"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.samples.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+def document_content(paragraphs: int, rng: random.Random) -> dict:
+    words = SEARCH_WORDS + ["the", "team", "will", "deliver", "quarterly", "results", "and", "update", "timeline"]
+    return {
+        "type": "doc",
+        "content": [
+            {"type": "paragraph", "content": [{"type": "text", "text": " ".join(rng.choice(words) for _ in range(40))}]}
+            for _ in range(paragraphs)
+        ]
+    }
+
+# Scenarios: one user action, possibly several requests
+
+async def scenario_autosave(client, user, recorder, rng, args):
+    """A burst of saves to one document, as the editor debounces typing"""
+    document_id = rng.choice(user["documents"])
+    content = document_content(args.paragraphs, rng)
+    for _ in range(args.autosave_burst):
+        content["content"][rng.randrange(len(content["content"]))]["content"][0]["text"] += " edit"
+        if args.autosave_buffered:
+            await recorder.call(client, "PUT /api/documents/{id}?autosave", "PUT", f"/api/documents/{document_id}",
+                                params={"autosave": "true"}, json={"content": content}, headers=user["headers"])
+        else:
+            await recorder.call(client, "PUT /api/documents/{id}", "PUT", f"/api/documents/{document_id}",
+                                json={"content": content}, headers=user["headers"])
+    if args.autosave_buffered:
+        # The user saves when done, which writes what the buffer still holds
+        await recorder.call(client, "PUT /api/documents/{id}", "PUT", f"/api/documents/{document_id}",
+                            json={}, headers=user["headers"])
+
+async def scenario_list(client, user, recorder, rng, args):
+    await recorder.call(client, "GET /api/documents", "GET", "/api/documents", headers=user["headers"])
+
+async def scenario_search(client, user, recorder, rng, args):
+    await recorder.call(client, "POST /api/documents/search", "POST", "/api/documents/search",
+                        json={"query": rng.choice(SEARCH_WORDS)}, headers=user["headers"])
+
+async def scenario_open(client, user, recorder, rng, args):
+    document_id = rng.choice(user["documents"])
+    await recorder.call(client, "GET /api/documents/{id}", "GET", f"/api/documents/{document_id}",
+                        headers=user["headers"])
+
+async def scenario_chat(client, user, recorder, rng, args):
+    await recorder.call(client, "POST /api/ai/chat-with-document", "POST", "/api/ai/chat-with-document",
+                        json={"document_id": rng.choice(user["documents"]),
+                              "question": f"What does this say about the {rng.choice(SEARCH_WORDS)}?"},
+                        headers=user["headers"])
+
+SCENARIOS = {
+    "autosave": scenario_autosave,
+    "list": scenario_list,
+    "search": scenario_search,
+    "open": scenario_open,
+    "chat": scenario_chat,
+}
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+async def seed(client: httpx.AsyncClient, args, rng: random.Random) -> List[dict]:
+    """Register users and give each a set of documents"""
+    run_id = uuid.uuid4().hex[:8]
+    users = []
+    for i in range(args.users):
+        response = await client.post("/api/auth/register", json={
+            "email": f"bench-{run_id}-{i}@example.com", "name": f"Bench User {i}", "password": "bench-password"
+        })
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        documents = []
+        for j in range(args.documents_per_user):
+            response = await client.post("/api/documents", headers=headers, json={
+                "title": f"{rng.choice(SEARCH_WORDS).title()} {j}",
+                "document_type": "writer",
+                "content": document_content(args.paragraphs, rng)
+            })
+            response.raise_for_status()
+            documents.append(response.json()["id"])
+        users.append({"headers": headers, "documents": documents})
+    return users
+
+async def virtual_user(client, users, recorder, mix, deadline, seed_value, args):
+    rng = random.Random(seed_value)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        scenario = SCENARIOS[rng.choices(names, weights)[0]]
+        await scenario(client, rng.choice(users), recorder, rng, args)
+        if args.think_time_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_time_ms))
+
+async def run_load(base_url: str, args) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = await seed(client, args, rng)
+
+        if args.warmup:
+            warmup = Recorder()
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*[
+                virtual_user(client, users, warmup, mix, deadline, args.seed + 1000 + i, args)
+                for i in range(args.concurrency)
+            ])
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            virtual_user(client, users, recorder, mix, deadline, args.seed + i, args)
+            for i in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for label, values in sorted(recorder.samples.items()):
+        values.sort()
+        endpoints[label] = {
+            "count": len(values),
+            "errors": recorder.errors.get(label, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "duration_s": round(elapsed, 2),
+            "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline", "output")},
+        },
+        "total": {"count": total, "throughput_rps": round(total / elapsed, 2)},
+        "endpoints": endpoints,
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(result: dict):
+    header = f"{'endpoint':38} {'count':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, e in result["endpoints"].items():
+        print(f"{label:38} {e['count']:7d} {e['errors']:5d} {e['throughput_rps']:8.2f} "
+              f"{e['p50_ms']:9.1f} {e['p95_ms']:9.1f} {e['p99_ms']:9.1f}")
+    print("-" * len(header))
+    print(f"{'total':38} {result['total']['count']:7d} {'':5} {result['total']['throughput_rps']:8.2f}")
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print the change per endpoint and return regressions beyond ``tolerance``"""
+    regressions = []
+    print(f"\nCompared with baseline {baseline['meta'].get('git_commit')} ({baseline['meta'].get('started_at')}):")
+    for label, current in result["endpoints"].items():
+        previous = baseline["endpoints"].get(label)
+        if not previous:
+            print(f"  {label}: new endpoint")
+            continue
+        changes = []
+        for key, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            if not previous[key]:
+                continue
+            change = (current[key] - previous[key]) / previous[key]
+            changes.append(f"{key} {change:+.1%}")
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse and key != "p99_ms":
+                regressions.append(f"{label} {key}: {previous[key]} -> {current[key]} ({change:+.1%})")
+        print(f"  {label}: " + ", ".join(changes))
+    return regressions
+
+def wait_for(url: str, timeout: float, process: subprocess.Popen):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+def start_stack(args) -> Tuple[str, List[subprocess.Popen]]:
+    """Start fake Gemini and the API as subprocesses against the benchmark database"""
+    gemini_url = f"http://127.0.0.1:{args.gemini_port}"
+    gemini = subprocess.Popen([
+        sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_gemini.py"),
+        "--port", str(args.gemini_port),
+        "--latency-ms", str(args.gemini_latency_ms),
+        "--tokens-per-second", str(args.gemini_tokens_per_second),
+        "--error-rate", str(args.gemini_error_rate),
+        "--seed", str(args.seed),
+    ])
+    processes = [gemini]
+
+    env = {
+        **os.environ,
+        "DB_NAME": os.getenv("BENCH_DB_NAME", "wps_office_bench"),
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "GEMINI_TRANSPORT": "rest",
+        # Budgets are exercised separately; here they would only cap throughput
+        "AI_USER_TOKENS_PER_MINUTE": "100000000",
+        "AI_ACTION_REQUESTS_PER_MINUTE": "1000000",
+    }
+    if args.workers > 1:
+        # The production launcher, with the same worker settings it would use
+        command = [sys.executable, "server.py"]
+        env.update({"HOST": "127.0.0.1", "PORT": str(args.port), "WEB_CONCURRENCY": str(args.workers)})
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+                   "--log-level", "warning"]
+    api = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    processes.append(api)
+
+    wait_for(f"{gemini_url}/stats", 30, gemini)
+    wait_for(f"http://127.0.0.1:{args.port}/health", 60, api)
+    return f"http://127.0.0.1:{args.port}", processes
+
+def main():
+    parser = argparse.ArgumentParser(description="API load benchmark")
+    parser.add_argument("--base-url", help="benchmark an already running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes (more than 1 uses server.py)")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--users", type=int, default=8, help="accounts the virtual users share")
+    parser.add_argument("--documents-per-user", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=30, help="paragraphs per seeded document")
+    parser.add_argument("--autosave-burst", type=int, default=5, help="saves per autosave scenario")
+    parser.add_argument("--autosave-buffered", action="store_true",
+                        help="send the burst as ?autosave=true followed by one explicit save")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="mean pause between actions")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--gemini-port", type=int, default=9100)
+    parser.add_argument("--gemini-latency-ms", type=float, default=400)
+    parser.add_argument("--gemini-tokens-per-second", type=float, default=80)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous results file")
+    parser.add_argument("--save-baseline", help="write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        base_url = args.base_url
+        if not base_url:
+            base_url, processes = start_stack(args)
+        result = asyncio.run(run_load(base_url, args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    print_report(result)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
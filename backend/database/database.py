@@ -1,16 +1,222 @@
 import mysql.connector
-from mysql.connector import Error, pooling
+from mysql.connector import Error, errors, pooling
 import os
+import re
+import sys
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
 import logging
+from services.metrics import REGISTRY, DB_QUERY_DURATION, DB_QUERY_ERRORS, DB_POOL_WAIT, DB_READS
+from services.cache import LRUCache
+from services import tracing
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Comma-separated host[:port] list; same credentials and database as the primary
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_POOL_SIZE = int(os.getenv('DB_REPLICA_POOL_SIZE', 5))
+# Replicas further behind than this stop receiving reads until they catch up
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 2))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))
+# A user's reads go to the primary for this long after they write; keep it above the max lag
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 5))
+
+# Errors after which a replica is taken out of rotation and the read retried on the primary
+REPLICA_UNAVAILABLE_ERRORS = (errors.InterfaceError, errors.OperationalError)
+
+# Who the current request acts for, bound by auth; their recent writes pin reads to the primary
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('db_session', default=None)
+_force_primary: contextvars.ContextVar[bool] = contextvars.ContextVar('db_force_primary', default=False)
+# Per process: with several workers a user's next request may land where their write wasn't seen
+recent_writers = LRUCache("read_your_writes", maxsize=100000, ttl=DB_READ_YOUR_WRITES_SECONDS)
+
+# Strings, quoted names and comments are skipped; parentheses are tracked to find a CTE's main statement
+_SQL_TOKEN = re.compile(
+    r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/|(\()|(\))|([A-Za-z_]+)",
+    re.S
+)
+
+@lru_cache(maxsize=1024)
+def statement_operation(query: str) -> str:
+    """The statement's verb: SELECT for a parenthesized UNION or a WITH ... SELECT"""
+    depth = 0
+    in_with = False
+    for match in _SQL_TOKEN.finditer(query):
+        opening, closing, word = match.groups()
+        if opening:
+            depth += 1
+        elif closing:
+            depth -= 1
+        elif word:
+            word = word.upper()
+            if not in_with:
+                if word != "WITH":
+                    return word
+                in_with = True
+            elif depth == 0 and word in ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "TABLE", "VALUES"):
+                return word
+    return "UNKNOWN"
+
+class Replica:
+    """Connection pool for one read replica and its replication health"""
+
+    def __init__(self, index: int, address: str):
+        host, _, port = address.partition(':')
+        self.name = address
+        self.host = host
+        self.port = port or os.getenv('DB_PORT', '3306')
+        self.pool_name = f"wps_replica_{index}"
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.ejections = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_connection(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=self.pool_name,
+                        pool_size=DB_REPLICA_POOL_SIZE,
+                        host=self.host,
+                        user=os.getenv('DB_USER', 'root'),
+                        password=os.getenv('DB_PASSWORD', ''),
+                        database=os.getenv('DB_NAME', 'wps_office'),
+                        port=self.port,
+                        autocommit=True
+                    )
+        started = time.perf_counter()
+        try:
+            return self._pool.get_connection()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, self.pool_name)
+
+    def eject(self, reason: str):
+        if self.healthy:
+            self.healthy = False
+            self.ejections += 1
+            logger.warning(f"Replica {self.name} removed from rotation: {reason}")
+
+    def readmit(self):
+        if not self.healthy:
+            self.healthy = True
+            logger.info(f"Replica {self.name} back in rotation (lag {self.lag}s)")
+
+    def check_lag(self):
+        """Read replication delay from the replica and eject or readmit it"""
+        connection = None
+        try:
+            connection = self.get_connection()
+            cursor = connection.cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except errors.ProgrammingError:
+                    # MySQL before 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Error as e:
+            self.lag = None
+            self.eject(f"status check failed: {e}")
+            return
+        finally:
+            if connection:
+                connection.close()
+
+        if status is None:
+            # Not configured as a replica (e.g. a proxy in front of one); nothing to measure
+            self.lag = 0.0
+        else:
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+            # NULL means replication is stopped
+            self.lag = float(lag) if lag is not None else None
+        if self.lag is None:
+            self.eject("replication is not running")
+        elif self.lag > DB_REPLICA_MAX_LAG_SECONDS:
+            self.eject(f"lag {self.lag:.0f}s")
+        else:
+            self.readmit()
+
+    def stats(self) -> dict:
+        return {"replica": self.name, "healthy": self.healthy, "lag_seconds": self.lag, "ejections": self.ejections}
+
+class ReplicaUnavailable(Exception):
+    """A replica couldn't serve a read; the caller falls back to the primary"""
+
+def _qualname(code) -> str:
+    """The function's qualified name; before Python 3.11 code objects only have the bare name"""
+    return getattr(code, "co_qualname", code.co_name)
+
+class Transaction:
+    """Statements run on one connection and committed together by Database.transaction()"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor(dictionary=True)
+
+    def execute(self, query, params=None, fetch=False):
+        """Run a statement; rows if fetch=True, otherwise the affected row count"""
+        return self._run(_qualname(sys._getframe(1).f_code), query, params, fetch)
+
+    def execute_single(self, query, params=None):
+        return self._run(_qualname(sys._getframe(1).f_code), query, params, fetch=True, single=True)
+
+    def executemany(self, query, seq_params: Sequence[Sequence[Any]]) -> int:
+        """Run a statement once per parameter set; INSERTs are sent as one multi-row statement"""
+        return self._run_many(_qualname(sys._getframe(1).f_code), query, seq_params)
+
+    def _run_many(self, call_site: str, query, seq_params: Sequence[Sequence[Any]]) -> int:
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(query, seq_params)
+            return self.cursor.rowcount
+        except Error as e:
+            logger.error(f"Error executing batch: {e}")
+            DB_QUERY_ERRORS.inc(call_site)
+            raise
+        finally:
+            Database._observe(call_site, query, started)
+
+    def _run(self, call_site: str, query, params=None, fetch=False, single=False):
+        started = time.perf_counter()
+        try:
+            self.cursor.execute(query, params or ())
+            if single:
+                row = self.cursor.fetchone()
+                # Unread rows would break the next statement on this connection
+                self.cursor.fetchall()
+                return row
+            return self.cursor.fetchall() if fetch else self.cursor.rowcount
+        except Error as e:
+            logger.error(f"Error executing query in transaction: {e}")
+            DB_QUERY_ERRORS.inc(call_site)
+            raise
+        finally:
+            Database._observe(call_site, query, started)
+
 class Database:
     _connection_pool = None
+    _pool_size = 5
+    _in_use = 0
+    _in_use_lock = threading.Lock()
+    _pool_lock = threading.Lock()
+    # Transaction open on this thread; execute_query and friends join it
+    _local = threading.local()
+    _replicas: List[Replica] = [Replica(index, address) for index, address in enumerate(DB_REPLICA_HOSTS)]
+    _next_replica = 0
+    _monitor_stop: Optional[threading.Event] = None
     
     @classmethod
     def initialize_pool(cls):
@@ -18,7 +224,7 @@ class Database:
         try:
             cls._connection_pool = pooling.MySQLConnectionPool(
                 pool_name="wps_pool",
-                pool_size=5,
+                pool_size=cls._pool_size,
                 host=os.getenv('DB_HOST', 'localhost'),
                 user=os.getenv('DB_USER', 'root'),
                 password=os.getenv('DB_PASSWORD', ''),
@@ -33,21 +239,205 @@ class Database:
     
     @classmethod
     def get_connection(cls):
-        """Get connection from pool"""
+        """Get connection from pool, opening it on first use"""
         if cls._connection_pool is None:
-            cls.initialize_pool()
+            with cls._pool_lock:
+                if cls._connection_pool is None:
+                    cls.initialize_pool()
         
+        started = time.perf_counter()
         try:
             connection = cls._connection_pool.get_connection()
             if connection.is_connected():
+                with cls._in_use_lock:
+                    cls._in_use += 1
                 return connection
         except Error as e:
             logger.error(f"Error getting connection from pool: {e}")
             raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_POOL_WAIT.observe(elapsed, "wps_pool")
+            tracing.record("db.pool", started, elapsed)
+
+    @classmethod
+    def _release(cls, connection):
+        with cls._in_use_lock:
+            cls._in_use -= 1
+        connection.close()
+
+    @staticmethod
+    def _call_site() -> str:
+        # Caller of execute_query / execute_single_query, e.g. "DocumentService.get_document"
+        return _qualname(sys._getframe(2).f_code)
+
+    @classmethod
+    @contextmanager
+    def transaction(cls) -> Iterator[Transaction]:
+        """Unit of work: statements inside share one connection and one commit
+
+        execute_query, execute_single_query and executemany called on this
+        thread while the block runs join the transaction, so service methods
+        can be composed. A nested transaction() joins the outer one. Any
+        exception rolls everything back.
+        """
+        current = getattr(cls._local, "transaction", None)
+        if current is not None:
+            yield current
+            return
+
+        connection = cls.get_connection()
+        transaction = Transaction(connection)
+        cls._local.transaction = transaction
+        try:
+            connection.start_transaction()
+            yield transaction
+            connection.commit()
+            cls._note_write()
+        except BaseException:
+            try:
+                connection.rollback()
+            except Error as e:
+                logger.error(f"Error rolling back transaction: {e}")
+            raise
+        finally:
+            cls._local.transaction = None
+            transaction.cursor.close()
+            cls._release(connection)
+
+    @classmethod
+    def executemany(cls, query, seq_params: Sequence[Sequence[Any]]) -> int:
+        """Run a statement for every parameter set with a single commit"""
+        if not seq_params:
+            return 0
+        call_site = cls._call_site()
+        with cls.transaction() as transaction:
+            return transaction._run_many(call_site, query, seq_params)
+
+    @classmethod
+    def execute_statements(cls, statements: Iterable[Tuple[str, Optional[Sequence[Any]]]]) -> List[int]:
+        """Run (query, params) pairs in order in one transaction; returns each row count"""
+        call_site = cls._call_site()
+        with cls.transaction() as transaction:
+            return [transaction._run(call_site, query, params) for query, params in statements]
+
+    @staticmethod
+    def bind_session(key: Optional[str]):
+        """Tie this request's queries to a user for read-your-writes routing"""
+        _session.set(key)
+
+    @staticmethod
+    @contextmanager
+    def primary():
+        """Send reads inside the block to the primary, for lookups that must not be stale"""
+        token = _force_primary.set(True)
+        try:
+            yield
+        finally:
+            _force_primary.reset(token)
+
+    @classmethod
+    def reads_from_primary(cls) -> bool:
+        """Whether a read here goes to the primary, so nothing it returns can be stale"""
+        if not cls._replicas or _force_primary.get() or getattr(cls._local, "transaction", None) is not None:
+            return True
+        session = _session.get()
+        return session is not None and bool(recent_writers.get(session))
+
+    @classmethod
+    def _note_write(cls):
+        session = _session.get()
+        if session is not None and cls._replicas:
+            recent_writers.set(session, True)
+
+    @classmethod
+    def _read_replica(cls, query: str) -> Optional[Replica]:
+        """Replica to send a read to, or None if it belongs on the primary"""
+        if not cls._replicas or _force_primary.get() or cls._operation(query) != "SELECT":
+            return None
+        session = _session.get()
+        if session is not None and recent_writers.get(session):
+            return None
+        healthy = [replica for replica in cls._replicas if replica.healthy]
+        if not healthy:
+            return None
+        # Unlocked round robin; an occasional repeat is harmless
+        cls._next_replica = (cls._next_replica + 1) % len(healthy)
+        return healthy[cls._next_replica]
+
+    @classmethod
+    def _replica_read(cls, replica: Replica, call_site: str, query, params, single: bool):
+        """Run a read on ``replica``; raises ReplicaUnavailable if it should be retried on the primary"""
+        started = time.perf_counter()
+        connection = None
+        cursor = None
+        try:
+            connection = replica.get_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(query, params or ())
+            result = cursor.fetchone() if single else cursor.fetchall()
+            DB_READS.inc(replica.name)
+            return result
+        except errors.PoolError as e:
+            # Busy, not broken: keep it in rotation
+            raise ReplicaUnavailable(str(e)) from e
+        except REPLICA_UNAVAILABLE_ERRORS as e:
+            replica.eject(str(e))
+            raise ReplicaUnavailable(str(e)) from e
+        except Error as e:
+            logger.error(f"Error executing query on replica {replica.name}: {e}")
+            DB_QUERY_ERRORS.inc(call_site)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+            cls._observe(call_site, query, started)
+
+    @classmethod
+    def start_replica_monitor(cls):
+        """Check replica lag in the background every DB_REPLICA_CHECK_INTERVAL seconds"""
+        if not cls._replicas or cls._monitor_stop is not None:
+            return
+        stop = cls._monitor_stop = threading.Event()
+
+        def monitor():
+            while not stop.is_set():
+                for replica in cls._replicas:
+                    replica.check_lag()
+                stop.wait(DB_REPLICA_CHECK_INTERVAL)
+
+        threading.Thread(target=monitor, name="db-replica-monitor", daemon=True).start()
+
+    @classmethod
+    def stop_replica_monitor(cls):
+        if cls._monitor_stop is not None:
+            cls._monitor_stop.set()
+            cls._monitor_stop = None
+
+    @classmethod
+    def replica_stats(cls) -> List[dict]:
+        return [replica.stats() for replica in cls._replicas]
+
+    @staticmethod
+    def _operation(query: str) -> str:
+        return statement_operation(query)
     
     @classmethod
     def execute_query(cls, query, params=None, fetch=False):
         """Execute query and return results if fetch=True"""
+        call_site = cls._call_site()
+        transaction = getattr(cls._local, "transaction", None)
+        if transaction is not None:
+            return transaction._run(call_site, query, params, fetch)
+        replica = cls._read_replica(query) if fetch else None
+        if replica is not None:
+            try:
+                return cls._replica_read(replica, call_site, query, params, single=False)
+            except ReplicaUnavailable:
+                pass
+        started = time.perf_counter()
         connection = None
         cursor = None
         try:
@@ -58,13 +448,17 @@ class Database:
             
             if fetch:
                 result = cursor.fetchall()
+                if cls._replicas:
+                    DB_READS.inc("primary")
                 return result
             else:
                 connection.commit()
+                cls._note_write()
                 return cursor.rowcount
                 
         except Error as e:
             logger.error(f"Error executing query: {e}")
+            DB_QUERY_ERRORS.inc(call_site)
             if connection:
                 connection.rollback()
             raise
@@ -72,11 +466,23 @@ class Database:
             if cursor:
                 cursor.close()
             if connection:
-                connection.close()
+                cls._release(connection)
+            cls._observe(call_site, query, started)
     
     @classmethod
     def execute_single_query(cls, query, params=None):
         """Execute query and return single result"""
+        call_site = cls._call_site()
+        transaction = getattr(cls._local, "transaction", None)
+        if transaction is not None:
+            return transaction._run(call_site, query, params, fetch=True, single=True)
+        replica = cls._read_replica(query)
+        if replica is not None:
+            try:
+                return cls._replica_read(replica, call_site, query, params, single=True)
+            except ReplicaUnavailable:
+                pass
+        started = time.perf_counter()
         connection = None
         cursor = None
         try:
@@ -85,16 +491,47 @@ class Database:
             
             cursor.execute(query, params or ())
             result = cursor.fetchone()
+            if cls._replicas:
+                DB_READS.inc("primary")
             return result
                 
         except Error as e:
             logger.error(f"Error executing single query: {e}")
+            DB_QUERY_ERRORS.inc(call_site)
             raise
         finally:
             if cursor:
                 cursor.close()
             if connection:
-                connection.close()
+                cls._release(connection)
+            cls._observe(call_site, query, started)
+
+    @classmethod
+    def _observe(cls, call_site: str, query: str, started: float):
+        elapsed = time.perf_counter() - started
+        DB_QUERY_DURATION.observe(elapsed, call_site, cls._operation(query))
+        tracing.record_query(call_site, query, started, elapsed)
+
+    @classmethod
+    def pool_stats(cls):
+        return {"size": cls._pool_size, "in_use": cls._in_use}
 
-# Initialize pool when module is imported
-Database.initialize_pool()
\ No newline at end of file
+REGISTRY.register_collector(
+    "db_pool_connections_in_use", "gauge", "Connections currently checked out of the pool",
+    lambda: [("db_pool_connections_in_use", {"pool": "wps_pool"}, Database.pool_stats()["in_use"])]
+)
+REGISTRY.register_collector(
+    "db_pool_connections_max", "gauge", "Configured connection pool size",
+    lambda: [("db_pool_connections_max", {"pool": "wps_pool"}, Database.pool_stats()["size"])]
+)
+REGISTRY.register_collector(
+    "db_replica_lag_seconds", "gauge", "Replication delay at the last check; -1 if replication is stopped or unreachable",
+    lambda: [("db_replica_lag_seconds", {"replica": stats["replica"]},
+              stats["lag_seconds"] if stats["lag_seconds"] is not None else -1)
+             for stats in Database.replica_stats()]
+)
+REGISTRY.register_collector(
+    "db_replica_healthy", "gauge", "1 while the replica receives reads, 0 while ejected",
+    lambda: [("db_replica_healthy", {"replica": stats["replica"]}, int(stats["healthy"]))
+             for stats in Database.replica_stats()]
+)
@@ -1,5 +1,5 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode
 import os
 from dotenv import load_dotenv
 
@@ -66,6 +66,16 @@ def create_database():
                 )
                 """,
                 """
+                CREATE TABLE IF NOT EXISTS document_contents (
+                    hash CHAR(64) PRIMARY KEY,
+                    encoding VARCHAR(16) NOT NULL,
+                    size INT NOT NULL,
+                    body LONGBLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+                """,
+                """
                 CREATE TABLE IF NOT EXISTS document_collaborators (
                     id VARCHAR(36) PRIMARY KEY,
                     document_id VARCHAR(36) NOT NULL,
@@ -106,6 +116,39 @@ def create_database():
                 )
                 """,
                 """
+                CREATE TABLE IF NOT EXISTS ai_jobs (
+                    id VARCHAR(36) PRIMARY KEY,
+                    user_id VARCHAR(36) NOT NULL,
+                    document_id VARCHAR(36) NOT NULL,
+                    ai_action VARCHAR(100) NOT NULL,
+                    status ENUM('queued', 'running', 'succeeded', 'failed') DEFAULT 'queued',
+                    priority INT DEFAULT 0,
+                    attempts INT DEFAULT 0,
+                    max_attempts INT DEFAULT 3,
+                    request_data JSON,
+                    result_data JSON,
+                    history_id VARCHAR(36),
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP NULL,
+                    finished_at TIMESTAMP NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                    INDEX idx_ai_jobs_user (user_id, created_at),
+                    INDEX idx_ai_jobs_status (status)
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS translation_memory (
+                    source_hash CHAR(64) NOT NULL,
+                    target_language VARCHAR(50) NOT NULL,
+                    source_text TEXT NOT NULL,
+                    translated_text TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (source_hash, target_language)
+                )
+                """,
+                """
                 CREATE TABLE IF NOT EXISTS user_settings (
                     user_id VARCHAR(36) PRIMARY KEY,
                     theme VARCHAR(50) DEFAULT 'light',
@@ -122,6 +165,36 @@ def create_database():
             for sql in tables_sql:
                 cursor.execute(sql)
             
+            # Columns added after the tables first shipped
+            columns_sql = [
+                # Set instead of content when the body lives in document_contents
+                "ALTER TABLE documents ADD COLUMN content_hash CHAR(64) NULL AFTER content"
+            ]
+            
+            for sql in columns_sql:
+                try:
+                    cursor.execute(sql)
+                except Error as e:
+                    if e.errno != errorcode.ER_DUP_FIELDNAME:
+                        print(f"Error adding column: {e}")
+            
+            # Indexes added after the tables first shipped; MySQL has no CREATE INDEX IF NOT EXISTS
+            indexes_sql = [
+                # Owned documents, newest first (keyset pagination)
+                "CREATE INDEX idx_documents_user_updated ON documents (user_id, updated_at)",
+                # Documents shared with a user
+                "CREATE INDEX idx_collaborators_user ON document_collaborators (user_id, document_id)",
+                # Content garbage collection
+                "CREATE INDEX idx_documents_content_hash ON documents (content_hash)"
+            ]
+            
+            for sql in indexes_sql:
+                try:
+                    cursor.execute(sql)
+                except Error as e:
+                    if e.errno != errorcode.ER_DUP_KEYNAME:
+                        print(f"Error creating index: {e}")
+            
             # Insert sample data
             sample_data_sql = [
                 """
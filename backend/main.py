@@ -1,41 +1,96 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
+import asyncio
+import math
+import mimetypes
 import uvicorn
 import os
+from typing import List, Optional
 from dotenv import load_dotenv
 
 from database.database import Database
 from database.init import create_database
-from auth.auth import get_current_user
+from auth.auth import get_current_user, create_access_token, decode_access_token
 from models.models import (
     UserCreate, UserLogin, UserResponse, Token,
-    DocumentCreate, DocumentUpdate, DocumentResponse,
-    AIRequest, AIResponse, SearchQuery,
+    DocumentCreate, DocumentUpdate, DocumentResponse, DocumentType, ExportFormat,
+    CollaboratorBase, CollaboratorResponse,
+    UploadCreate, UploadComplete, UploadStatus,
+    AIRequest, AIResponse, AIAction, SearchQuery, PdfPagesResponse,
+    AIJobCreate, AIJobResponse, AIBatchRequest, AIBatchResponse,
+    AggregationQuery, AggregationResponse,
     ChatWithDocumentRequest, ChatWithDocumentResponse, ImproveWritingRequest  # New imports
 )
 from services.user_service import UserService
-from services.document_service import DocumentService
+from services.document_service import DocumentService, DocumentAccessError, DocumentConflictError
 from services.ai_service import AIService
+from services.export_service import ExportService
+from services.spreadsheet_service import SpreadsheetService
+from services.blob_store import BlobStore, UploadNotFoundError, UploadOffsetError, content_disposition
+from services.content_store import ContentStore
+from services.pdf_service import PdfService
+from services.job_service import JobService
+from services.collaboration import CollaborationService
+from services.autosave import AutosaveBuffer
+from services.rate_limiter import RateLimiter, RateLimitExceeded
+from services.admission import AdmissionController
+from services.metrics import REGISTRY, MetricsMiddleware
+from services.tracing import TracingMiddleware, TRACING_ENABLED
 
 load_dotenv()
 
+BLOB_GC_INTERVAL = int(os.getenv('BLOB_GC_INTERVAL', 3600))
+# server.py creates the schema once before forking workers and turns this off
+DB_INIT_ON_STARTUP = os.getenv('DB_INIT_ON_STARTUP', 'true').lower() == 'true'
+# Seconds running AI jobs get to finish on shutdown before they are handed back to the queue
+AI_JOB_DRAIN_SECONDS = float(os.getenv('AI_JOB_DRAIN_SECONDS', 20))
+AI_JOB_MAX_QUEUE = int(os.getenv('AI_JOB_MAX_QUEUE', 500))
+
+async def run_blob_gc():
+    """Periodically remove blobs and offloaded content no document references"""
+    while True:
+        await asyncio.sleep(BLOB_GC_INTERVAL)
+        try:
+            referenced = await run_in_threadpool(DocumentService.get_referenced_file_paths)
+            await run_in_threadpool(blob_store.collect_garbage, referenced)
+        except Exception as e:
+            print(f"Blob garbage collection failed: {e}")
+        try:
+            await run_in_threadpool(ContentStore.collect_garbage)
+        except Exception as e:
+            print(f"Content garbage collection failed: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
-    print("Initializing database...")
-    create_database()
-    print("Database initialized successfully")
+    if DB_INIT_ON_STARTUP:
+        print("Initializing database...")
+        create_database()
+        print("Database initialized successfully")
+    blob_gc_task = asyncio.create_task(run_blob_gc())
+    Database.start_replica_monitor()
+    await job_service.start()
+    await collaboration_service.start()
+    await autosave_buffer.start()
     yield
-    # Shutdown: Clean up resources
+    # Shutdown: new connections are already refused; finish or hand back in-flight work
     print("Shutting down...")
+    blob_gc_task.cancel()
+    await job_service.stop(drain_timeout=AI_JOB_DRAIN_SECONDS)
+    await collaboration_service.stop()
+    await autosave_buffer.stop()
+    Database.stop_replica_monitor()
 
 app = FastAPI(
     title="WPS Office Clone API",
     description="AI-powered office productivity suite backend with Gemini AI",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -45,12 +100,102 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
 
 security = HTTPBearer()
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(DocumentAccessError)
+async def document_access_error_handler(request: Request, exc: DocumentAccessError):
+    return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": str(exc)})
+
+@app.exception_handler(DocumentConflictError)
+async def document_conflict_error_handler(request: Request, exc: DocumentConflictError):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)})
+
 # Initialize services
 ai_service = AIService()
+blob_store = BlobStore()
+pdf_service = PdfService(blob_store)
+rate_limiter = RateLimiter()
+ai_admission = AdmissionController()
+job_service = JobService(ai_service, admission=ai_admission)
+collaboration_service = CollaborationService()
+autosave_buffer = AutosaveBuffer()
+
+REGISTRY.register_collector(
+    "ai_single_flight_calls_total", "counter", "AI requests executed upstream or coalesced onto an in-flight call",
+    lambda: [
+        ("ai_single_flight_calls_total", {"result": "executed"}, ai_service.single_flight.stats()["executed"]),
+        ("ai_single_flight_calls_total", {"result": "coalesced"}, ai_service.single_flight.stats()["coalesced"]),
+    ]
+)
+REGISTRY.register_collector(
+    "ai_admission_slots", "gauge", "AI capacity slots in use and requests waiting for one",
+    lambda: [
+        ("ai_admission_slots", {"state": "active"}, ai_admission.stats()["active"]),
+        ("ai_admission_slots", {"state": "queued"}, ai_admission.stats()["queued"]),
+    ]
+)
+REGISTRY.register_collector(
+    "ai_circuit_open", "gauge", "1 while a Gemini model's circuit breaker is open or half-open",
+    lambda: [
+        ("ai_circuit_open", {"model": model.model_name}, int(model.breaker.state != "closed"))
+        for model in ai_service.loaded_models()
+    ]
+)
+REGISTRY.register_collector(
+    "ai_job_queue_depth", "gauge", "Background AI jobs waiting for a worker",
+    lambda: [("ai_job_queue_depth", {}, job_service.queue_depth)]
+)
+REGISTRY.register_collector(
+    "collab_editors", "gauge", "Open collaboration sessions and connected editors",
+    lambda: [
+        ("collab_editors", {"kind": "sessions"}, collaboration_service.stats()["sessions"]),
+        ("collab_editors", {"kind": "editors"}, collaboration_service.stats()["editors"]),
+    ]
+)
+REGISTRY.register_collector(
+    "collab_ops_total", "counter", "Operations applied by collaboration sessions",
+    lambda: [("collab_ops_total", {}, collaboration_service.ops_applied)]
+)
+REGISTRY.register_collector(
+    "collab_persist_writes_total", "counter", "Database writes of collaboratively edited documents",
+    lambda: [("collab_persist_writes_total", {}, collaboration_service.persist_writes)]
+)
+REGISTRY.register_collector(
+    "autosave_pending_documents", "gauge", "Documents with autosaves not yet written to the database",
+    lambda: [("autosave_pending_documents", {}, autosave_buffer.stats()["pending"])]
+)
+REGISTRY.register_collector(
+    "autosave_operations_total", "counter", "Autosaves acknowledged and database writes they were coalesced into",
+    lambda: [
+        ("autosave_operations_total", {"kind": "saves"}, autosave_buffer.saves),
+        ("autosave_operations_total", {"kind": "writes"}, autosave_buffer.writes),
+        ("autosave_operations_total", {"kind": "conflicts"}, autosave_buffer.write_conflicts),
+    ]
+)
+
+@asynccontextmanager
+async def ai_capacity(user_id: str, requests: List[AIRequest]):
+    """Charge the user's AI budget, then hold a fair share of AI capacity"""
+    try:
+        rate_limiter.check(user_id, requests)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    async with ai_admission.slot(user_id):
+        yield
 
 # Health check
 @app.get("/")
@@ -59,9 +204,391 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "connected", "ai_service": "available" if ai_service.model else "fallback"}
+    ai_health = ai_service.health()
+    return {"status": "healthy", "database": "connected", "db_replicas": Database.replica_stats(),
+            "ai_service": ai_health["status"], "ai": ai_health}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/ai/stats")
+async def get_ai_stats(current_user: UserResponse = Depends(get_current_user)):
+    """Get AI call statistics, including how many requests were coalesced"""
+    return {
+        **ai_service.get_stats(),
+        "admission": ai_admission.stats(),
+        "rate_limited": rate_limiter.rejected,
+        "job_queue_depth": job_service.queue_depth
+    }
+
+# Authentication routes
+@app.post("/api/auth/register", response_model=Token)
+async def register(user: UserCreate):
+    try:
+        new_user = UserService.create_user(user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    access_token = create_access_token(data={"sub": new_user.id})
+    return Token(access_token=access_token, token_type="bearer", user=new_user)
+
+@app.post("/api/auth/login", response_model=Token)
+async def login(login: UserLogin):
+    user = UserService.authenticate_user(login)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password"
+        )
+    
+    access_token = create_access_token(data={"sub": user.id})
+    return Token(access_token=access_token, token_type="bearer", user=user)
+
+@app.get("/api/auth/me", response_model=UserResponse)
+async def get_me(current_user: UserResponse = Depends(get_current_user)):
+    return current_user
+
+# Document routes
+@app.post("/api/documents", response_model=DocumentResponse)
+async def create_document(
+    document: DocumentCreate,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    return DocumentService.create_document(document, current_user.id)
 
-# ... (your existing authentication and document routes remain the same)
+@app.get("/api/documents", response_model=List[DocumentResponse])
+async def get_documents(
+    document_type: Optional[DocumentType] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    include_content: bool = True,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Documents the user owns or has been shared, newest first; X-Next-Cursor fetches the next page"""
+    try:
+        body, next_cursor = DocumentService.get_user_documents_json(
+            current_user.id, document_type, limit, cursor, include_content
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Returned as raw bytes so stored content isn't decoded and re-encoded
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.post("/api/documents/search", response_model=List[DocumentResponse])
+async def search_documents(
+    search: SearchQuery,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    return DocumentService.search_documents(
+        current_user.id, search.query, search.document_type, search.limit, search.offset
+    )
+
+@app.get("/api/documents/{document_id}", response_model=DocumentResponse)
+async def get_document(
+    document_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    document = DocumentService.get_document_json(document_id, current_user.id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return Response(document, media_type="application/json")
+
+@app.put("/api/documents/{document_id}", response_model=DocumentResponse)
+async def update_document(
+    document_id: str,
+    updates: DocumentUpdate,
+    autosave: bool = False,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Save a document; autosaves are journaled and written to the database in batches"""
+    if autosave:
+        document = await autosave_buffer.save(document_id, current_user.id, updates)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return Response(document, media_type="application/json")
+    # An explicit save also writes any autosaves still buffered
+    document = await autosave_buffer.commit(document_id, current_user.id, updates)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(
+    document_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if not DocumentService.delete_document(document_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document deleted successfully"}
+
+# Sharing routes
+@app.get("/api/documents/{document_id}/collaborators", response_model=List[CollaboratorResponse])
+async def get_collaborators(
+    document_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    collaborators = DocumentService.get_collaborators(document_id, current_user.id)
+    if collaborators is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return collaborators
+
+@app.put("/api/documents/{document_id}/collaborators", response_model=CollaboratorResponse)
+async def share_document(
+    document_id: str,
+    collaborator: CollaboratorBase,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Share a document with a user, or change their permission level"""
+    try:
+        shared = DocumentService.share_document(
+            document_id, current_user.id, collaborator.user_id, collaborator.permission_level
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not shared:
+        raise HTTPException(status_code=404, detail="Document not found")
+    collaboration_service.disconnect_user(document_id, collaborator.user_id)
+    return shared
+
+@app.delete("/api/documents/{document_id}/collaborators/{user_id}")
+async def unshare_document(
+    document_id: str,
+    user_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if not DocumentService.unshare_document(document_id, current_user.id, user_id):
+        raise HTTPException(status_code=404, detail="Collaborator not found")
+    collaboration_service.disconnect_user(document_id, user_id)
+    return {"message": "Collaborator removed"}
+
+# Real-time collaboration
+@app.websocket("/ws/documents/{document_id}")
+async def collaborate(websocket: WebSocket, document_id: str, token: str = ""):
+    # Browsers can't set headers on WebSocket requests, so the JWT comes in the query string
+    user_id = decode_access_token(token)
+    access = await run_in_threadpool(DocumentService.get_access_level, document_id, user_id) if user_id else None
+    if access is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await collaboration_service.serve(websocket, document_id, user_id, DocumentService.can_edit(access))
+
+# Document export routes
+@app.get("/api/documents/{document_id}/export/{export_format}")
+async def export_document(
+    document_id: str,
+    export_format: ExportFormat,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Download a document as XLSX, DOCX or PDF"""
+    document = DocumentService.get_document_by_id(document_id, current_user.id)
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    
+    filename = ExportService.export_filename(document, export_format)
+    headers = {"Content-Disposition": content_disposition(filename)}
+    if document.buffered:
+        # Unwritten autosaves share a version with what gets written, so they aren't cached
+        body = await run_in_threadpool(ExportService.export_bytes, document, export_format)
+        return Response(body, media_type=ExportService.MEDIA_TYPES[export_format], headers=headers)
+    
+    # Exports are cached per (document_id, version, format); generation runs off the event loop
+    export_path = await run_in_threadpool(ExportService.export_document, document, export_format)
+    headers["Content-Length"] = str(os.path.getsize(export_path))
+    return StreamingResponse(
+        ExportService.iter_file(export_path),
+        media_type=ExportService.MEDIA_TYPES[export_format],
+        headers=headers
+    )
+
+# Spreadsheet aggregation
+@app.post("/api/documents/{document_id}/aggregate", response_model=AggregationResponse)
+async def aggregate_spreadsheet(
+    document_id: str,
+    query: AggregationQuery,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Filter, group, pivot and sort a sheet's rows on the server"""
+    # Results are cached per (document_id, version, query); computing one runs off the event loop
+    try:
+        body = await run_in_threadpool(SpreadsheetService.aggregate, document_id, current_user.id, query)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return Response(body, media_type="application/json")
+
+# File upload routes
+@app.post("/api/uploads", response_model=UploadStatus)
+async def create_upload(
+    upload: UploadCreate,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Start a resumable file upload"""
+    try:
+        session = await blob_store.create_upload(current_user.id, upload.filename, upload.total_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    return UploadStatus(**session)
+
+@app.get("/api/uploads/{upload_id}", response_model=UploadStatus)
+async def get_upload(
+    upload_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get upload progress so an interrupted upload can resume at the returned offset"""
+    try:
+        session = await blob_store.get_upload(upload_id, current_user.id)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return UploadStatus(**session)
+
+@app.put("/api/uploads/{upload_id}", response_model=UploadStatus)
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Append the raw request body to an upload at the given offset"""
+    try:
+        await blob_store.append_chunk(upload_id, current_user.id, offset, request.stream())
+        session = await blob_store.get_upload(upload_id, current_user.id)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    except UploadOffsetError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.expected_offset)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    return UploadStatus(**session)
+
+@app.post("/api/uploads/{upload_id}/complete", response_model=DocumentResponse)
+async def complete_upload(
+    upload_id: str,
+    completion: UploadComplete,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Store a finished upload and attach it to a new or existing document"""
+    document_type = completion.document_type
+    if completion.document_id:
+        document = DocumentService.get_document_by_id(completion.document_id, current_user.id, include_content=False)
+        if not document:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        if not DocumentService.can_edit(document.access_level):
+            raise DocumentAccessError("You have read-only access to this document")
+        document_type = document.document_type
+    
+    try:
+        blob = await blob_store.complete_upload(upload_id, current_user.id)
+    except UploadNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload incomplete: {e}")
+    
+    # PDFs are extracted once here; pages are then served from the extraction
+    content = None
+    if document_type == DocumentType.PDF:
+        try:
+            content = await run_in_threadpool(pdf_service.document_content, blob["file_path"])
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid PDF: {e}")
+    
+    if not completion.document_id:
+        document = DocumentService.create_document(
+            DocumentCreate(
+                title=completion.title or blob["filename"],
+                document_type=document_type,
+                content=content or ({"pages": []} if document_type == DocumentType.PDF else None)
+            ),
+            current_user.id
+        )
+    
+    return DocumentService.attach_file(
+        document.id, current_user.id, blob["file_path"], blob["file_size"], content=content
+    )
+
+@app.get("/api/documents/{document_id}/file")
+async def download_document_file(
+    document_id: str,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Download the file attached to a document, with HTTP Range support"""
+    document = DocumentService.get_document_by_id(document_id, current_user.id, include_content=False)
+    if not document or not document.file_path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    
+    media_type = mimetypes.guess_type(document.title)[0]
+    if not media_type and document.document_type == DocumentType.PDF:
+        media_type = "application/pdf"
+    filename = os.path.basename(document.title) or "download"
+    try:
+        return blob_store.blob_response(
+            document.file_path,
+            request.headers.get("range"),
+            filename,
+            media_type or "application/octet-stream"
+        )
+    except (OSError, ValueError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+# PDF page routes
+def _get_pdf_file_path(document_id: str, user_id: str) -> str:
+    """Return the blob key of a pdf document the user can access"""
+    document = DocumentService.get_document_by_id(document_id, user_id, include_content=False)
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    if document.document_type != DocumentType.PDF or not document.file_path:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Document has no PDF file")
+    return document.file_path
+
+@app.get("/api/documents/{document_id}/pages", response_model=PdfPagesResponse)
+async def get_pdf_pages(
+    document_id: str,
+    start: int = 1,
+    end: int = 1,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get extracted text and geometry for a page range of a PDF"""
+    file_path = _get_pdf_file_path(document_id, current_user.id)
+    try:
+        meta = await run_in_threadpool(pdf_service.extract, file_path)
+        pages = await run_in_threadpool(pdf_service.get_pages, file_path, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return PdfPagesResponse(document_id=document_id, page_count=meta["page_count"], pages=pages)
+
+@app.get("/api/documents/{document_id}/pages/pdf")
+async def get_pdf_page_file(
+    document_id: str,
+    start: int = 1,
+    end: int = 1,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get a page range as a standalone PDF so viewers can load pages lazily"""
+    file_path = _get_pdf_file_path(document_id, current_user.id)
+    try:
+        pdf_bytes = await run_in_threadpool(pdf_service.render_pages, file_path, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(content=pdf_bytes, media_type="application/pdf")
+
+def _resolve_pdf_text(document_id: str, user_id: str, pages: Optional[str]) -> Optional[str]:
+    """Return extracted text of the requested pages if the document is a PDF"""
+    document = DocumentService.get_document_by_id(document_id, user_id, include_content=False)
+    if not document or document.document_type != DocumentType.PDF or not document.file_path:
+        return None
+    try:
+        return pdf_service.get_text(document.file_path, pages)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 # AI routes
 @app.post("/api/ai/process", response_model=AIResponse)
@@ -69,9 +596,88 @@ async def process_ai_request(
     request: AIRequest,
     current_user: UserResponse = Depends(get_current_user)
 ):
-    result = ai_service.process_ai_request(request, current_user.id)
+    # PDF documents can be processed by page range without sending their text
+    pages = (request.parameters or {}).get("pages")
+    if not request.text_content and pages:
+        request.text_content = await run_in_threadpool(
+            _resolve_pdf_text, request.document_id, current_user.id, str(pages)
+        )
+    
+    # Run off the event loop so concurrent identical requests can be coalesced
+    async with ai_capacity(current_user.id, [request]):
+        result = await run_in_threadpool(ai_service.process_ai_request, request, current_user.id)
     return result
 
+@app.post("/api/ai/batch", response_model=AIBatchResponse)
+async def process_ai_batch(
+    batch: AIBatchRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Process many AI requests in one call; results are returned in request order"""
+    async with ai_capacity(current_user.id, batch.requests):
+        results = await run_in_threadpool(ai_service.process_batch, batch.requests, current_user.id)
+    return AIBatchResponse(results=results)
+
+# Background AI jobs
+AI_JOB_MAX_WAIT = 60
+
+@app.post("/api/ai/jobs", response_model=AIJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_ai_job(
+    job: AIJobCreate,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Queue an AI request and return its job id immediately"""
+    pages = (job.parameters or {}).get("pages")
+    if not job.text_content and pages:
+        job.text_content = await run_in_threadpool(
+            _resolve_pdf_text, job.document_id, current_user.id, str(pages)
+        )
+    
+    if job_service.queue_depth >= AI_JOB_MAX_QUEUE:
+        raise RateLimitExceeded("AI job queue is full", 30)
+    try:
+        rate_limiter.check(current_user.id, [job])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    return await job_service.submit(job, current_user.id)
+
+@app.get("/api/ai/jobs")
+async def list_ai_jobs(
+    limit: int = 20,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    return await run_in_threadpool(job_service.get_user_jobs, current_user.id, limit)
+
+@app.get("/api/ai/jobs/{job_id}", response_model=AIJobResponse)
+async def get_ai_job(
+    job_id: str,
+    wait: float = 0,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get job status; with ``wait`` > 0, long-poll up to that many seconds for completion"""
+    if wait > 0:
+        job = await job_service.wait_for(job_id, current_user.id, min(wait, AI_JOB_MAX_WAIT))
+    else:
+        job = await run_in_threadpool(job_service.get_job, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@app.get("/api/ai/jobs/{job_id}/events")
+async def stream_ai_job_events(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Stream job status changes as server-sent events until the job finishes"""
+    async def event_stream():
+        async for job in job_service.subscribe(job_id, current_user.id, AI_JOB_MAX_WAIT):
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+            yield f"event: {job.status.value}\ndata: {job.model_dump_json()}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/api/ai/history")
 async def get_ai_history(
     limit: int = 10,
@@ -91,14 +697,30 @@ async def chat_with_document(
     document_content = request.document_content
     if not document_content and request.document_id != "chat":
         document = DocumentService.get_document_by_id(request.document_id, current_user.id)
-        if document and document.content:
+        if document and document.document_type == DocumentType.PDF and document.file_path:
+            # Only the extracted text of the requested pages goes into the prompt
+            try:
+                document_content = await run_in_threadpool(
+                    pdf_service.get_text, document.file_path, request.pages
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        elif document and document.content:
             # Convert document content to string for AI processing
             document_content = str(document.content)
     
     if not document_content:
         raise HTTPException(status_code=400, detail="No document content provided")
     
-    result = ai_service.chat_with_document(document_content, request.question, current_user.id)
+    estimate_request = AIRequest(
+        action=AIAction.GENERATE_CONTENT,
+        document_id=request.document_id,
+        text_content=f"{document_content}\n{request.question}"
+    )
+    async with ai_capacity(current_user.id, [estimate_request]):
+        result = await run_in_threadpool(
+            ai_service.chat_with_document, document_content, request.question, current_user.id
+        )
     return ChatWithDocumentResponse(**result)
 
 @app.post("/api/ai/improve-writing")
@@ -114,7 +736,8 @@ async def improve_writing(
         text_content=request.text
     )
     
-    result = ai_service.process_ai_request(ai_request, current_user.id)
+    async with ai_capacity(current_user.id, [ai_request]):
+        result = await run_in_threadpool(ai_service.process_ai_request, ai_request, current_user.id)
     return result
 
 # User settings routes
@@ -131,6 +754,7 @@ async def update_user_settings(
     updated_settings = UserService.update_user_settings(current_user.id, settings)
     return updated_settings
 
+# Development server; production runs server.py
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
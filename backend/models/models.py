@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, PrivateAttr
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -21,6 +21,12 @@ class AIAction(str, Enum):
     ANALYZE_DATA = "analyze_data"
     FORMAT = "format"
     GENERATE_CONTENT = "generate_content"
+    IMPROVE_WRITING = "improve_writing"
+
+class ExportFormat(str, Enum):
+    XLSX = "xlsx"
+    DOCX = "docx"
+    PDF = "pdf"
 
 # User Models
 class UserBase(BaseModel):
@@ -64,10 +70,34 @@ class DocumentResponse(DocumentBase):
     version: int
     created_at: datetime
     updated_at: datetime
+    # 'owner' or the collaborator permission level of the requesting user
+    access_level: Optional[str] = None
+    _buffered: bool = PrivateAttr(default=False)
 
     class Config:
         from_attributes = True
 
+    @property
+    def buffered(self) -> bool:
+        """Whether unwritten autosaves are shown; the version isn't final then, so nothing caches by it"""
+        return self._buffered
+
+# Upload Models
+class UploadCreate(BaseModel):
+    filename: str
+    total_size: Optional[int] = None
+
+class UploadComplete(BaseModel):
+    document_id: Optional[str] = None
+    title: Optional[str] = None
+    document_type: DocumentType = DocumentType.PDF
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    total_size: Optional[int] = None
+    offset: int
+
 # Collaboration Models
 class CollaboratorBase(BaseModel):
     user_id: str
@@ -92,6 +122,9 @@ class AIRequest(BaseModel):
     parameters: Optional[Dict[str, Any]] = None
     text_content: Optional[str] = None
 
+class AIBatchRequest(BaseModel):
+    requests: List[AIRequest] = Field(..., min_length=1, max_length=100)
+
 class AIResponse(BaseModel):
     id: str
     action: AIAction
@@ -103,6 +136,115 @@ class AIResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class AIBatchResponse(BaseModel):
+    results: List[AIResponse]
+
+class ChatWithDocumentRequest(BaseModel):
+    document_id: str
+    question: str
+    document_content: Optional[str] = None
+    pages: Optional[str] = None
+
+class ChatWithDocumentResponse(BaseModel):
+    answer: str
+    question: Optional[str] = None
+    type: str
+
+class ImproveWritingRequest(BaseModel):
+    text: str
+    improvement_type: str = "clarity"
+
+# PDF Models
+class PdfPage(BaseModel):
+    number: int
+    width: float
+    height: float
+    rotation: int = 0
+    char_count: int
+    text: str
+
+class PdfPagesResponse(BaseModel):
+    document_id: str
+    page_count: int
+    pages: List[PdfPage]
+
+# Spreadsheet Aggregation Models
+class AggregateFunction(str, Enum):
+    COUNT = "count"
+    SUM = "sum"
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
+
+class FilterOperator(str, Enum):
+    EQ = "eq"
+    NE = "ne"
+    LT = "lt"
+    LE = "le"
+    GT = "gt"
+    GE = "ge"
+    IN = "in"
+    CONTAINS = "contains"
+
+class AggregationMeasure(BaseModel):
+    function: AggregateFunction = AggregateFunction.COUNT
+    # Columns are header names or letters; count without a column counts rows
+    column: Optional[str] = None
+    alias: Optional[str] = None
+
+class AggregationFilter(BaseModel):
+    column: str
+    op: FilterOperator = FilterOperator.EQ
+    value: Any = None
+
+class AggregationSort(BaseModel):
+    # A group_by column or an output column name
+    by: str
+    descending: bool = False
+
+class AggregationQuery(BaseModel):
+    sheet: Optional[str] = None
+    # A1-style, e.g. "A1:F50000" or "A:F"; the whole sheet by default
+    range: Optional[str] = None
+    header: bool = True
+    group_by: List[str] = Field(default_factory=list, max_length=8)
+    pivot: Optional[str] = None
+    measures: List[AggregationMeasure] = Field(default_factory=lambda: [AggregationMeasure()], min_length=1, max_length=20)
+    filters: List[AggregationFilter] = Field(default_factory=list, max_length=20)
+    sort: List[AggregationSort] = Field(default_factory=list, max_length=8)
+    limit: int = Field(1000, ge=1, le=10000)
+
+class AggregationResponse(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+    total_groups: int
+    matched_rows: int
+    source_rows: int
+    version: int
+
+# AI Job Models
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class AIJobCreate(AIRequest):
+    # Clients may only defer their own background work; nobody can jump ahead of the default
+    priority: int = Field(0, ge=-10, le=0)
+
+class AIJobResponse(BaseModel):
+    id: str
+    action: AIAction
+    status: JobStatus
+    priority: int
+    attempts: int
+    result: Optional[AIResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # Authentication Models
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,124 @@
+"""Production entry point: a pre-forked pool of uvicorn workers under gunicorn
+
+    python server.py
+
+Settings (environment):
+    HOST, PORT              bind address (default 0.0.0.0:8000)
+    WEB_CONCURRENCY         worker processes (default: CPU count)
+    MAX_REQUESTS            recycle a worker after this many requests, 0 to never (default 10000)
+    MAX_REQUESTS_JITTER     random extra requests so workers don't all recycle at once (default 1000)
+    GRACEFUL_TIMEOUT        seconds a stopping worker gets to finish requests and its
+                            lifespan shutdown before it is killed (default 30)
+    WORKER_TIMEOUT          seconds without a heartbeat before a worker is restarted (default 60)
+    KEEPALIVE               seconds to hold idle keep-alive connections (default 5)
+
+Workers run uvloop and httptools when they are installed (uvicorn's "auto"),
+falling back to asyncio and h11. The app is imported in each worker, not in
+the master, so every worker opens its own database pool; size MySQL's
+max_connections for WEB_CONCURRENCY times the pool size.
+
+State kept in process memory is per worker: caches, rate limits, the
+read-your-writes window, buffered autosaves and live collaboration sessions.
+All editors of a document must reach the same process, so route /ws/ to an
+instance running WEB_CONCURRENCY=1 when several workers serve the rest of
+the API. Buffered autosaves are only written over the version they started
+from; if a save through another worker got there first, they are dropped and
+the next autosave of that document gets 409, so keep a client's saves on one
+worker (sticky sessions) where possible.
+
+Where gunicorn isn't available (Windows) this falls back to uvicorn's own
+multi-process mode, which doesn't replace workers, so recycling is off.
+"""
+import os
+import logging
+import importlib.util
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("server")
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 8000))
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+MAX_REQUESTS = int(os.getenv('MAX_REQUESTS', 10000))
+MAX_REQUESTS_JITTER = int(os.getenv('MAX_REQUESTS_JITTER', 1000))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+WORKER_TIMEOUT = int(os.getenv('WORKER_TIMEOUT', 60))
+KEEPALIVE = int(os.getenv('KEEPALIVE', 5))
+
+def event_loop_name() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def http_protocol_name() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+def init_schema_once():
+    """Create tables in the master so workers don't race each other through the DDL"""
+    from database.init import create_database
+    create_database()
+    # Inherited by every worker forked after this
+    os.environ['DB_INIT_ON_STARTUP'] = 'false'
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER if MAX_REQUESTS else 0,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": WORKER_TIMEOUT,
+        "keepalive": KEEPALIVE,
+        # Importing the app in the master would share its pool sockets with every fork
+        "preload_app": False,
+        "accesslog": None,
+        "on_starting": lambda arbiter: init_schema_once(),
+    }
+
+def run_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Server(gunicorn_options()).run()
+
+def run_uvicorn():
+    init_schema_once()
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=KEEPALIVE,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        # A single worker is never replaced either, so recycling would just stop the server
+        limit_max_requests=None
+    )
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Starting {WEB_CONCURRENCY} workers on {HOST}:{PORT} "
+                f"({event_loop_name()}, {http_protocol_name()})")
+    if importlib.util.find_spec("gunicorn"):
+        run_gunicorn()
+    else:
+        logger.warning("gunicorn is not installed; workers will not be recycled")
+        run_uvicorn()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from services.rate_limiter import RateLimitExceeded
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AI_MAX_CONCURRENT = int(os.getenv('AI_MAX_CONCURRENT', 8))
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', 64))
+
+class AdmissionController:
+    """Bounds concurrent AI work, sheds load when the wait queue is full, and
+    hands free slots to waiting users round-robin so one user's burst cannot
+    starve everyone else.
+    """
+
+    def __init__(self, max_concurrent: int = AI_MAX_CONCURRENT, max_queue: int = AI_MAX_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.shed = 0
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        # Smoothed slot hold time, used for Retry-After estimates
+        self._avg_hold = 1.0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, shed: bool = True):
+        """Hold one unit of AI capacity; raises RateLimitExceeded if shedding and saturated"""
+        await self._acquire(user_id, shed)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "shed": self.shed,
+        }
+
+    async def _acquire(self, user_id: str, shed: bool):
+        if self.active < self.max_concurrent and not self._queued:
+            self.active += 1
+            return
+
+        if shed and self._queued >= self.max_queue:
+            self.shed += 1
+            retry_after = self._avg_hold * (self._queued + 1) / self.max_concurrent
+            raise RateLimitExceeded("AI service is at capacity", max(retry_after, 1.0))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just as we were cancelled; pass it on
+                self._release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            raise
+
+    def _release(self):
+        # Grant the slot to the next user in rotation rather than the oldest waiter overall
+        while self._waiting:
+            user_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove_waiter(self, user_id: str, waiter: asyncio.Future):
+        waiters = self._waiting.get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._waiting[user_id]
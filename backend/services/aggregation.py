@@ -0,0 +1,328 @@
+import operator
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from models.models import AggregateFunction, AggregationQuery, FilterOperator
+from services.formulas import REFERENCE_PATTERN, CellError, Sheet, column_index, display_value, parse_number, parse_reference, to_text
+
+# Group-by and pivot over a sheet's evaluated values. Each column is factorized
+# once per workbook version: every row gets the position of its value among the
+# column's distinct values, in spreadsheet sort order. Queries then only combine
+# integer codes and reduce with np.bincount / ufunc.at, with no Python per row.
+
+# Distinct pivot values, and so output column groups, a query may produce
+MAX_PIVOT_VALUES = 200
+# Factorized columns kept per workbook version
+MAX_CACHED_COLUMNS = 64
+
+LETTERS_PATTERN = re.compile(r"[A-Za-z]{1,3}$")
+
+COMPARISONS = {
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LE: operator.le,
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GE: operator.ge,
+}
+
+class Column:
+    """One column of the queried rows, factorized on first use"""
+
+    def __init__(self, values: np.ndarray, numbers: np.ndarray):
+        self.values = values
+        self.numbers = numbers
+        self._factorized: Optional[Tuple[np.ndarray, list]] = None
+
+    def factorize(self) -> Tuple[np.ndarray, list]:
+        """(codes, uniques): each row's index into the column's distinct values, sorted as Excel sorts"""
+        if self._factorized is None:
+            if not np.isnan(self.numbers).any():
+                uniques, codes = np.unique(self.numbers, return_inverse=True)
+                self._factorized = (codes.astype(np.int64), uniques.tolist())
+            else:
+                # Keyed by type too: True == 1.0 and an error equals its text, but they are different values
+                positions: Dict[Tuple[type, Any], int] = {}
+                raw = np.fromiter(
+                    (positions.setdefault((value.__class__, value), len(positions)) for value in self.values.tolist()),
+                    dtype=np.int64, count=len(self.values)
+                )
+                keys = [value for _, value in positions]
+                sort_keys = [_sort_key(key) for key in keys]
+                order = sorted(range(len(keys)), key=sort_keys.__getitem__)
+                # Text differing only in case is one group, as in Excel pivots
+                rank = np.empty(len(keys), dtype=np.int64)
+                uniques, previous = [], None
+                for index in order:
+                    if not uniques or sort_keys[index] != previous:
+                        uniques.append(keys[index])
+                        previous = sort_keys[index]
+                    rank[index] = len(uniques) - 1
+                self._factorized = (rank[raw], uniques)
+        return self._factorized
+
+    def matching(self, predicate: Callable[[Any], bool]) -> np.ndarray:
+        """Rows whose value passes the predicate, testing each distinct value once"""
+        codes, uniques = self.factorize()
+        table = np.fromiter((bool(predicate(value)) for value in uniques), dtype=bool, count=len(uniques))
+        return table[codes]
+
+    def filled(self) -> np.ndarray:
+        return ~np.equal(self.values, None)
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Numbers < text < booleans < errors, blanks last
+    if value is None:
+        return (4, 0)
+    if isinstance(value, CellError):
+        return (3, str(value))
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, str):
+        return (1, value.lower())
+    return (0, value)
+
+def _label(value: Any) -> str:
+    return str(value) if isinstance(value, CellError) else to_text(value)
+
+def _bounds(sheet: Sheet, reference: Optional[str]) -> Tuple[int, int, int, int]:
+    """(r0, c0, r1, c1) of the queried range, zero-based and inclusive"""
+    if not reference:
+        rows, columns = sheet.shape
+        return 0, 0, rows - 1, columns - 1
+    reference = reference.strip()
+    match = REFERENCE_PATTERN.match(reference)
+    if match is None:
+        raise ValueError(f"Invalid range '{reference}'")
+    _, digits0, letters1, digits1 = match.groups()
+    if (not digits0) if letters1 is None else bool(digits0) != bool(digits1):
+        raise ValueError(f"Invalid range '{reference}'")
+    node = parse_reference(reference, sheet.name)
+    if node[0] == "lit":
+        raise ValueError(f"Range '{reference}' is outside the sheet")
+    if node[0] == "ref":
+        return node[2], node[3], node[2], node[3]
+    return node[2:]
+
+def _filter_mask(column: Column, op: FilterOperator, value: Any) -> np.ndarray:
+    if op == FilterOperator.CONTAINS:
+        needle = _label(value).lower()
+        return column.matching(lambda cell: isinstance(cell, str) and needle in cell.lower())
+
+    if op in COMPARISONS:
+        compare = COMPARISONS[op]
+        if isinstance(value, str) and parse_number(value) is None:
+            text = value.lower()
+            return column.matching(lambda cell: isinstance(cell, str) and compare(cell.lower(), text))
+        if isinstance(value, bool) or value is None:
+            raise ValueError(f"'{op.value}' filters need a number or text")
+        with np.errstate(invalid="ignore"):
+            return compare(column.numbers, float(value))
+
+    if op == FilterOperator.IN:
+        if not isinstance(value, list):
+            raise ValueError("'in' filters need a list of values")
+        targets = value
+    else:
+        targets = [value]
+    numbers, texts, flags, blank = [], set(), set(), False
+    for target in targets:
+        if isinstance(target, str):
+            number = parse_number(target)
+            if target == "":
+                blank = True
+            elif number is None:
+                texts.add(target.lower())
+            else:
+                numbers.append(number)
+        elif target is None:
+            blank = True
+        elif isinstance(target, bool):
+            flags.add(target)
+        elif isinstance(target, (int, float)):
+            numbers.append(float(target))
+        else:
+            raise ValueError(f"Can't filter on {target!r}")
+
+    mask = np.isin(column.numbers, numbers) if numbers else np.zeros(len(column.numbers), dtype=bool)
+    if texts or flags or blank:
+        def wanted(cell: Any) -> bool:
+            if cell is None:
+                return blank
+            if isinstance(cell, bool):
+                return cell in flags
+            return isinstance(cell, str) and cell.lower() in texts
+        mask |= column.matching(wanted)
+    return ~mask if op == FilterOperator.NE else mask
+
+def _combine(codes: List[np.ndarray], sizes: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """(group of each row, a row from each group) for rows keyed by several factorized columns
+
+    Groups are numbered in key order, so they come out sorted by the first key, then the next.
+    """
+    combined = np.zeros(len(codes[0]), dtype=np.int64)
+    span = 1
+    for array, size in zip(codes, sizes):
+        size = max(size, 1)
+        if span * size >= 2 ** 62:
+            # Renumber the groups seen so far before the composite code overflows
+            _, combined = np.unique(combined, return_inverse=True)
+            span = int(combined.max()) + 1 if len(combined) else 1
+        combined = combined * size + array
+        span *= size
+    if span <= 4 * len(combined) + 1024:
+        # Few enough possible keys to renumber with a lookup table instead of sorting
+        present = np.zeros(span, dtype=bool)
+        present[combined] = True
+        renumber = np.cumsum(present) - 1
+        row_of_key = np.empty(span, dtype=np.int64)
+        row_of_key[combined] = np.arange(len(combined))
+        return renumber[combined], row_of_key[present]
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    return inverse.reshape(-1), first
+
+def _measure(function: AggregateFunction, column: Optional[Column], mask: Optional[np.ndarray],
+             inverse: np.ndarray, groups: int) -> np.ndarray:
+    """One value per group, NaN where a group has nothing to aggregate"""
+    if function == AggregateFunction.COUNT:
+        weights = None
+        if column is not None:
+            filled = column.filled()
+            weights = filled if mask is None else filled[mask]
+        return np.bincount(inverse, weights=weights, minlength=groups).astype(np.float64)
+
+    numbers = column.numbers if mask is None else column.numbers[mask]
+    present = ~np.isnan(numbers)
+    if function in (AggregateFunction.SUM, AggregateFunction.AVG):
+        totals = np.bincount(inverse, weights=np.where(present, numbers, 0.0), minlength=groups)
+        if function == AggregateFunction.SUM:
+            return totals
+        counts = np.bincount(inverse, weights=present, minlength=groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, totals / counts, np.nan)
+
+    reduce, start = (np.minimum, np.inf) if function == AggregateFunction.MIN else (np.maximum, -np.inf)
+    result = np.full(groups, start)
+    reduce.at(result, inverse[present], numbers[present])
+    result[np.isinf(result)] = np.nan
+    return result
+
+def aggregate(sheet: Sheet, query: AggregationQuery, columns: Dict[tuple, Column]) -> Dict[str, Any]:
+    """Filter, group, pivot and sort a sheet's rows; ``columns`` keeps factorized columns between queries"""
+    r0, c0, r1, c1 = _bounds(sheet, query.range)
+    headers = [_label(sheet.get(r0, column)) for column in range(c0, c1 + 1)] if query.header else []
+    end = min(r1 + 1, sheet.shape[0])
+    start = min(r0 + 1 if query.header else r0, end)
+    source_rows = end - start
+
+    lowered = [header.lower() for header in headers]
+
+    def resolve(name: str) -> int:
+        if name in headers:
+            return c0 + headers.index(name)
+        if name.lower() in lowered:
+            return c0 + lowered.index(name.lower())
+        if LETTERS_PATTERN.match(name) and c0 <= column_index(name) <= c1:
+            return column_index(name)
+        raise ValueError(f"Unknown column '{name}'")
+
+    def column(name: str) -> Column:
+        index = resolve(name)
+        key = (sheet.name, start, end, index)
+        if key not in columns:
+            if len(columns) >= MAX_CACHED_COLUMNS:
+                columns.clear()
+            if index < sheet.shape[1]:
+                columns[key] = Column(sheet.values[start:end, index], sheet.numbers[start:end, index])
+            else:
+                columns[key] = Column(np.full(source_rows, None, dtype=object), np.full(source_rows, np.nan))
+        return columns[key]
+
+    mask = None
+    for condition in query.filters:
+        selected = _filter_mask(column(condition.column), condition.op, condition.value)
+        mask = selected if mask is None else mask & selected
+    matched_rows = source_rows if mask is None else int(np.count_nonzero(mask))
+
+    keys = query.group_by + ([query.pivot] if query.pivot else [])
+    factorized = [column(name).factorize() for name in keys]
+    if keys:
+        codes = [key_codes if mask is None else key_codes[mask] for key_codes, _ in factorized]
+        inverse, first = _combine(codes, [len(uniques) for _, uniques in factorized])
+        group_codes = [array[first] for array in codes]
+        groups = len(first)
+    else:
+        # One row of totals over everything matched
+        inverse, group_codes, groups = np.zeros(matched_rows, dtype=np.int64), [], 1
+
+    measures = []
+    for measure in query.measures:
+        if measure.function != AggregateFunction.COUNT and not measure.column:
+            raise ValueError(f"'{measure.function.value}' needs a column")
+        label = measure.alias or (
+            f"{measure.function.value}({measure.column})" if measure.column else measure.function.value
+        )
+        source = column(measure.column) if measure.column else None
+        values = _measure(measure.function, source, mask, inverse, groups)
+        measures.append((label, measure.function, values))
+
+    # Output columns as (name, sort key per row, cells per row from a selection of rows)
+    output: List[Tuple[str, np.ndarray, Callable[[np.ndarray], list]]] = []
+
+    def key_column(name: str, row_codes: np.ndarray, uniques: list):
+        render = lambda order: [display_value(uniques[code]) for code in row_codes[order].tolist()]
+        output.append((name, row_codes.astype(np.float64), render))
+
+    def measure_column(name: str, values: np.ndarray):
+        render = lambda order: [display_value(value) if value == value else None for value in values[order].tolist()]
+        output.append((name, values, render))
+
+    group_by = len(query.group_by)
+    if query.pivot:
+        if group_by:
+            row_of_group, first_group = _combine(group_codes[:group_by], [len(u) for _, u in factorized[:group_by]])
+            rows = len(first_group)
+        else:
+            row_of_group, first_group, rows = np.zeros(groups, dtype=np.int64), np.zeros(0, dtype=np.int64), int(groups > 0)
+        pivot_codes, column_of_group = np.unique(group_codes[group_by], return_inverse=True)
+        column_of_group = column_of_group.reshape(-1)
+        if len(pivot_codes) > MAX_PIVOT_VALUES:
+            raise ValueError(f"'{query.pivot}' has {len(pivot_codes)} distinct values; pivots allow {MAX_PIVOT_VALUES}")
+        for name, codes_of_group, (_, uniques) in zip(query.group_by, group_codes, factorized):
+            key_column(name, codes_of_group[first_group], uniques)
+        # Spread each measure into a rows x pivot values grid
+        matrices = []
+        for label, function, values in measures:
+            matrix = np.full((rows, len(pivot_codes)), 0.0 if function == AggregateFunction.COUNT else np.nan)
+            matrix[row_of_group, column_of_group] = values
+            matrices.append((label, matrix))
+        pivot_uniques = factorized[group_by][1]
+        for position, pivot_code in enumerate(pivot_codes.tolist()):
+            heading = _label(pivot_uniques[pivot_code]) or "(blank)"
+            for label, matrix in matrices:
+                measure_column(heading if len(matrices) == 1 else f"{heading} {label}", matrix[:, position])
+    else:
+        rows = groups
+        for name, codes_of_group, (_, uniques) in zip(query.group_by, group_codes, factorized):
+            key_column(name, codes_of_group, uniques)
+        for label, _, values in measures:
+            measure_column(label, values)
+
+    names = [name for name, _, _ in output]
+    sort_keys = []
+    for spec in reversed(query.sort):
+        if spec.by not in names:
+            raise ValueError(f"Can't sort by '{spec.by}'; it isn't an output column")
+        values = output[names.index(spec.by)][1]
+        values = -values if spec.descending else values
+        # Empty groups sort last either way
+        sort_keys.append(np.where(np.isnan(values), np.inf, values))
+    order = np.lexsort(sort_keys) if sort_keys else np.arange(rows)
+    order = order[:query.limit]
+
+    cells = [render(order) for _, _, render in output]
+    return {
+        "columns": names,
+        "rows": [list(row) for row in zip(*cells)] if cells else [],
+        "total_groups": rows,
+        "matched_rows": matched_rows,
+        "source_rows": source_rows,
+    }
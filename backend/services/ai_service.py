@@ -1,45 +1,101 @@
 import uuid
 import time
-import google.generativeai as genai
-from typing import Dict, Any, Optional
+import json
+import re
+import difflib
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from database.database import Database
 from models.models import AIRequest, AIResponse, AIAction
+from services.single_flight import SingleFlight
+from services.cache import LRUCache
+from services.text_segmentation import Segment, split_paragraphs, split_sentences, reassemble
+from services.translation_memory import TranslationMemory
+from services.spreadsheet_service import SpreadsheetService
+from services.metrics import AI_REQUESTS
+from services import tracing
+from services.model_router import (
+    ModelClient, ModelRouter, GEMINI_FAST_MODEL, GEMINI_LARGE_MODEL,
+    GEMINI_FAST_INPUT_COST, GEMINI_FAST_OUTPUT_COST, GEMINI_LARGE_INPUT_COST, GEMINI_LARGE_OUTPUT_COST
+)
 import os
 from dotenv import load_dotenv
+from mysql.connector import Error
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+AI_BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', 4))
+AI_BATCH_PACK_MAX_ITEMS = int(os.getenv('AI_BATCH_PACK_MAX_ITEMS', 20))
+AI_BATCH_PACK_MAX_CHARS = int(os.getenv('AI_BATCH_PACK_MAX_CHARS', 8000))
+GRAMMAR_CACHE_SIZE = int(os.getenv('GRAMMAR_CACHE_SIZE', 20000))
+# Point the client at another Gemini-compatible server, e.g. the benchmark stand-in
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT')
+# Threads making Gemini calls; bounds calls still running after their caller timed out
+AI_UPSTREAM_MAX_WORKERS = int(os.getenv('AI_UPSTREAM_MAX_WORKERS', 32))
+
+ITEM_MARKER = "<<<ITEM {}>>>"
+ITEM_MARKER_PATTERN = re.compile(r"<<<ITEM (\d+)>>>[ \t]*\n?")
+
 class AIService:
     def __init__(self):
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
-        if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-            # Initialize Gemini model
-            self.model = genai.GenerativeModel('gemini-pro')
-        else:
-            self.model = None
+        # The Gemini SDK is imported and the models built on the first AI call
+        self.enabled = bool(self.gemini_api_key)
+        self._router: Optional[ModelRouter] = None
+        self._router_lock = threading.Lock()
+        if not self.enabled:
             print("Warning: GEMINI_API_KEY not found. AI features will use fallback methods.")
+        
+        # Identical requests in flight at the same time share one upstream call
+        self.single_flight = SingleFlight()
+        # Corrected text per segment hash, shared across requests and users
+        self.grammar_cache = LRUCache("grammar_segments", maxsize=GRAMMAR_CACHE_SIZE)
+        self.translation_memory = TranslationMemory()
+    
+    @property
+    def router(self) -> Optional[ModelRouter]:
+        if not self.enabled:
+            return None
+        if self._router is None:
+            with self._router_lock:
+                if self._router is None:
+                    self._router = self._build_router()
+        return self._router
+    
+    def loaded_models(self) -> List[ModelClient]:
+        """Models built so far; reporting shouldn't be what loads the SDK"""
+        return self._router.models if self._router else []
+    
+    def _build_router(self) -> ModelRouter:
+        import google.generativeai as genai
+        genai.configure(
+            api_key=self.gemini_api_key,
+            transport=GEMINI_TRANSPORT,
+            client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+        )
+        # A fast model for short, simple tasks and a larger default
+        return ModelRouter(
+            fast=ModelClient("fast", GEMINI_FAST_MODEL, genai.GenerativeModel(GEMINI_FAST_MODEL),
+                             GEMINI_FAST_INPUT_COST, GEMINI_FAST_OUTPUT_COST),
+            large=ModelClient("large", GEMINI_LARGE_MODEL, genai.GenerativeModel(GEMINI_LARGE_MODEL),
+                              GEMINI_LARGE_INPUT_COST, GEMINI_LARGE_OUTPUT_COST),
+            executor=ThreadPoolExecutor(max_workers=AI_UPSTREAM_MAX_WORKERS, thread_name_prefix="gemini")
+        )
     
     def process_ai_request(self, request: AIRequest, user_id: str) -> AIResponse:
         """Process AI request using Gemini API"""
         start_time = time.time()
         
         try:
-            if request.action == AIAction.SUMMARIZE:
-                output = self._summarize_text(request.text_content or "")
-            elif request.action == AIAction.GRAMMAR_CHECK:
-                output = self._check_grammar(request.text_content or "")
-            elif request.action == AIAction.TRANSLATE:
-                output = self._translate_text(request.text_content or "", request.parameters or {})
-            elif request.action == AIAction.ANALYZE_DATA:
-                output = self._analyze_data(request.parameters or {})
-            elif request.action == AIAction.FORMAT:
-                output = self._format_content(request.text_content or "", request.parameters or {})
-            elif request.action == AIAction.GENERATE_CONTENT:
-                output = self._generate_content(request.parameters or {})
-            else:
-                output = {"error": "Unsupported AI action"}
+            output, _ = self.single_flight.do(self._request_key(request), self._dispatch, request)
+            AI_REQUESTS.inc(request.action.value, self._outcome(output))
             
             processing_time = int((time.time() - start_time) * 1000)
             
@@ -61,6 +117,7 @@ class AIService:
             )
             
         except Exception as e:
+            AI_REQUESTS.inc(request.action.value, "error")
             processing_time = int((time.time() - start_time) * 1000)
             output = {"error": str(e)}
             
@@ -80,15 +137,223 @@ class AIService:
                 created_at=datetime.now()
             )
     
+    def process_batch(self, requests: List[AIRequest], user_id: str) -> List[AIResponse]:
+        """Process many AI requests, packing compatible items into shared prompts"""
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        timings = [0] * len(requests)
+        # Grammar checks and translations go through the segment cache and translation
+        # memory as in the single-request path; the segments those lack share prompts
+        handlers = {
+            AIAction.GRAMMAR_CHECK: self._check_grammar_many,
+            AIAction.TRANSLATE: self._translate_many,
+        }
+        groups: Dict[AIAction, List[int]] = {}
+        for index, request in enumerate(requests):
+            if request.action in handlers:
+                groups.setdefault(request.action, []).append(index)
+        
+        # Executor threads do not inherit the request context by themselves
+        run_group = tracing.propagate(self._run_group)
+        run_single = tracing.propagate(self._run_single)
+        with ThreadPoolExecutor(max_workers=AI_BATCH_CONCURRENCY) as executor:
+            futures = [
+                (indexes, executor.submit(run_group, handlers[action], [requests[i] for i in indexes]))
+                for action, indexes in groups.items()
+            ]
+            futures += [
+                ([index], executor.submit(run_single, request))
+                for index, request in enumerate(requests) if request.action not in handlers
+            ]
+            for indexes, future in futures:
+                results, elapsed_ms = future.result()
+                for index, output in zip(indexes, results):
+                    outputs[index] = output
+                    timings[index] = elapsed_ms
+        
+        for request, output in zip(requests, outputs):
+            AI_REQUESTS.inc(request.action.value, self._outcome(output))
+        
+        history_ids = self._save_ai_history_batch(
+            [(request, outputs[i], timings[i]) for i, request in enumerate(requests)], user_id
+        )
+        
+        now = datetime.now()
+        return [
+            AIResponse(
+                id=history_ids[i],
+                action=request.action,
+                input_data={
+                    "text_content": request.text_content,
+                    "parameters": request.parameters
+                },
+                output_data=outputs[i],
+                processing_time_ms=timings[i],
+                created_at=now
+            )
+            for i, request in enumerate(requests)
+        ]
+    
+    @staticmethod
+    def _chunk_by_size(lengths: List[int]) -> List[List[int]]:
+        """Group item positions into runs that fit the pack item and character limits"""
+        chunks = []
+        current, current_chars = [], 0
+        for position, length in enumerate(lengths):
+            if current and (len(current) >= AI_BATCH_PACK_MAX_ITEMS or current_chars + length > AI_BATCH_PACK_MAX_CHARS):
+                chunks.append(current)
+                current, current_chars = [], 0
+            current.append(position)
+            current_chars += length
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _run_items(self, action: str, instruction: str, texts: List[str]) -> List[Optional[str]]:
+        """Apply one instruction to many texts using as few concurrent prompts as fit"""
+        results: List[Optional[str]] = [None] * len(texts)
+        chunks = self._chunk_by_size([len(text) for text in texts])
+        generate_items = tracing.propagate(self._generate_items)
+        with ThreadPoolExecutor(max_workers=AI_BATCH_CONCURRENCY) as executor:
+            futures = [
+                (chunk, executor.submit(generate_items, action, instruction, [texts[i] for i in chunk]))
+                for chunk in chunks
+            ]
+            for chunk, future in futures:
+                for position, result in zip(chunk, future.result()):
+                    results[position] = result
+            
+            # Items dropped from a packed reply get a prompt of their own
+            retries = [
+                (position, executor.submit(generate_items, action, instruction, [texts[position]]))
+                for chunk in chunks if len(chunk) > 1
+                for position in chunk if results[position] is None
+            ]
+            for position, future in retries:
+                results[position] = future.result()[0]
+        return results
+    
+    def _generate_items(self, action: str, instruction: str, texts: List[str]) -> List[Optional[str]]:
+        """Run a single or packed prompt; failed or missing items come back as None"""
+        try:
+            if len(texts) == 1:
+                response = self._generate(f"{instruction} Return only the result:\n\n{texts[0]}", action)
+                return [response.text.strip()]
+            response = self._generate(self._pack_prompt(instruction, texts), action)
+            return self._unpack_response(response.text, len(texts))
+        except Exception:
+            return [None] * len(texts)
+    
+    def _run_group(self, handler, requests: List[AIRequest]) -> Tuple[List[Dict[str, Any]], int]:
+        """Run requests of one action through a handler that takes them all at once"""
+        start_time = time.time()
+        try:
+            outputs = handler([(request.text_content or "", request.parameters or {}) for request in requests])
+        except Exception as e:
+            outputs = [{"error": str(e)} for _ in requests]
+        return outputs, int((time.time() - start_time) * 1000)
+    
+    def _run_single(self, request: AIRequest) -> Tuple[List[Dict[str, Any]], int]:
+        start_time = time.time()
+        try:
+            output, _ = self.single_flight.do(self._request_key(request), self._dispatch, request)
+        except Exception as e:
+            output = {"error": str(e)}
+        return [output], int((time.time() - start_time) * 1000)
+    
+    @staticmethod
+    def _pack_prompt(instruction: str, texts: List[str]) -> str:
+        """Build one prompt carrying several numbered items"""
+        items = "\n".join(f"{ITEM_MARKER.format(i + 1)}\n{text}" for i, text in enumerate(texts))
+        return (
+            f"{instruction}\n"
+            f"Each item starts with a marker line like {ITEM_MARKER.format(1)}. "
+            f"Reply with the result for every item, each preceded by its original marker line, "
+            f"in the same order, and nothing else.\n\n{items}"
+        )
+    
+    @staticmethod
+    def _unpack_response(text: str, count: int) -> List[Optional[str]]:
+        """Split a packed reply back into per-item results"""
+        results: List[Optional[str]] = [None] * count
+        matches = list(ITEM_MARKER_PATTERN.finditer(text))
+        for position, match in enumerate(matches):
+            number = int(match.group(1))
+            end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+            if 1 <= number <= count:
+                results[number - 1] = text[match.end():end].strip()
+        return results
+    
+    def _dispatch(self, request: AIRequest) -> Dict[str, Any]:
+        """Run the handler for an AI action"""
+        if request.action == AIAction.SUMMARIZE:
+            return self._summarize_text(request.text_content or "")
+        elif request.action == AIAction.GRAMMAR_CHECK:
+            return self._check_grammar(request.text_content or "", request.parameters or {})
+        elif request.action == AIAction.TRANSLATE:
+            return self._translate_text(request.text_content or "", request.parameters or {})
+        elif request.action == AIAction.ANALYZE_DATA:
+            return self._analyze_data(request.parameters or {})
+        elif request.action == AIAction.FORMAT:
+            return self._format_content(request.text_content or "", request.parameters or {})
+        elif request.action == AIAction.GENERATE_CONTENT:
+            return self._generate_content(request.parameters or {})
+        elif request.action == AIAction.IMPROVE_WRITING:
+            parameters = request.parameters or {}
+            return self._format_content(
+                request.text_content or "",
+                {"format_type": parameters.get('improvement_type', 'clarity')}
+            )
+        return {"error": "Unsupported AI action"}
+    
+    @staticmethod
+    def _request_key(request: AIRequest) -> tuple:
+        """Key identifying requests that produce the same output"""
+        text_hash = hashlib.sha256((request.text_content or "").encode('utf-8')).hexdigest()
+        parameters = json.dumps(request.parameters or {}, sort_keys=True, default=str)
+        return (request.action.value, text_hash, parameters)
+    
+    def _generate(self, prompt: str, action: str):
+        """Call Gemini on the model the router picks, behind breakers and adaptive timeouts"""
+        return self.router.generate(prompt, action)
+    
+    def health(self) -> Dict[str, Any]:
+        """Upstream availability for /health"""
+        if not self.enabled:
+            return {"status": "fallback"}
+        circuits = {model.tier: model.breaker.stats() for model in self.loaded_models()}
+        closed = [tier for tier, circuit in circuits.items() if circuit["state"] == "closed"]
+        return {
+            "status": "available" if len(closed) == len(circuits) else "degraded" if closed else "unavailable",
+            "circuits": circuits,
+            "timeouts": self._router.timeouts.stats() if self._router else {}
+        }
+    
+    @staticmethod
+    def _outcome(output: Optional[Dict[str, Any]]) -> str:
+        """Classify a handler result as ok, fallback or error for metrics"""
+        if not output or output.get("type") == "error" or ("error" in output and output.get("type") != "fallback"):
+            return "error"
+        if output.get("type") == "fallback":
+            return "fallback"
+        return "ok"
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get upstream call statistics"""
+        return {
+            "single_flight": self.single_flight.stats(),
+            "caches": [self.grammar_cache.stats(), self.translation_memory.cache.stats()],
+            "routing": self._router.stats() if self._router else None
+        }
+    
     def _summarize_text(self, text: str) -> Dict[str, Any]:
         """Summarize text using Gemini AI"""
-        if not self.model:
+        if not self.enabled:
             return {"summary": self._fallback_summarize(text), "type": "fallback"}
         
         try:
             prompt = f"Please provide a concise summary of the following text. Focus on the main points and key information:\n\n{text}"
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, AIAction.SUMMARIZE.value)
             summary = response.text.strip()
             
             return {"summary": summary, "type": "ai_generated"}
@@ -96,55 +361,208 @@ class AIService:
         except Exception as e:
             return {"summary": self._fallback_summarize(text), "type": "fallback", "error": str(e)}
     
-    def _check_grammar(self, text: str) -> Dict[str, Any]:
-        """Check grammar using Gemini AI"""
-        if not self.model:
-            return {"corrections": [], "type": "fallback"}
+    def _check_grammar(self, text: str, parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Check grammar using Gemini AI, re-checking only segments not seen before"""
+        return self._check_grammar_many([(text, parameters or {})])[0]
+    
+    def _check_grammar_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Check several texts, sending the segments none of them has cached in shared prompts"""
+        if not self.enabled:
+            return [{"corrections": [], "type": "fallback"} for _ in items]
         
-        try:
-            prompt = f"Please correct any grammar, spelling, or punctuation errors in the following text. Return only the corrected version:\n\n{text}"
-            
-            response = self.model.generate_content(prompt)
-            corrected_text = response.text.strip()
-            
-            return {
-                "original": text,
-                "corrected": corrected_text,
-                "type": "ai_generated"
-            }
-            
-        except Exception as e:
-            return {"corrections": [], "type": "fallback", "error": str(e)}
+        segmented = [
+            split_sentences(text) if parameters.get('segment_by') == 'sentence' else split_paragraphs(text)
+            for text, parameters in items
+        ]
+        cached = [[self.grammar_cache.get(segment.hash) for segment in segments] for segments in segmented]
+        
+        # A segment repeated across texts is checked once
+        pending: Dict[str, str] = {}
+        for segments, found in zip(segmented, cached):
+            for segment, corrected in zip(segments, found):
+                if corrected is None:
+                    pending.setdefault(segment.hash, segment.text)
+        checked: Dict[str, Optional[str]] = {}
+        if pending:
+            results = self._run_items(
+                AIAction.GRAMMAR_CHECK.value,
+                "Please correct any grammar, spelling, or punctuation errors in the following text.",
+                list(pending.values())
+            )
+            checked = dict(zip(pending, results))
+            for segment_hash, corrected in checked.items():
+                if corrected is not None:
+                    self.grammar_cache.set(segment_hash, corrected)
+        
+        return [
+            self._grammar_output(text, segments, found, checked)
+            for (text, _), segments, found in zip(items, segmented, cached)
+        ]
+    
+    def _grammar_output(self, text: str, segments: List[Segment], cached: List[Optional[str]],
+                        checked: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        corrected_segments = [
+            corrected if corrected is not None else checked.get(segment.hash)
+            for segment, corrected in zip(segments, cached)
+        ]
+        pending = [i for i, corrected in enumerate(cached) if corrected is None]
+        
+        failed = sum(1 for corrected in corrected_segments if corrected is None)
+        if segments and failed == len(segments):
+            return {"corrections": [], "type": "fallback", "error": "Grammar check failed for all segments"}
+        
+        # Segments that could not be checked are left as written
+        replacements = [
+            corrected if corrected is not None else segment.text
+            for segment, corrected in zip(segments, corrected_segments)
+        ]
+        corrections = []
+        for segment, replacement in zip(segments, replacements):
+            corrections.extend(self._diff_corrections(segment, replacement))
+        
+        return {
+            "original": text,
+            "corrected": reassemble(text, segments, replacements),
+            "corrections": corrections,
+            "segments": len(segments),
+            "segments_checked": len(pending),
+            "segments_cached": len(segments) - len(pending),
+            "segments_failed": failed,
+            "type": "ai_generated"
+        }
+    
+    @staticmethod
+    def _diff_corrections(segment: Segment, corrected: str) -> List[Dict[str, Any]]:
+        """Word-level differences between a segment and its correction, with offsets into the full text"""
+        if corrected == segment.text:
+            return []
+        
+        tokenize = re.compile(r"\S+|\s+").findall
+        original_tokens = tokenize(segment.text)
+        corrected_tokens = tokenize(corrected)
+        original_offsets = [0]
+        for token in original_tokens:
+            original_offsets.append(original_offsets[-1] + len(token))
+        
+        corrections = []
+        matcher = difflib.SequenceMatcher(a=original_tokens, b=corrected_tokens, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            corrections.append({
+                "offset": segment.start + original_offsets[i1],
+                "length": original_offsets[i2] - original_offsets[i1],
+                "original": "".join(original_tokens[i1:i2]),
+                "replacement": "".join(corrected_tokens[j1:j2]),
+                "type": tag
+            })
+        return corrections
     
     def _translate_text(self, text: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Translate text using Gemini AI"""
-        target_language = parameters.get('target_language', 'English')
+        """Translate text using Gemini AI, reusing translation memory per sentence"""
+        return self._translate_many([(text, parameters)])[0]
+    
+    def _translate_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Translate several texts, sending the sentences translation memory lacks in shared prompts"""
+        if not self.enabled:
+            return [{"translated": text, "type": "fallback"} for text, _ in items]
         
-        if not self.model:
-            return {"translated": text, "type": "fallback"}
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        by_language: Dict[str, List[int]] = {}
+        for index, (_, parameters) in enumerate(items):
+            by_language.setdefault(parameters.get('target_language', 'English'), []).append(index)
         
-        try:
-            prompt = f"Translate the following text to {target_language}. Maintain the original meaning and tone:\n\n{text}"
-            
-            response = self.model.generate_content(prompt)
-            translated_text = response.text.strip()
-            
-            return {
-                "original": text,
-                "translated": translated_text,
-                "target_language": target_language,
-                "type": "ai_generated"
-            }
-            
-        except Exception as e:
-            return {"translated": text, "type": "fallback", "error": str(e)}
+        for target_language, indexes in by_language.items():
+            segmented = [split_sentences(items[index][0]) for index in indexes]
+            known = self.translation_memory.lookup(
+                [segment.text for segments in segmented for segment in segments], target_language
+            )
+            found = []
+            for index, segments in zip(indexes, segmented):
+                translations: List[Optional[str]] = [known.get(segment.hash) for segment in segments]
+                exact_hits = sum(1 for translation in translations if translation is not None)
+                # Fuzzy reuse is opt-in: a near match may differ in meaning from the source
+                fuzzy_hits = 0
+                fuzzy_threshold = items[index][1].get('fuzzy_threshold')
+                if fuzzy_threshold:
+                    for i, segment in enumerate(segments):
+                        if translations[i] is None:
+                            match = self.translation_memory.fuzzy_lookup(segment.text, target_language, float(fuzzy_threshold))
+                            if match:
+                                translations[i] = match[0]
+                                fuzzy_hits += 1
+                found.append((translations, exact_hits, fuzzy_hits))
+            
+            # A sentence repeated across texts is translated once
+            pending: Dict[str, str] = {}
+            for segments, (translations, _, _) in zip(segmented, found):
+                for segment, translation in zip(segments, translations):
+                    if translation is None:
+                        pending.setdefault(segment.hash, segment.text)
+            translated: Dict[str, Optional[str]] = {}
+            if pending:
+                results = self._run_items(
+                    AIAction.TRANSLATE.value,
+                    f"Translate the following text to {target_language}. Maintain the original meaning and tone.",
+                    list(pending.values())
+                )
+                translated = dict(zip(pending, results))
+                self.translation_memory.store(
+                    [(pending[segment_hash], result) for segment_hash, result in translated.items() if result is not None],
+                    target_language
+                )
+            
+            for index, segments, (translations, exact_hits, fuzzy_hits) in zip(indexes, segmented, found):
+                outputs[index] = self._translation_output(
+                    items[index][0], target_language, segments, translations, translated, exact_hits, fuzzy_hits
+                )
+        return outputs
+    
+    @staticmethod
+    def _translation_output(text: str, target_language: str, segments: List[Segment],
+                            remembered: List[Optional[str]], translated: Dict[str, Optional[str]],
+                            exact_hits: int, fuzzy_hits: int) -> Dict[str, Any]:
+        pending = [i for i, translation in enumerate(remembered) if translation is None]
+        translations = [
+            translation if translation is not None else translated.get(segment.hash)
+            for segment, translation in zip(segments, remembered)
+        ]
+        
+        failed = sum(1 for translation in translations if translation is None)
+        if segments and failed == len(segments):
+            return {"translated": text, "type": "fallback", "error": "Translation failed for all segments"}
+        
+        translated_text = reassemble(
+            text,
+            segments,
+            [translation if translation is not None else segment.text
+             for segment, translation in zip(segments, translations)]
+        )
+        
+        return {
+            "original": text,
+            "translated": translated_text,
+            "target_language": target_language,
+            "translation_memory": {
+                "segments": len(segments),
+                "exact_hits": exact_hits,
+                "fuzzy_hits": fuzzy_hits,
+                "translated": len(pending) - failed,
+                "failed": failed,
+                "hit_ratio": round((exact_hits + fuzzy_hits) / len(segments), 4) if segments else 0.0
+            },
+            "type": "ai_generated"
+        }
     
     def _analyze_data(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze data using Gemini AI"""
         data = parameters.get('data', [])
         analysis_type = parameters.get('analysis_type', 'general')
+        if isinstance(data, list) and data and all(isinstance(row, list) for row in data):
+            # Analyze what the formulas compute, not their text
+            data = SpreadsheetService.evaluate_grid(data)
         
-        if not self.model:
+        if not self.enabled:
             return self._fallback_analyze_data(data, analysis_type)
         
         try:
@@ -164,7 +582,7 @@ class AIService:
                 3. Recommendations or insights
                 """
                 
-                response = self.model.generate_content(prompt)
+                response = self._generate(prompt, AIAction.ANALYZE_DATA.value)
                 analysis = response.text.strip()
                 
                 return {
@@ -188,7 +606,7 @@ class AIService:
         """Format content using Gemini AI"""
         format_type = parameters.get('format_type', 'professional')
         
-        if not self.model:
+        if not self.enabled:
             return {"formatted": text, "type": "fallback"}
         
         try:
@@ -204,7 +622,7 @@ class AIService:
             - Appropriate tone for {format_type} context
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, AIAction.FORMAT.value)
             formatted_text = response.text.strip()
             
             return {
@@ -224,7 +642,7 @@ class AIService:
         length = parameters.get('length', 'short')
         tone = parameters.get('tone', 'professional')
         
-        if not self.model:
+        if not self.enabled:
             return {"content": f"Sample {content_type} about {topic}", "type": "fallback"}
         
         try:
@@ -240,7 +658,7 @@ class AIService:
             Please create engaging and well-structured content.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, AIAction.GENERATE_CONTENT.value)
             generated_content = response.text.strip()
             
             return {
@@ -295,23 +713,44 @@ class AIService:
     
     def _save_ai_history(self, request: AIRequest, user_id: str, output: Dict[str, Any], processing_time: int) -> str:
         """Save AI processing history"""
-        ai_history_id = str(uuid.uuid4())
+        return self._save_ai_history_batch([(request, output, processing_time)], user_id)[0]
+    
+    def _save_ai_history_batch(self, entries: List[Tuple[AIRequest, Dict[str, Any], int]], user_id: str) -> List[str]:
+        """Save several AI history rows with one multi-row INSERT"""
+        if not entries:
+            return []
         
-        input_json = {
-            "text_content": request.text_content,
-            "parameters": request.parameters
-        }
+        history_ids = []
+        rows = []
+        for request, output, processing_time in entries:
+            ai_history_id = str(uuid.uuid4())
+            history_ids.append(ai_history_id)
+            input_json = {
+                "text_content": request.text_content,
+                "parameters": request.parameters
+            }
+            rows.append((
+                ai_history_id, request.document_id, user_id, request.action.value,
+                json.dumps(input_json, default=str), json.dumps(output, default=str), processing_time
+            ))
         
-        Database.execute_query(
-            """
+        query = """
             INSERT INTO ai_processing_history (id, document_id, user_id, ai_action, input_data, output_data, processing_time_ms)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (ai_history_id, request.document_id, user_id, request.action, 
-             str(input_json), str(output), processing_time)
-        )
+            """
+        try:
+            Database.executemany(query, rows)
+        except Error:
+            if len(rows) == 1:
+                raise
+            # One bad row (e.g. a deleted document) shouldn't lose the rest of the batch's history
+            for row in rows:
+                try:
+                    Database.execute_query(query, row)
+                except Error as e:
+                    logger.warning(f"Skipped AI history row {row[0]} for document {row[1]}: {e}")
         
-        return ai_history_id
+        return history_ids
     
     def get_ai_history(self, user_id: str, limit: int = 10) -> list:
         """Get AI processing history for user"""
@@ -330,7 +769,7 @@ class AIService:
     
     def chat_with_document(self, document_content: str, question: str, user_id: str) -> Dict[str, Any]:
         """Chat with document content using Gemini AI"""
-        if not self.model:
+        if not self.enabled:
             return {"answer": "AI service not available", "type": "fallback"}
         
         try:
@@ -346,7 +785,7 @@ class AIService:
             Please provide a helpful and accurate answer based solely on the document content.
             """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, "chat")
             answer = response.text.strip()
             
             # Save to history
@@ -0,0 +1,432 @@
+import os
+import glob
+import time
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from services.blob_store import BLOB_STORAGE_PATH
+from services.document_service import DocumentService, DocumentAccessError, DocumentConflictError
+from models.models import DocumentUpdate
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds between database writes of a document that keeps being autosaved
+AUTOSAVE_FLUSH_INTERVAL = float(os.getenv('AUTOSAVE_FLUSH_INTERVAL', 2))
+AUTOSAVE_JOURNAL_DIR = os.getenv('AUTOSAVE_JOURNAL_DIR', os.path.join(BLOB_STORAGE_PATH, 'autosave'))
+# Without fsync an acknowledged save survives a process crash but not a power loss
+AUTOSAVE_FSYNC = os.getenv('AUTOSAVE_FSYNC', 'true').lower() == 'true'
+# A journal untouched this long belongs to a dead process, and its saves are replayed
+AUTOSAVE_JOURNAL_STALE_SECONDS = float(os.getenv('AUTOSAVE_JOURNAL_STALE_SECONDS', 30))
+# How long a document whose buffered saves were rejected remembers it, to tell the next saver
+AUTOSAVE_CONFLICT_SECONDS = float(os.getenv('AUTOSAVE_CONFLICT_SECONDS', 600))
+
+CONFLICT_MESSAGE = "The document was changed elsewhere before your autosaves were written; reload it"
+
+class PendingDocument:
+    """Saves of one document that are acknowledged but not yet in the database"""
+
+    def __init__(self, row: Dict[str, Any]):
+        # The document as the last save left it; served to reads and returned to savers
+        self.row = row
+        self.base_version = row.get('version') or 1
+        self.title: Optional[str] = None
+        self.content_json: Optional[str] = None
+        self.dirty = False
+        # (title, content_json) of a database write in progress
+        self.flushing: Optional[Tuple[Optional[str], Optional[str]]] = None
+        self.has_title = False
+        self.has_content = False
+        # When a write found the document past base_version and dropped the unwritten saves
+        self.conflicted_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def apply(self, title: Optional[str], content_json: Optional[str]):
+        if title is not None:
+            self.title = self.row['title'] = title
+            self.has_title = True
+        if content_json is not None:
+            self.content_json = self.row['content'] = content_json
+            self.row['content_hash'] = None
+            self.has_content = True
+        self.row['version'] = self.base_version + 1
+        self.row['updated_at'] = datetime.now().replace(microsecond=0)
+        self.dirty = True
+
+    def take(self) -> Tuple[Optional[str], Optional[str]]:
+        """Move the pending changes into a write"""
+        self.flushing = (self.title, self.content_json)
+        self.title = self.content_json = None
+        self.dirty = False
+        return self.flushing
+
+    def written(self, version: int):
+        self.flushing = None
+        self.base_version = version
+        self.row['version'] = version + 1 if self.dirty else version
+
+    def failed(self):
+        """Put a failed write's changes back under any saves that arrived meanwhile"""
+        title, content_json = self.flushing
+        self.flushing = None
+        if self.title is None:
+            self.title = title
+        if self.content_json is None:
+            self.content_json = content_json
+        self.dirty = True
+
+    def conflict(self):
+        """Drop every unwritten change: the document moved on without them"""
+        self.flushing = None
+        self.title = self.content_json = None
+        self.dirty = False
+        self.conflicted_at = time.monotonic()
+
+    @property
+    def unwritten(self) -> bool:
+        return self.dirty or self.flushing is not None
+
+    def visible(self, row: Dict[str, Any]) -> bool:
+        """Whether ``row`` from the database is older than the buffered state"""
+        return self.dirty or (self.flushing is not None and (row.get('version') or 1) <= self.base_version)
+
+    def record(self, document_id: str) -> Dict[str, Any]:
+        """Journal entry carrying everything still unwritten"""
+        title, content_json = self.flushing or (None, None)
+        return {
+            "document_id": document_id,
+            "base_version": self.base_version,
+            "title": self.title if self.title is not None else title,
+            "content": self.content_json if self.content_json is not None else content_json,
+        }
+
+class AutosaveJournal:
+    """Append-only file of acknowledged saves, so they survive a crash before reaching the database
+
+    Only one thread touches the file, in submission order, so a checkpoint
+    never loses an append that was submitted after its snapshot.
+    """
+
+    def __init__(self, directory: str = AUTOSAVE_JOURNAL_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, f"journal-{uuid.uuid4().hex}.log")
+        self.appended = 0
+        self.bytes_written = 0
+        self._file = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave-journal")
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+
+    def append(self, record: Dict[str, Any]):
+        line = orjson.dumps(record) + b"\n"
+        self._file.write(line)
+        self._file.flush()
+        if AUTOSAVE_FSYNC:
+            os.fsync(self._file.fileno())
+        self.appended += 1
+        self.bytes_written += len(line)
+
+    def checkpoint(self, records: List[Dict[str, Any]]):
+        """Replace the journal with just the saves still unwritten"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            for record in records:
+                f.write(orjson.dumps(record) + b"\n")
+            f.flush()
+            if AUTOSAVE_FSYNC:
+                os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'ab')
+        self.appended = 0
+
+    def touch(self):
+        """Heartbeat, so other processes don't take this journal for an orphan"""
+        os.utime(self.path)
+
+    def close(self, remove: bool):
+        """Called on the event loop once nothing else is queued for the journal thread"""
+        self._executor.shutdown(wait=True)
+        if self._file:
+            self._file.close()
+            self._file = None
+        if remove:
+            os.remove(self.path)
+
+    def claim_orphans(self) -> List[str]:
+        """Take over journals of processes that stopped without flushing"""
+        claimed = []
+        cutoff = time.time() - AUTOSAVE_JOURNAL_STALE_SECONDS
+        for path in glob.glob(os.path.join(self.directory, "*.log")):
+            if path == self.path:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                # Renaming is atomic, so only one process wins each journal
+                replay_path = os.path.join(self.directory, f"replay-{uuid.uuid4().hex}.log")
+                os.rename(path, replay_path)
+                os.utime(replay_path)
+            except OSError:
+                continue
+            claimed.append(replay_path)
+        return claimed
+
+    @staticmethod
+    def read(path: str) -> Dict[str, Dict[str, Any]]:
+        """The merged unwritten saves per document in a journal"""
+        latest: Dict[str, Dict[str, Any]] = {}
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # A torn write at the end from the crash
+                    continue
+                merged = latest.get(record["document_id"])
+                # Saves on an older base were written before the journal was checkpointed
+                if merged is None or record["base_version"] > merged["base_version"]:
+                    latest[record["document_id"]] = record
+                    continue
+                if record["base_version"] < merged["base_version"]:
+                    continue
+                for field in ("title", "content"):
+                    if record[field] is not None:
+                        merged[field] = record[field]
+        return latest
+
+class AutosaveBuffer:
+    """Write-behind buffer for document autosaves
+
+    ``PUT /api/documents/{id}?autosave=true`` is acknowledged as soon as the
+    save is appended (and fsynced) to this process's journal; saves to the
+    same document are merged in memory and written to the database at most
+    once per AUTOSAVE_FLUSH_INTERVAL. Reads of a document show its buffered
+    state. An explicit save (a PUT without ``autosave``) writes the buffered
+    changes together with its own at once, and shutdown flushes everything.
+
+    Writes only apply to the version the saves were based on. If another
+    worker or a collaboration session changed the document meanwhile, the
+    buffered saves are dropped and the next save of the document gets a
+    DocumentConflictError instead of overwriting that change.
+
+    The journal is checkpointed down to the unwritten saves after each flush.
+    A journal left by a crashed process is replayed by whichever process
+    notices it first, but only onto documents nobody changed since.
+    """
+
+    def __init__(self, flush_interval: float = AUTOSAVE_FLUSH_INTERVAL, journal_dir: str = AUTOSAVE_JOURNAL_DIR):
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, PendingDocument] = {}
+        self.journal = AutosaveJournal(journal_dir)
+        self._flush_task: Optional[asyncio.Task] = None
+        self.saves = 0
+        self.writes = 0
+        self.write_failures = 0
+        self.write_conflicts = 0
+        self.replayed = 0
+        self.replay_conflicts = 0
+
+    async def start(self):
+        await self.journal.run(self.journal.open)
+        DocumentService.write_buffer = self
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush loop and write every buffered save"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        unwritten = sum(1 for entry in self.pending.values() if entry.unwritten)
+        if not unwritten:
+            DocumentService.write_buffer = None
+        else:
+            logger.error(f"{unwritten} autosaved documents could not be written; "
+                         f"they stay in {self.journal.path} to be replayed")
+        self.journal.close(remove=not unwritten)
+
+    async def save(self, document_id: str, user_id: str, updates: DocumentUpdate) -> Optional[bytes]:
+        """Buffer an autosave and return the document as response JSON, or None if the user can't see it"""
+        entry = self.pending.get(document_id)
+        self._raise_if_conflicted(document_id, entry)
+        if entry is None:
+            row = await run_in_threadpool(DocumentService.get_editable_document, document_id, user_id)
+            if row is None:
+                return None
+            level = row['access_level']
+            entry = PendingDocument(row)
+        else:
+            level = await run_in_threadpool(DocumentService.get_access_level, document_id, user_id)
+            if level is None:
+                return None
+            if not DocumentService.can_edit(level):
+                raise DocumentAccessError("You have read-only access to this document")
+        # While we waited, another save may have buffered the document or a flush evicted it
+        entry = self.pending.setdefault(document_id, entry)
+        self._raise_if_conflicted(document_id, entry)
+
+        content_json = orjson.dumps(updates.content).decode() if updates.content is not None else None
+        entry.apply(updates.title, content_json)
+        self.saves += 1
+        try:
+            await self.journal.run(self.journal.append, entry.record(document_id))
+        except OSError as e:
+            # Without the journal the save is only safe once it is in the database
+            logger.error(f"Autosave journal write failed, writing {document_id} now: {e}")
+            await self._write(document_id, entry)
+        return DocumentService.render_document_json({**entry.row, 'access_level': level})
+
+    async def commit(self, document_id: str, user_id: str, updates: DocumentUpdate):
+        """Explicit save: write buffered autosaves and ``updates`` in one update"""
+        entry = self.pending.get(document_id)
+        if entry is None:
+            return await run_in_threadpool(DocumentService.update_document, document_id, user_id, updates)
+        async with entry.lock:
+            self._raise_if_conflicted(document_id, entry)
+            title, content_json = entry.take()
+            merged = DocumentUpdate(title=updates.title, content=updates.content)
+            if merged.title is None:
+                merged.title = title
+            if merged.content is None and content_json is not None:
+                merged.content = orjson.loads(content_json)
+            try:
+                document = await run_in_threadpool(DocumentService.update_document, document_id, user_id, merged)
+            except Exception:
+                entry.failed()
+                raise
+            if document is None:
+                # This user can't see the document; the buffered saves are someone else's
+                entry.failed()
+                return None
+            self.writes += 1
+            entry.written(document.version)
+            self._evict_if_clean(document_id, entry)
+        return document
+
+    async def flush(self):
+        """Write every buffered document and shrink the journal to what is still unwritten"""
+        expired = time.monotonic() - AUTOSAVE_CONFLICT_SECONDS
+        for document_id, entry in list(self.pending.items()):
+            if entry.dirty:
+                await self._write(document_id, entry)
+            elif entry.conflicted_at is not None and entry.conflicted_at < expired:
+                self._evict(document_id, entry)
+        if self.journal.appended:
+            records = [entry.record(document_id) for document_id, entry in self.pending.items() if entry.unwritten]
+            try:
+                await self.journal.run(self.journal.checkpoint, records)
+            except OSError as e:
+                logger.error(f"Autosave journal checkpoint failed: {e}")
+
+    def overlay(self, documents_data: List[Dict[str, Any]]):
+        """Show buffered saves in rows just read from the database"""
+        for document_data in documents_data:
+            entry = self.pending.get(document_data.get('id'))
+            if entry is None or not entry.visible(document_data):
+                continue
+            if entry.has_title and 'title' in document_data:
+                document_data['title'] = entry.row['title']
+            if entry.has_content and 'content' in document_data:
+                document_data['content'] = entry.row['content']
+                document_data['content_hash'] = None
+            document_data['version'] = entry.row['version']
+            document_data['updated_at'] = entry.row['updated_at']
+            # Every save in a flush window shares this version, so it can't key a cache
+            document_data['buffered'] = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": sum(1 for entry in self.pending.values() if entry.dirty),
+            "saves": self.saves,
+            "writes": self.writes,
+            "write_failures": self.write_failures,
+            "write_conflicts": self.write_conflicts,
+            "journal_bytes": self.journal.bytes_written,
+            "replayed": self.replayed,
+            "replay_conflicts": self.replay_conflicts,
+        }
+
+    async def _write(self, document_id: str, entry: PendingDocument):
+        async with entry.lock:
+            if not entry.dirty:
+                return
+            title, content_json = entry.take()
+            try:
+                # Other workers don't see this buffer, so only write over the version the saves started from
+                version = await run_in_threadpool(
+                    DocumentService.write_changes, document_id, title, content_json, entry.base_version
+                )
+            except Exception as e:
+                entry.failed()
+                self.write_failures += 1
+                logger.error(f"Writing autosaved document {document_id} failed: {e}")
+                return
+            if version is None:
+                # Changed elsewhere or deleted since; the next save of it is told so
+                entry.conflict()
+                self.write_conflicts += 1
+                logger.warning(f"Dropped autosaves of {document_id}: the document changed or was deleted "
+                               f"since version {entry.base_version}")
+                return
+            self.writes += 1
+            entry.written(version)
+            self._evict_if_clean(document_id, entry)
+
+    def _evict_if_clean(self, document_id: str, entry: PendingDocument):
+        if not entry.dirty:
+            self._evict(document_id, entry)
+
+    def _evict(self, document_id: str, entry: PendingDocument):
+        if self.pending.get(document_id) is entry:
+            del self.pending[document_id]
+
+    def _raise_if_conflicted(self, document_id: str, entry: Optional[PendingDocument]):
+        """Report dropped autosaves to the next saver, once; later saves start from the current document"""
+        if entry is not None and entry.conflicted_at is not None:
+            self._evict(document_id, entry)
+            raise DocumentConflictError(CONFLICT_MESSAGE)
+
+    async def _replay(self, path: str):
+        """Write an orphaned journal's saves onto documents still at the version they were based on"""
+        try:
+            records = await self.journal.run(AutosaveJournal.read, path)
+            for record in records.values():
+                version = await run_in_threadpool(
+                    DocumentService.write_changes, record["document_id"], record["title"], record["content"],
+                    record["base_version"]
+                )
+                if version is None:
+                    self.replay_conflicts += 1
+                    logger.warning(f"Dropped recovered autosave of {record['document_id']}: "
+                                   f"the document changed or was deleted since")
+                else:
+                    self.replayed += 1
+            os.remove(path)
+        except Exception as e:
+            # The file goes stale again and is claimed on a later pass
+            logger.error(f"Replaying autosave journal {path} failed: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                await self.journal.run(self.journal.touch)
+                for path in await self.journal.run(self.journal.claim_orphans):
+                    await self._replay(path)
+            except Exception as e:
+                logger.error(f"Autosave flush failed: {e}")
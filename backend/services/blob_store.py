@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import unicodedata
+import aiofiles
+import aiofiles.os
+import shutil
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+from starlette.responses import Response
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: an upload is only locked against requests in the same process
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORAGE_PATH = os.getenv(
+    'BLOB_STORAGE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage')
+)
+BLOB_CHUNK_SIZE = int(os.getenv('BLOB_CHUNK_SIZE', 256 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 512 * 1024 * 1024))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))
+BLOB_GC_GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', 3600))
+
+def content_disposition(filename: str) -> str:
+    """Attachment header for any filename: an ASCII fallback, plus the UTF-8 name (RFC 6266) when they differ"""
+    def ascii_only(text: str) -> str:
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+        return "".join(c if c.isprintable() and c not in '"\\' else "_" for c in text)
+
+    stem, extension = os.path.splitext(filename)
+    fallback = (ascii_only(stem).strip() or "download") + ascii_only(extension)
+    header = f'attachment; filename="{fallback}"'
+    if fallback != filename:
+        header += f"; filename*=UTF-8''{quote(filename, safe='')}"
+    return header
+
+class UploadNotFoundError(Exception):
+    pass
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start at the current end of the upload"""
+    def __init__(self, expected_offset: int, message: Optional[str] = None):
+        super().__init__(message or f"Upload offset mismatch, expected {expected_offset}")
+        self.expected_offset = expected_offset
+
+class UploadBusyError(UploadOffsetError):
+    """Raised when another worker process is writing to the same upload"""
+    def __init__(self, current_offset: int):
+        super().__init__(current_offset, f"Upload is being written by another request, now at {current_offset}")
+
+class BlobStore:
+    """Content-addressed file store with resumable uploads
+
+    Finished blobs live at ``blobs/<aa>/<bb>/<sha256>`` and are referenced from
+    ``documents.file_path`` by that relative key, so identical uploads share a
+    single file. In-progress uploads live under ``uploads/`` as a ``.part``
+    data file plus a ``.json`` session file, which lets a client resume after a
+    dropped connection or a server restart. Appending and completing hold the
+    upload's lock, so concurrent requests can't interleave writes.
+    """
+
+    def __init__(self, root: str = BLOB_STORAGE_PATH):
+        self.root = os.path.abspath(root)
+        self.blob_dir = os.path.join(self.root, 'blobs')
+        self.upload_dir = os.path.join(self.root, 'uploads')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # Running SHA-256 per upload so completion does not re-read the file;
+        # rebuilt from disk if the process restarted mid-upload
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+        # Directories holding data derived from a blob, named by its digest
+        self.derived_dirs: List[str] = []
+        # upload id -> [lock, requests holding or waiting for it]
+        self._locks: Dict[str, list] = {}
+
+    # Uploads
+
+    async def create_upload(self, user_id: str, filename: str, total_size: Optional[int] = None) -> Dict[str, Any]:
+        """Start a new resumable upload session"""
+        if total_size is not None and total_size > MAX_UPLOAD_SIZE:
+            raise ValueError(f"Upload exceeds maximum size of {MAX_UPLOAD_SIZE} bytes")
+
+        upload_id = str(uuid.uuid4())
+        session = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "filename": os.path.basename(filename or "upload"),
+            "total_size": total_size,
+            "created_at": time.time(),
+        }
+        async with aiofiles.open(self._session_path(upload_id), 'w') as f:
+            await f.write(json.dumps(session))
+        async with aiofiles.open(self._part_path(upload_id), 'wb'):
+            pass
+        self._hashers[upload_id] = (0, hashlib.sha256())
+
+        return {**session, "offset": 0}
+
+    async def get_upload(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """Return upload session with the number of bytes received so far"""
+        session = await self._load_session(upload_id, user_id)
+        session["offset"] = await self._part_size(upload_id)
+        return session
+
+    async def append_chunk(self, upload_id: str, user_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Append a streamed chunk at ``offset`` and return the new offset"""
+        session = await self._load_session(upload_id, user_id)
+        async with self._locked(upload_id):
+            current_size = await self._part_size(upload_id)
+            if offset != current_size:
+                raise UploadOffsetError(current_size)
+            # Garbage collection goes by the newest mtime, so an active upload is never collected
+            os.utime(self._session_path(upload_id))
+
+            limit = session.get("total_size") or MAX_UPLOAD_SIZE
+            hasher = self._hasher_at(upload_id, current_size)
+            written = current_size
+            try:
+                async with aiofiles.open(self._part_path(upload_id), 'ab') as f:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        written += len(chunk)
+                        if written > limit:
+                            raise ValueError(f"Upload exceeds declared size of {limit} bytes")
+                        await f.write(chunk)
+                        if hasher is not None:
+                            hasher.update(chunk)
+            except BaseException:
+                # Partial chunk may be on disk; the hasher is rebuilt from the file on completion
+                self._hashers.pop(upload_id, None)
+                raise
+
+            if hasher is not None:
+                self._hashers[upload_id] = (written, hasher)
+            return written
+
+    async def complete_upload(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """Finish an upload, deduplicating it into the blob store"""
+        session = await self._load_session(upload_id, user_id)
+        async with self._locked(upload_id):
+            return await self._complete(upload_id, session)
+
+    async def _complete(self, upload_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+        part_path = self._part_path(upload_id)
+        size = await self._part_size(upload_id)
+        if session.get("total_size") is not None and size != session["total_size"]:
+            raise UploadOffsetError(size)
+
+        hasher = self._hasher_at(upload_id, size)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            async with aiofiles.open(part_path, 'rb') as f:
+                while True:
+                    chunk = await f.read(BLOB_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        blob_key = self.blob_key(digest)
+        blob_path = self.blob_path(blob_key)
+        if os.path.exists(blob_path):
+            # Identical content already stored; refresh mtime so GC grace applies
+            await aiofiles.os.remove(part_path)
+            os.utime(blob_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            await aiofiles.os.replace(part_path, blob_path)
+
+        await aiofiles.os.remove(self._session_path(upload_id))
+        self._hashers.pop(upload_id, None)
+
+        return {
+            "file_path": blob_key,
+            "file_size": size,
+            "sha256": digest,
+            "filename": session["filename"],
+        }
+
+    # Blobs
+
+    @staticmethod
+    def blob_key(digest: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def blob_path(self, blob_key: str) -> str:
+        path = os.path.normpath(os.path.join(self.blob_dir, blob_key))
+        if not path.startswith(self.blob_dir + os.sep):
+            raise ValueError("Invalid blob key")
+        return path
+
+    def blob_response(self, blob_key: str, range_header: Optional[str], filename: str,
+                      media_type: str = "application/octet-stream") -> Response:
+        """Build a download response honouring a single HTTP byte range"""
+        path = self.blob_path(blob_key)
+        file_size = os.path.getsize(path)
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": content_disposition(filename),
+        }
+
+        if not range_header:
+            return BlobFileResponse(path, 0, file_size, status_code=200, headers=headers, media_type=media_type)
+
+        byte_range = self.parse_range(range_header, file_size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        return BlobFileResponse(path, start, end - start + 1, status_code=206, headers=headers, media_type=media_type)
+
+    @staticmethod
+    def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+        """Parse a single ``bytes=`` range into inclusive (start, end)"""
+        unit, _, spec = range_header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in spec:
+            return None
+        start_text, _, end_text = spec.strip().partition("-")
+        try:
+            if not start_text:
+                # Suffix range: last N bytes
+                length = int(end_text)
+                if length <= 0:
+                    return None
+                return max(file_size - length, 0), file_size - 1
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        except ValueError:
+            return None
+        if start >= file_size or start > end:
+            return None
+        return start, min(end, file_size - 1)
+
+    # Garbage collection
+
+    def collect_garbage(self, referenced_keys: Iterable[str]) -> Dict[str, int]:
+        """Delete blobs no document references and abandoned upload sessions"""
+        referenced = set(referenced_keys)
+        now = time.time()
+        removed_blobs = 0
+        removed_uploads = 0
+
+        for dirpath, _, filenames in os.walk(self.blob_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.blob_dir).replace(os.sep, "/")
+                if key in referenced:
+                    continue
+                try:
+                    # Grace period covers uploads completed but not yet attached
+                    if now - os.path.getmtime(path) < BLOB_GC_GRACE_SECONDS:
+                        continue
+                    os.remove(path)
+                    removed_blobs += 1
+                except OSError:
+                    continue
+                for derived_dir in self.derived_dirs:
+                    shutil.rmtree(os.path.join(derived_dir, name), ignore_errors=True)
+
+        uploads: Dict[str, List[str]] = {}
+        for name in os.listdir(self.upload_dir):
+            uploads.setdefault(name.rsplit('.', 1)[0], []).append(os.path.join(self.upload_dir, name))
+        for upload_id, paths in uploads.items():
+            if upload_id in self._locks:
+                continue
+            try:
+                # Writes move the part file's mtime and each chunk the session file's
+                idle = now - max(os.path.getmtime(path) for path in paths)
+            except OSError:
+                continue
+            if idle <= UPLOAD_SESSION_TTL:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                    removed_uploads += 1
+                except OSError:
+                    pass
+            self._hashers.pop(upload_id, None)
+
+        if removed_blobs or removed_uploads:
+            logger.info(f"Blob GC removed {removed_blobs} blobs and {removed_uploads} upload files")
+        return {"removed_blobs": removed_blobs, "removed_uploads": removed_uploads}
+
+    # Helpers
+
+    def _session_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{os.path.basename(upload_id)}.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{os.path.basename(upload_id)}.part")
+
+    async def _load_session(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        try:
+            async with aiofiles.open(self._session_path(upload_id), 'r') as f:
+                session = json.loads(await f.read())
+        except FileNotFoundError:
+            raise UploadNotFoundError(upload_id)
+        if session.get("user_id") != user_id:
+            raise UploadNotFoundError(upload_id)
+        return session
+
+    @asynccontextmanager
+    async def _locked(self, upload_id: str):
+        """Hold an upload against other writers: queued in this process, flock against other workers"""
+        entry = self._locks.setdefault(upload_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                try:
+                    fd = os.open(self._session_path(upload_id), os.O_RDONLY)
+                except FileNotFoundError:
+                    raise UploadNotFoundError(upload_id)
+                try:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        raise UploadBusyError(await self._part_size(upload_id))
+                    yield
+                finally:
+                    # Closing releases the flock
+                    os.close(fd)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[upload_id]
+
+    async def _part_size(self, upload_id: str) -> int:
+        try:
+            return (await aiofiles.os.stat(self._part_path(upload_id))).st_size
+        except FileNotFoundError:
+            raise UploadNotFoundError(upload_id)
+
+    def _hasher_at(self, upload_id: str, offset: int):
+        """Return the running hasher if it covers exactly ``offset`` bytes"""
+        state = self._hashers.get(upload_id)
+        if state and state[0] == offset:
+            return state[1]
+        if offset == 0:
+            hasher = hashlib.sha256()
+            self._hashers[upload_id] = (0, hasher)
+            return hasher
+        return None
+
+class BlobFileResponse(Response):
+    """Send a byte range of a file, using zero-copy send when the server offers it"""
+
+    def __init__(self, path: str, offset: int, count: int, status_code: int = 200,
+                 headers: Optional[Dict[str, str]] = None, media_type: Optional[str] = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.headers["content-length"] = str(count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, 'rb') as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+
+        remaining = self.count
+        finished = False
+        async with aiofiles.open(self.path, 'rb') as f:
+            await f.seek(self.offset)
+            while remaining > 0:
+                chunk = await f.read(min(BLOB_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                finished = remaining == 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": not finished})
+        # Empty files and files that shrank still need the closing message
+        if not finished:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
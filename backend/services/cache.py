@@ -0,0 +1,80 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+from services.metrics import REGISTRY
+
+_MISSING = object()
+# Every live cache, so hit ratios can be exported without wiring each one up
+_caches: "weakref.WeakSet[LRUCache]" = weakref.WeakSet()
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional TTL and hit/miss counters"""
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+def all_cache_stats() -> List[Dict[str, Any]]:
+    return [cache.stats() for cache in list(_caches)]
+
+def _collect(field: str, sample_name: str):
+    def collect():
+        for stats in all_cache_stats():
+            yield sample_name, {"cache": stats["name"]}, stats[field]
+    return collect
+
+REGISTRY.register_collector("cache_hits_total", "counter", "LRU cache hits", _collect("hits", "cache_hits_total"))
+REGISTRY.register_collector("cache_misses_total", "counter", "LRU cache misses", _collect("misses", "cache_misses_total"))
+REGISTRY.register_collector("cache_hit_ratio", "gauge", "LRU cache hit ratio since start", _collect("hit_ratio", "cache_hit_ratio"))
+REGISTRY.register_collector("cache_entries", "gauge", "Entries held per LRU cache", _collect("size", "cache_entries"))
@@ -0,0 +1,179 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AI_BREAKER_WINDOW = int(os.getenv('AI_BREAKER_WINDOW', 50))
+AI_BREAKER_MIN_CALLS = int(os.getenv('AI_BREAKER_MIN_CALLS', 10))
+AI_BREAKER_FAILURE_RATE = float(os.getenv('AI_BREAKER_FAILURE_RATE', 0.5))
+AI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('AI_BREAKER_SLOW_CALL_SECONDS', 15))
+AI_BREAKER_SLOW_CALL_RATE = float(os.getenv('AI_BREAKER_SLOW_CALL_RATE', 0.8))
+AI_BREAKER_OPEN_SECONDS = float(os.getenv('AI_BREAKER_OPEN_SECONDS', 30))
+AI_BREAKER_HALF_OPEN_PROBES = int(os.getenv('AI_BREAKER_HALF_OPEN_PROBES', 3))
+
+AI_TIMEOUT_MIN_SECONDS = float(os.getenv('AI_TIMEOUT_MIN_SECONDS', 3))
+AI_TIMEOUT_MAX_SECONDS = float(os.getenv('AI_TIMEOUT_MAX_SECONDS', 60))
+AI_TIMEOUT_PERCENTILE = float(os.getenv('AI_TIMEOUT_PERCENTILE', 99))
+AI_TIMEOUT_MULTIPLIER = float(os.getenv('AI_TIMEOUT_MULTIPLIER', 2.0))
+AI_TIMEOUT_MIN_SAMPLES = int(os.getenv('AI_TIMEOUT_MIN_SAMPLES', 20))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open"""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class UpstreamTimeoutError(TimeoutError):
+    """Raised when an upstream call exceeds its adaptive timeout"""
+
+class CircuitBreaker:
+    """Trips on failure or slow-call rate over a sliding window of calls
+
+    While open, calls fail fast with CircuitOpenError. After the cool-down a
+    few probe calls are let through (half-open); if they all succeed the
+    breaker closes, otherwise it opens again.
+    """
+
+    def __init__(self, name: str, window: int = AI_BREAKER_WINDOW, min_calls: int = AI_BREAKER_MIN_CALLS,
+                 failure_rate: float = AI_BREAKER_FAILURE_RATE, slow_call_seconds: float = AI_BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = AI_BREAKER_SLOW_CALL_RATE, open_seconds: float = AI_BREAKER_OPEN_SECONDS,
+                 half_open_probes: int = AI_BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        # (failed, slow) per recent call
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._probes_started = 0
+        self._probes_succeeded = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Reserve permission to call upstream or raise CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self._probes_started = 0
+                self._probes_succeeded = 0
+            if self.state == HALF_OPEN:
+                if self._probes_started >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probes_started += 1
+
+    def record(self, duration: float, success: bool):
+        """Record the outcome of a call allowed by before_call"""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not success or slow:
+                    self._open()
+                    return
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_probes:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            if self.state == OPEN:
+                # A call that started before the breaker opened
+                return
+
+            self._calls.append((not success, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._calls if failed)
+            slow_calls = sum(1 for _, was_slow in self._calls if was_slow)
+            if failures / len(self._calls) >= self.failure_rate or slow_calls / len(self._calls) >= self.slow_call_rate:
+                self._open()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._calls)
+            failures = sum(1 for failed, _ in self._calls if failed)
+            slow_calls = sum(1 for _, slow in self._calls if slow)
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            # An open breaker past its cool-down lets the next call through as a probe
+            state = HALF_OPEN if self.state == OPEN and remaining <= 0 else self.state
+            stats = {
+                "state": state,
+                "window_calls": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "slow_call_rate": round(slow_calls / calls, 3) if calls else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+            if state == OPEN:
+                stats["retry_after"] = round(remaining, 1)
+            return stats
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._calls.clear()
+
+class AdaptiveTimeout:
+    """Per-key timeout derived from a high percentile of recent successful latencies"""
+
+    def __init__(self, window: int = 200, percentile: float = AI_TIMEOUT_PERCENTILE,
+                 multiplier: float = AI_TIMEOUT_MULTIPLIER, min_seconds: float = AI_TIMEOUT_MIN_SECONDS,
+                 max_seconds: float = AI_TIMEOUT_MAX_SECONDS, min_samples: int = AI_TIMEOUT_MIN_SAMPLES):
+        self.window = window
+        self.timeout_percentile = percentile
+        self.multiplier = multiplier
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._observed: Dict[str, int] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, key: str) -> float:
+        """Seconds to wait for a call; the maximum until enough samples exist"""
+        return self._timeouts.get(key, self.max_seconds)
+
+    def observe(self, key: str, duration: float):
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(duration)
+            observed = self._observed[key] = self._observed.get(key, 0) + 1
+            count = len(samples)
+            # Re-deriving on every call would sort the window each time
+            if count < self.min_samples or observed % 10:
+                return
+            ordered = sorted(samples)
+        high = ordered[min(count, math.ceil(self.timeout_percentile / 100 * count)) - 1]
+        self._timeouts[key] = min(self.max_seconds, max(self.min_seconds, high * self.multiplier))
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        """Observed latency percentile for ``key``, or None until enough samples exist"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered), math.ceil(percentile / 100 * len(ordered))) - 1]
+
+    def stats(self) -> Dict[str, float]:
+        return {key: round(value, 2) for key, value in self._timeouts.items()}
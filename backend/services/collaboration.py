@@ -0,0 +1,437 @@
+import os
+import uuid
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import orjson
+from fastapi import WebSocket
+from fastapi.concurrency import run_in_threadpool
+from services.document_service import DocumentService
+from services.operations import OperationError, apply_operation, parse_operation, transform_all
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Changes are collected for this long and sent to every editor as one frame (0 sends each at once)
+COLLAB_BROADCAST_INTERVAL_MS = float(os.getenv('COLLAB_BROADCAST_INTERVAL_MS', 25))
+# Seconds between writes of a changed document to the database
+COLLAB_PERSIST_INTERVAL = float(os.getenv('COLLAB_PERSIST_INTERVAL', 2))
+# Revisions kept for transforming late operations; older clients get a fresh snapshot
+COLLAB_HISTORY_SIZE = int(os.getenv('COLLAB_HISTORY_SIZE', 1000))
+COLLAB_MAX_EDITORS = int(os.getenv('COLLAB_MAX_EDITORS', 100))
+COLLAB_MAX_MESSAGE_BYTES = int(os.getenv('COLLAB_MAX_MESSAGE_BYTES', 256 * 1024))
+# Frames queued for one client before it is disconnected as too slow
+COLLAB_SEND_QUEUE_SIZE = int(os.getenv('COLLAB_SEND_QUEUE_SIZE', 256))
+
+# Close codes in the range reserved for applications
+CLOSE_ACCESS_CHANGED = 4403
+CLOSE_NOT_FOUND = 4404
+CLOSE_TOO_SLOW = 4408
+CLOSE_FULL = 4429
+
+class StaleRevisionError(Exception):
+    """The client's base revision is unknown or no longer in history"""
+
+class Editor:
+    """One connected client; frames go out from its own task so a slow socket only delays itself"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, can_edit: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.user_id = user_id
+        self.can_edit = can_edit
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=COLLAB_SEND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+
+    def send(self, frame: str) -> bool:
+        """Queue a frame; False once the client has fallen too far behind"""
+        try:
+            self.outbox.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+class CollaborationSession:
+    """Authoritative state of one document while anyone has it open"""
+
+    def __init__(self, document_id: str, content: Dict[str, Any], version: int):
+        self.document_id = document_id
+        self.content = content
+        # Stored version the content was loaded at or last written as; writes only apply over it
+        self.version = version
+        self.revision = 0
+        self.persisted_revision = 0
+        # Ops of the most recent revisions, oldest first
+        self.history: Deque[List[Dict[str, Any]]] = deque(maxlen=COLLAB_HISTORY_SIZE)
+        self.editors: Dict[str, Editor] = {}
+        self.pending: List[Dict[str, Any]] = []
+        # Only the latest cursor per client is worth sending
+        self.presence: Dict[str, Dict[str, Any]] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.save_lock = asyncio.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return self.revision != self.persisted_revision
+
+    def submit(self, client_id: str, base_revision: Any, raw_ops: Any, message_id: Any) -> Dict[str, Any]:
+        """Transform a client's ops onto the current revision, apply them and return the change
+
+        If an op fails to apply, the ops before it are kept as the change and
+        OperationError is raised with it attached as ``change``.
+        """
+        behind = self.revision - base_revision if isinstance(base_revision, int) else -1
+        if behind < 0 or behind > len(self.history):
+            raise StaleRevisionError()
+        if not isinstance(raw_ops, list):
+            raise OperationError("ops must be a list")
+        ops = [parse_operation(op) for op in raw_ops]
+        if behind:
+            missed = itertools.islice(self.history, len(self.history) - behind, None)
+            ops = transform_all(ops, [op for past in missed for op in past])
+
+        applied = []
+        error = None
+        for op in ops:
+            try:
+                apply_operation(self.content, op)
+            except OperationError as e:
+                error = e
+                break
+            applied.append(op)
+
+        change = None
+        if applied or error is None:
+            # A change whose ops were all transformed away still acknowledges the message
+            self.revision += 1
+            self.history.append(applied)
+            change = {"type": "change", "rev": self.revision, "client": client_id, "id": message_id, "ops": applied}
+        if error is not None:
+            error.change = change
+            raise error
+        return change
+
+class CollaborationService:
+    """Real-time co-editing of documents over WebSockets
+
+    The server orders every change (operational transformation with a central
+    authority). A client sends ``{"type": "ops", "rev": n, "id": m, "ops": [...]}``
+    based on revision ``n``; ops that raced with other changes are transformed
+    onto the current revision and applied. Changes, joins, leaves and cursor
+    updates are batched for COLLAB_BROADCAST_INTERVAL_MS and sent to all
+    editors as one ``batch`` frame, so the sender sees its own change (with its
+    ``id``) as the acknowledgement. Clients skip changes at or below the
+    revision they already have. Merged content is written to the database
+    every COLLAB_PERSIST_INTERVAL seconds while it changes and when the last
+    editor leaves, not on every keystroke.
+
+    A write only applies over the version the session loaded or last wrote.
+    If the document was saved elsewhere meanwhile (a REST update or a flushed
+    autosave), that save wins: the session reloads it, drops its unwritten
+    edits and sends every editor a new snapshot. Idle sessions check the
+    stored version on the same interval.
+
+    Sessions live in this process, so with several workers a document's
+    editors must be routed to the same one.
+    """
+
+    def __init__(self, broadcast_interval_ms: float = COLLAB_BROADCAST_INTERVAL_MS,
+                 persist_interval: float = COLLAB_PERSIST_INTERVAL):
+        self.broadcast_interval = broadcast_interval_ms / 1000
+        self.persist_interval = persist_interval
+        self.sessions: Dict[str, CollaborationSession] = {}
+        self._opening: Dict[str, asyncio.Lock] = {}
+        self._persist_task: Optional[asyncio.Task] = None
+        self.ops_applied = 0
+        self.changes = 0
+        self.resyncs = 0
+        self.frames_sent = 0
+        self.persist_writes = 0
+        self.persist_bytes = 0
+        self.persist_failures = 0
+        self.external_writes = 0
+
+    async def start(self):
+        self._persist_task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        """Stop the persist loop and write every unsaved document"""
+        if self._persist_task:
+            self._persist_task.cancel()
+            await asyncio.gather(self._persist_task, return_exceptions=True)
+            self._persist_task = None
+        for session in list(self.sessions.values()):
+            await self._persist(session)
+
+    async def serve(self, websocket: WebSocket, document_id: str, user_id: str, can_edit: bool):
+        """Run an accepted connection until the client leaves"""
+        session = await self._open(document_id)
+        if session is None:
+            await websocket.close(code=CLOSE_NOT_FOUND)
+            return
+        if len(session.editors) >= COLLAB_MAX_EDITORS:
+            await websocket.close(code=CLOSE_FULL)
+            return
+
+        editor = Editor(websocket, user_id, can_edit)
+        session.editors[editor.id] = editor
+        editor.writer = asyncio.create_task(self._write(session, editor))
+        self._send_snapshot(session, editor)
+        self._publish(session, {"type": "join", "client": editor.id, "user_id": user_id})
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                self._handle(session, editor, message.get("text") or message.get("bytes") or "")
+        except Exception as e:
+            logger.debug(f"Collaboration socket for {document_id} closed: {e}")
+        finally:
+            await self._leave(session, editor)
+
+    def disconnect_user(self, document_id: str, user_id: str):
+        """Drop a user's connections after their access changed; they reconnect with the new level"""
+        session = self.sessions.get(document_id)
+        if session is None:
+            return
+        for editor in list(session.editors.values()):
+            if editor.user_id == user_id:
+                self._disconnect(editor, CLOSE_ACCESS_CHANGED)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "editors": sum(len(session.editors) for session in self.sessions.values()),
+            "ops_applied": self.ops_applied,
+            "changes": self.changes,
+            "resyncs": self.resyncs,
+            "frames_sent": self.frames_sent,
+            "persist_writes": self.persist_writes,
+            "persist_bytes": self.persist_bytes,
+            "persist_failures": self.persist_failures,
+            "external_writes": self.external_writes,
+        }
+
+    def _load_document(self, document_id: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        return DocumentService.get_content(document_id)
+
+    def _save_document(self, document_id: str, content_json: str, expected_version: int) -> Optional[int]:
+        return DocumentService.write_changes(document_id, None, content_json, expected_version)
+
+    def _stored_version(self, document_id: str) -> Optional[int]:
+        return DocumentService.get_version(document_id)
+
+    async def _open(self, document_id: str) -> Optional[CollaborationSession]:
+        session = self.sessions.get(document_id)
+        if session is not None:
+            return session
+        lock = self._opening.setdefault(document_id, asyncio.Lock())
+        try:
+            async with lock:
+                session = self.sessions.get(document_id)
+                if session is None:
+                    loaded = await run_in_threadpool(self._load_document, document_id)
+                    if loaded is None:
+                        return None
+                    session = self.sessions[document_id] = CollaborationSession(document_id, *loaded)
+                return session
+        finally:
+            if not lock.locked():
+                self._opening.pop(document_id, None)
+
+    def _handle(self, session: CollaborationSession, editor: Editor, data):
+        if len(data) > COLLAB_MAX_MESSAGE_BYTES:
+            self._send_error(editor, "Message too large")
+            return
+        try:
+            message = orjson.loads(data)
+            kind = message.get("type")
+        except (orjson.JSONDecodeError, AttributeError):
+            self._send_error(editor, "Messages must be JSON objects")
+            return
+
+        if kind == "ops":
+            if not editor.can_edit:
+                self._send_error(editor, "You have read-only access to this document")
+                return
+            try:
+                change = session.submit(editor.id, message.get("rev"), message.get("ops"), message.get("id"))
+            except StaleRevisionError:
+                self.resyncs += 1
+                self._send_snapshot(session, editor)
+                return
+            except OperationError as e:
+                if getattr(e, "change", None):
+                    self._record_change(session, e.change)
+                self._send_error(editor, str(e), message.get("id"))
+                self.resyncs += 1
+                self._send_snapshot(session, editor)
+                return
+            self._record_change(session, change)
+        elif kind == "presence":
+            session.presence[editor.id] = {"type": "presence", "client": editor.id, "cursor": message.get("cursor")}
+            self._schedule_flush(session)
+        elif kind == "ping":
+            editor.send('{"type":"pong"}')
+        else:
+            self._send_error(editor, f"Unknown message type '{kind}'")
+
+    def _record_change(self, session: CollaborationSession, change: Dict[str, Any]):
+        self.changes += 1
+        self.ops_applied += len(change["ops"])
+        self._publish(session, change)
+
+    def _publish(self, session: CollaborationSession, message: Dict[str, Any]):
+        session.pending.append(message)
+        self._schedule_flush(session)
+
+    def _schedule_flush(self, session: CollaborationSession):
+        if session.flush_handle is not None:
+            return
+        if self.broadcast_interval <= 0:
+            self._flush(session)
+            return
+        session.flush_handle = asyncio.get_running_loop().call_later(self.broadcast_interval, self._flush, session)
+
+    def _flush(self, session: CollaborationSession):
+        """Send everything pending as one frame, encoded once for all editors"""
+        session.flush_handle = None
+        messages = session.pending + list(session.presence.values())
+        session.pending = []
+        session.presence = {}
+        if not messages:
+            return
+        frame = orjson.dumps({"type": "batch", "rev": session.revision, "messages": messages}).decode()
+        for editor in list(session.editors.values()):
+            if not editor.send(frame):
+                logger.warning(f"Disconnecting collaborator {editor.id} on {session.document_id}: too far behind")
+                self._disconnect(editor, CLOSE_TOO_SLOW)
+
+    def _send_snapshot(self, session: CollaborationSession, editor: Editor):
+        editor.send(orjson.dumps({
+            "type": "snapshot",
+            "client": editor.id,
+            "rev": session.revision,
+            "can_edit": editor.can_edit,
+            "content": session.content,
+            "editors": [{"client": other.id, "user_id": other.user_id} for other in session.editors.values()],
+        }).decode())
+
+    @staticmethod
+    def _send_error(editor: Editor, detail: str, message_id: Any = None):
+        editor.send(orjson.dumps({"type": "error", "detail": detail, "id": message_id}).decode())
+
+    async def _write(self, session: CollaborationSession, editor: Editor):
+        try:
+            while True:
+                frame = await editor.outbox.get()
+                await editor.websocket.send_text(frame)
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Collaboration send to {editor.id} on {session.document_id} failed: {e}")
+
+    def _disconnect(self, editor: Editor, code: int):
+        if editor.writer:
+            editor.writer.cancel()
+        asyncio.create_task(self._close_socket(editor.websocket, code))
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _leave(self, session: CollaborationSession, editor: Editor):
+        if session.editors.pop(editor.id, None) is None:
+            return
+        if editor.writer:
+            editor.writer.cancel()
+        session.presence.pop(editor.id, None)
+        if session.editors:
+            self._publish(session, {"type": "leave", "client": editor.id, "user_id": editor.user_id})
+            return
+
+        await self._persist(session)
+        # Someone may have joined while the last save was running
+        if not session.editors and self.sessions.get(session.document_id) is session:
+            if session.flush_handle:
+                session.flush_handle.cancel()
+            del self.sessions[session.document_id]
+
+    async def _persist(self, session: CollaborationSession):
+        async with session.save_lock:
+            if not session.dirty:
+                return
+            revision = session.revision
+            # Encoded here because the content is only safe to read on the event loop
+            content_json = orjson.dumps(session.content).decode()
+            try:
+                version = await run_in_threadpool(
+                    self._save_document, session.document_id, content_json, session.version
+                )
+            except Exception as e:
+                self.persist_failures += 1
+                logger.error(f"Saving collaborative document {session.document_id} failed: {e}")
+                return
+            if version is None:
+                await self._reload(session)
+                return
+            session.version = version
+            session.persisted_revision = revision
+            self.persist_writes += 1
+            self.persist_bytes += len(content_json)
+
+    async def _check_stored_version(self, session: CollaborationSession):
+        """Reload an idle session whose document was saved elsewhere"""
+        async with session.save_lock:
+            if session.dirty:
+                # The next persist finds out
+                return
+            try:
+                version = await run_in_threadpool(self._stored_version, session.document_id)
+            except Exception as e:
+                logger.error(f"Checking collaborative document {session.document_id} failed: {e}")
+                return
+            if version != session.version:
+                await self._reload(session)
+
+    async def _reload(self, session: CollaborationSession):
+        """Replace the content with the stored document and resync every editor; call with save_lock held"""
+        self.external_writes += 1
+        loaded = await run_in_threadpool(self._load_document, session.document_id)
+        if loaded is None:
+            logger.warning(f"Collaborative document {session.document_id} was deleted; closing its session")
+            session.persisted_revision = session.revision
+            if self.sessions.get(session.document_id) is session:
+                del self.sessions[session.document_id]
+            for editor in list(session.editors.values()):
+                self._disconnect(editor, CLOSE_NOT_FOUND)
+            return
+        logger.warning(f"Collaborative document {session.document_id} was saved elsewhere; reloading it")
+        # Changes already queued go out first, so clients see them before the snapshot replaces them
+        if session.flush_handle:
+            session.flush_handle.cancel()
+        self._flush(session)
+        session.content, session.version = loaded
+        # Ops based on earlier revisions can't be transformed onto the reloaded content
+        session.revision += 1
+        session.persisted_revision = session.revision
+        session.history.clear()
+        for editor in list(session.editors.values()):
+            self._send_snapshot(session, editor)
+
+    async def _persist_loop(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            for session in list(self.sessions.values()):
+                if session.dirty:
+                    await self._persist(session)
+                else:
+                    await self._check_stored_version(session)
@@ -0,0 +1,118 @@
+import os
+import zlib
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from database.database import Database
+from services.cache import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Content JSON larger than this moves out of the documents row into document_contents
+DOCUMENT_INLINE_MAX_BYTES = int(os.getenv('DOCUMENT_INLINE_MAX_BYTES', 16 * 1024))
+# "zlib" or "none"
+DOCUMENT_CONTENT_COMPRESSION = os.getenv('DOCUMENT_CONTENT_COMPRESSION', 'zlib').lower()
+DOCUMENT_CONTENT_COMPRESSION_LEVEL = int(os.getenv('DOCUMENT_CONTENT_COMPRESSION_LEVEL', 6))
+DOCUMENT_CONTENT_CACHE_SIZE = int(os.getenv('DOCUMENT_CONTENT_CACHE_SIZE', 256))
+# Unreferenced bodies younger than this are kept; a save may be about to point at them
+DOCUMENT_CONTENT_GC_GRACE_SECONDS = int(os.getenv('DOCUMENT_CONTENT_GC_GRACE_SECONDS', 3600))
+
+IDENTITY = "identity"
+ZLIB = "zlib"
+
+# Bodies are immutable per hash, so cached entries never go stale
+content_cache = LRUCache("document_contents", maxsize=DOCUMENT_CONTENT_CACHE_SIZE)
+
+class ContentStore:
+    """Content-addressed storage for large document bodies
+
+    ``documents.content`` keeps small content inline. Larger content is
+    written once per SHA-256 to ``document_contents``, compressed when that
+    pays off, and the row stores only ``content_hash``, so metadata queries
+    and scans don't drag the body through the buffer pool.
+    """
+
+    @staticmethod
+    def store(content_json: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """(content, content_hash) to write to a documents row for ``content_json``"""
+        if content_json is None:
+            return None, None
+        data = content_json.encode('utf-8')
+        if len(data) <= DOCUMENT_INLINE_MAX_BYTES:
+            return content_json, None
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        encoding, body = IDENTITY, data
+        if DOCUMENT_CONTENT_COMPRESSION == ZLIB:
+            compressed = zlib.compress(data, DOCUMENT_CONTENT_COMPRESSION_LEVEL)
+            if len(compressed) < len(data) * 0.9:
+                encoding, body = ZLIB, compressed
+        # Touching an existing body restarts its GC grace period
+        Database.execute_query(
+            """
+            INSERT INTO document_contents (hash, encoding, size, body) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE updated_at = CURRENT_TIMESTAMP
+            """,
+            (content_hash, encoding, len(data), body)
+        )
+        content_cache.set(content_hash, data)
+        return None, content_hash
+
+    @staticmethod
+    def load(content_hash: str) -> Optional[bytes]:
+        """Content JSON stored under ``content_hash``"""
+        return ContentStore.load_many([content_hash]).get(content_hash)
+
+    @staticmethod
+    def load_many(content_hashes: Iterable[str]) -> Dict[str, bytes]:
+        """{hash: content JSON} for every stored hash, in one query for the uncached ones"""
+        found = {}
+        missing = []
+        for content_hash in dict.fromkeys(content_hashes):
+            data = content_cache.get(content_hash)
+            if data is not None:
+                found[content_hash] = data
+            else:
+                missing.append(content_hash)
+        if missing:
+            ContentStore._fetch(missing, found)
+        # The documents row may have come from a replica further ahead than this one
+        missing = [content_hash for content_hash in missing if content_hash not in found]
+        if missing:
+            with Database.primary():
+                ContentStore._fetch(missing, found)
+        return found
+
+    @staticmethod
+    def collect_garbage() -> int:
+        """Delete bodies no document points at any more; returns how many"""
+        return Database.execute_query(
+            """
+            DELETE dc FROM document_contents dc
+            LEFT JOIN documents d ON d.content_hash = dc.hash
+            WHERE d.id IS NULL AND dc.updated_at < NOW() - INTERVAL %s SECOND
+            """,
+            (DOCUMENT_CONTENT_GC_GRACE_SECONDS,)
+        )
+
+    @staticmethod
+    def _fetch(content_hashes: List[str], found: Dict[str, bytes]):
+        placeholders = ", ".join(["%s"] * len(content_hashes))
+        rows = Database.execute_query(
+            f"SELECT hash, encoding, body FROM document_contents WHERE hash IN ({placeholders})",
+            content_hashes,
+            fetch=True
+        )
+        for row in rows:
+            data = ContentStore._decode(row['encoding'], row['body'])
+            content_cache.set(row['hash'], data)
+            found[row['hash']] = data
+
+    @staticmethod
+    def _decode(encoding: str, body: bytes) -> bytes:
+        body = bytes(body)
+        if encoding == ZLIB:
+            return zlib.decompress(body)
+        if encoding == IDENTITY:
+            return body
+        raise ValueError(f"Unknown content encoding '{encoding}'")
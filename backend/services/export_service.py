@@ -0,0 +1,351 @@
+import io
+import math
+import os
+import re
+import uuid
+import glob
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from models.models import DocumentResponse, DocumentType, ExportFormat
+from services.spreadsheet_service import SpreadsheetService
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'wps_exports'))
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# PDF page layout (US Letter, Helvetica 10pt)
+PDF_PAGE_WIDTH = 612
+PDF_PAGE_HEIGHT = 792
+PDF_MARGIN = 54
+PDF_FONT_SIZE = 10
+PDF_LEADING = 14
+PDF_LINE_CHARS = 95
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+
+# Excel sheet titles: at most 31 characters, none of these, unique ignoring case
+XLSX_TITLE_LENGTH = 31
+XLSX_TITLE_INVALID = re.compile(r"[\[\]:*?/\\]")
+# Text exported as a number; anything else (leading zeros, "1_000", padding) stays text
+XLSX_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+# Excel keeps 15 significant digits, so longer integers (IDs, card numbers) stay text
+XLSX_MAX_INTEGER_DIGITS = 15
+
+class ExportService:
+    MEDIA_TYPES = {
+        ExportFormat.XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ExportFormat.DOCX: "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        ExportFormat.PDF: "application/pdf",
+    }
+
+    @staticmethod
+    def export_document(document: DocumentResponse, export_format: ExportFormat) -> str:
+        """Return path of the cached export, generating it on first request"""
+        export_path = ExportService._cache_path(document.id, document.version, export_format)
+        if os.path.exists(export_path):
+            return export_path
+
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        # Write to a private temp file so concurrent exports never serve a partial file
+        tmp_path = f"{export_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as output:
+                ExportService._write(document, export_format, output)
+            os.replace(tmp_path, export_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        ExportService._evict_stale_versions(document.id, document.version)
+        return export_path
+
+    @staticmethod
+    def export_bytes(document: DocumentResponse, export_format: ExportFormat) -> bytes:
+        """Generate an export without caching it, for a document showing unwritten autosaves"""
+        output = io.BytesIO()
+        ExportService._write(document, export_format, output)
+        return output.getvalue()
+
+    @staticmethod
+    def iter_file(path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream a file in fixed-size chunks"""
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    @staticmethod
+    def export_filename(document: DocumentResponse, export_format: ExportFormat) -> str:
+        """Build a download filename from the document title"""
+        safe_title = "".join(c if c.isalnum() or c in " -_." else "_" for c in document.title).strip()
+        return f"{safe_title or 'document'}.{export_format.value}"
+
+    @staticmethod
+    def _write(document: DocumentResponse, export_format: ExportFormat, output):
+        writers = {
+            ExportFormat.XLSX: ExportService._write_xlsx,
+            ExportFormat.DOCX: ExportService._write_docx,
+            ExportFormat.PDF: ExportService._write_pdf,
+        }
+        writers[export_format](document, output)
+
+    @staticmethod
+    def _cache_path(document_id: str, version: int, export_format: ExportFormat) -> str:
+        safe_id = os.path.basename(document_id)
+        return os.path.join(EXPORT_CACHE_DIR, f"{safe_id}_v{version}.{export_format.value}")
+
+    @staticmethod
+    def _evict_stale_versions(document_id: str, version: int):
+        """Remove cached exports of older document versions"""
+        safe_id = os.path.basename(document_id)
+        current_prefix = f"{safe_id}_v{version}."
+        for path in glob.glob(os.path.join(EXPORT_CACHE_DIR, f"{glob.escape(safe_id)}_v*")):
+            name = os.path.basename(path)
+            if name.startswith(current_prefix) or name.endswith('.tmp'):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # Content traversal
+
+    @staticmethod
+    def _iter_rows(document: DocumentResponse) -> Iterator[Tuple[str, List[Any]]]:
+        """Yield (sheet_name, row) pairs for any document type"""
+        content = document.content or {}
+        if document.document_type == DocumentType.SPREADSHEET:
+            # Formulas are exported as the values they compute
+            for index, sheet in enumerate(SpreadsheetService.evaluate(document)):
+                sheet_name = sheet.get('name') or f"Sheet{index + 1}"
+                for row in sheet.get('data', []):
+                    yield sheet_name, row if isinstance(row, list) else [row]
+        elif document.document_type == DocumentType.PRESENTATION:
+            for slide in content.get('slides', []):
+                yield "Slides", [slide.get('id'), slide.get('title', ''), slide.get('content', '')]
+        else:
+            for _, text in ExportService._iter_paragraphs(document):
+                yield "Sheet1", [text]
+
+    @staticmethod
+    def _iter_paragraphs(document: DocumentResponse) -> Iterator[Tuple[Optional[str], str]]:
+        """Yield (style, text) pairs for any document type"""
+        content = document.content or {}
+        if document.document_type == DocumentType.SPREADSHEET:
+            for sheet in SpreadsheetService.evaluate(document):
+                yield 'Heading 2', sheet.get('name', '')
+                for row in sheet.get('data', []):
+                    cells = row if isinstance(row, list) else [row]
+                    yield None, "\t".join("" if cell is None else str(cell) for cell in cells)
+        elif document.document_type == DocumentType.PRESENTATION:
+            for slide in content.get('slides', []):
+                yield 'Heading 1', str(slide.get('title', ''))
+                if slide.get('content'):
+                    yield None, str(slide['content'])
+        elif document.document_type == DocumentType.PDF:
+            for page in content.get('pages', []):
+                text = page.get('text', '') if isinstance(page, dict) else str(page)
+                for line in text.splitlines():
+                    yield None, line
+        else:
+            yield from ExportService._iter_writer_blocks(content)
+
+    @staticmethod
+    def _iter_writer_blocks(node: Any, list_depth: int = 0) -> Iterator[Tuple[Optional[str], str]]:
+        """Walk a rich-text JSON tree and yield one entry per block node"""
+        if isinstance(node, str):
+            yield None, node
+            return
+        if not isinstance(node, dict):
+            return
+
+        node_type = node.get('type')
+        if node_type in ('paragraph', 'heading', 'codeBlock'):
+            style = None
+            if node_type == 'heading':
+                level = (node.get('attrs') or {}).get('level', 1)
+                style = f"Heading {min(max(int(level), 1), 9)}"
+            elif list_depth:
+                style = 'List Bullet'
+            yield style, ExportService._inline_text(node)
+            return
+
+        depth = list_depth + 1 if node_type in ('bulletList', 'orderedList') else list_depth
+        for child in node.get('content', []) or []:
+            yield from ExportService._iter_writer_blocks(child, depth)
+
+    @staticmethod
+    def _inline_text(node: Dict[str, Any]) -> str:
+        parts = []
+        for child in node.get('content', []) or []:
+            if child.get('type') == 'hardBreak':
+                parts.append("\n")
+            elif 'text' in child:
+                parts.append(child['text'])
+            else:
+                parts.append(ExportService._inline_text(child))
+        return "".join(parts)
+
+    # Writers
+
+    @staticmethod
+    def _write_xlsx(document: DocumentResponse, output):
+        """Write rows through a write-only workbook, which spools them to disk"""
+        # openpyxl and python-docx are imported on first export; they dominate startup otherwise
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheets = {}
+        titles = set()
+        for sheet_name, row in ExportService._iter_rows(document):
+            worksheet = sheets.get(sheet_name)
+            if worksheet is None:
+                worksheet = workbook.create_sheet(title=ExportService._xlsx_title(sheet_name, titles))
+                sheets[sheet_name] = worksheet
+            worksheet.append([ExportService._xlsx_cell(cell) for cell in row])
+        if not sheets:
+            workbook.create_sheet(title="Sheet1")
+        workbook.save(output)
+
+    @staticmethod
+    def _xlsx_title(sheet_name: Any, taken: set) -> str:
+        """A title Excel accepts for the sheet, numbered if it collides with one in ``taken``"""
+        title = XLSX_TITLE_INVALID.sub("_", str(sheet_name)).strip("'")[:XLSX_TITLE_LENGTH] or "Sheet"
+        candidate, number = title, 1
+        while candidate.lower() in taken:
+            number += 1
+            suffix = f" ({number})"
+            candidate = title[:XLSX_TITLE_LENGTH - len(suffix)] + suffix
+        taken.add(candidate.lower())
+        return candidate
+
+    @staticmethod
+    def _xlsx_cell(value: Any) -> Any:
+        if isinstance(value, str):
+            match = XLSX_NUMBER.fullmatch(value)
+            if not match:
+                return value
+            if match.group(1) or match.group(2):
+                number = float(value)
+                return number if math.isfinite(number) else value
+            return int(value) if len(value.lstrip("-")) <= XLSX_MAX_INTEGER_DIGITS else value
+        if value is None or isinstance(value, (int, float, bool)):
+            return value
+        return str(value)
+
+    @staticmethod
+    def _write_docx(document: DocumentResponse, output):
+        """Append paragraphs one at a time to a DOCX document"""
+        from docx import Document as DocxDocument
+        docx = DocxDocument()
+        docx.add_heading(document.title, level=0)
+        for style, text in ExportService._iter_paragraphs(document):
+            try:
+                docx.add_paragraph(text, style=style)
+            except KeyError:
+                docx.add_paragraph(text)
+        docx.save(output)
+
+    @staticmethod
+    def _write_pdf(document: DocumentResponse, output):
+        """Write a text-only PDF page by page without holding the page list in memory"""
+        writer = _PdfTextWriter(output)
+        writer.begin()
+        page_lines = []
+        for line in ExportService._iter_pdf_lines(document):
+            page_lines.append(line)
+            if len(page_lines) == PDF_LINES_PER_PAGE:
+                writer.add_page(page_lines)
+                page_lines = []
+        if page_lines or writer.page_count == 0:
+            writer.add_page(page_lines)
+        writer.end(document.title)
+
+    @staticmethod
+    def _iter_pdf_lines(document: DocumentResponse) -> Iterator[str]:
+        yield document.title
+        yield ""
+        for _, text in ExportService._iter_paragraphs(document):
+            for raw_line in (text or "").expandtabs(4).splitlines() or [""]:
+                while len(raw_line) > PDF_LINE_CHARS:
+                    split_at = raw_line.rfind(" ", 0, PDF_LINE_CHARS)
+                    if split_at <= 0:
+                        split_at = PDF_LINE_CHARS
+                    yield raw_line[:split_at]
+                    raw_line = raw_line[split_at:].lstrip()
+                yield raw_line
+
+class _PdfTextWriter:
+    """Minimal incremental PDF writer; only object offsets are kept in memory"""
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    FONT_ID = 3
+
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 4
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_ids)
+
+    def begin(self):
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(self.FONT_ID, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    def add_page(self, lines: List[str]):
+        commands = [f"BT /F1 {PDF_FONT_SIZE} Tf {PDF_LEADING} TL {PDF_MARGIN} {PDF_PAGE_HEIGHT - PDF_MARGIN} Td".encode()]
+        for line in lines:
+            commands.append(b"(" + self._escape(line) + b") Tj T*")
+        commands.append(b"ET")
+        stream = b"\n".join(commands)
+
+        content_id = self._allocate_id()
+        self._write_object(content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+        page_id = self._allocate_id()
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {self.FONT_ID} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        self.page_ids.append(page_id)
+
+    def end(self, title: str):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode())
+
+        info_id = self._allocate_id()
+        self._write_object(info_id, b"<< /Title (" + self._escape(title) + b") /Producer (WPS Office Clone) >>")
+
+        xref_position = self.position
+        self._write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for object_id in range(1, self.next_id):
+            self._write(f"{self.offsets[object_id]:010d} 00000 n \n".encode())
+        self._write((
+            f"trailer\n<< /Size {self.next_id} /Root {self.CATALOG_ID} 0 R /Info {info_id} 0 R >>\n"
+            f"startxref\n{xref_position}\n%%EOF\n"
+        ).encode())
+
+    def _allocate_id(self) -> int:
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def _write_object(self, object_id: int, body: bytes):
+        self.offsets[object_id] = self.position
+        self._write(b"%d 0 obj\n" % object_id + body + b"\nendobj\n")
+
+    def _write(self, data: bytes):
+        self.output.write(data)
+        self.position += len(data)
+
+    @staticmethod
+    def _escape(text: str) -> bytes:
+        encoded = text.encode('cp1252', errors='replace')
+        return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
@@ -0,0 +1,1086 @@
+import re
+import math
+from bisect import bisect_left, bisect_right
+from collections import deque
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+# Spreadsheet formulas, as typed into cells of content.sheets[].data:
+#   "=SUM(B2:B10)*1.2"   "=IF(C2>100,\"high\",\"low\")"   "=VLOOKUP(A2,'Price list'!A:C,3,FALSE)"
+# References are A1-style with optional $ and sheet name; whole columns (A:C) are allowed.
+# Inside the engine rows and columns are zero-based.
+MAX_ROWS = 1048576
+MAX_COLUMNS = 16384
+
+# (sheet name, row, column)
+CellKey = Tuple[str, int, int]
+
+class CellError(str):
+    """An error value such as #DIV/0!; it propagates through formulas as in Excel"""
+
+DIV_ZERO = CellError("#DIV/0!")
+VALUE = CellError("#VALUE!")
+REF = CellError("#REF!")
+NAME = CellError("#NAME?")
+NA = CellError("#N/A")
+NUM = CellError("#NUM!")
+SYNTAX = CellError("#ERROR!")
+ERRORS = {error: error for error in (DIV_ZERO, VALUE, REF, NAME, NA, NUM, SYNTAX)}
+# Given to every cell on, or depending on, a reference cycle
+CYCLE = REF
+
+class FormulaSyntaxError(ValueError):
+    """Formula text that doesn't parse"""
+
+class _Error(Exception):
+    """Unwinds evaluation when an operand is an error value"""
+
+    def __init__(self, error: CellError):
+        super().__init__(error)
+        self.error = error
+
+TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+   |(?P<string>"(?:[^"]|"")*")
+   |(?P<ref>(?:(?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?
+        (?:\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3})(?![\w(]))
+   |(?P<error>\#(?:DIV/0!|VALUE!|REF!|NAME\?|N/A|NUM!|ERROR!))
+   |(?P<name>[A-Za-z_][\w.]*)
+   |(?P<op><>|<=|>=|[-+*/^&=<>%(),])
+)""", re.VERBOSE)
+REFERENCE_PATTERN = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d*)(?::\$?([A-Za-z]{1,3})\$?(\d*))?$")
+# First characters of text that may be a number
+NUMERIC_START = frozenset("0123456789+-. ")
+# Numeric text shown as its number; other numeric text ("007", " 12", "+5") computes as one but shows as typed
+PLAIN_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+# Binding power of binary operators, loosest first; all are left-associative as in Excel
+BINARY_POWER = {"=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1, "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5}
+PREFIX_POWER = 6
+# Recalculations reaching more cells than this find range readers in one pass over all formulas
+RANGE_SCAN_MIN_CELLS = 64
+
+# Node trees are tuples:
+#   ("lit", value)  ("ref", sheet, row, col)  ("range", sheet, r0, c0, r1, c1)
+#   ("neg", node)  ("pct", node)  ("bin", op, left, right)  ("call", NAME, [nodes])
+
+def tokenize(formula: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    formula = formula.rstrip()
+    while position < len(formula):
+        match = TOKEN_PATTERN.match(formula, position)
+        if not match or match.end() == position:
+            raise FormulaSyntaxError(f"Unexpected character at {position}")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+def parse_formula(formula: str, sheet: str):
+    """Parse the text after '=' into a node tree; references without a sheet name are on ``sheet``"""
+    parser = _Parser(tokenize(formula), sheet)
+    node = parser.expression(0)
+    if parser.position != len(parser.tokens):
+        raise FormulaSyntaxError(f"Unexpected '{parser.tokens[parser.position][1]}'")
+    return node
+
+class _Parser:
+    """Pratt parser over the token list"""
+
+    def __init__(self, tokens: List[Tuple[str, str]], sheet: str):
+        self.tokens = tokens
+        self.position = 0
+        self.sheet = sheet
+
+    def peek(self) -> Tuple[Optional[str], str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, "")
+
+    def next(self) -> Tuple[Optional[str], str]:
+        token = self.peek()
+        if token[0] is None:
+            raise FormulaSyntaxError("Formula ends unexpectedly")
+        self.position += 1
+        return token
+
+    def expect(self, text: str):
+        if self.next() != ("op", text):
+            raise FormulaSyntaxError(f"Expected '{text}'")
+
+    def expression(self, min_power: int):
+        left = self.prefix()
+        while True:
+            kind, text = self.peek()
+            if kind != "op":
+                break
+            if text == "%":
+                self.position += 1
+                left = ("pct", left)
+                continue
+            power = BINARY_POWER.get(text)
+            if power is None or power <= min_power:
+                break
+            self.position += 1
+            left = ("bin", text, left, self.expression(power))
+        return left
+
+    def prefix(self):
+        kind, text = self.next()
+        if kind == "number":
+            return ("lit", float(text))
+        if kind == "string":
+            return ("lit", text[1:-1].replace('""', '"'))
+        if kind == "error":
+            return ("lit", ERRORS[text])
+        if kind == "ref":
+            return parse_reference(text, self.sheet)
+        if kind == "name":
+            name = text.upper()
+            if self.peek() == ("op", "("):
+                self.position += 1
+                return ("call", name, self.arguments())
+            if name in ("TRUE", "FALSE"):
+                return ("lit", name == "TRUE")
+            return ("lit", NAME)
+        if text in ("-", "+"):
+            operand = self.expression(PREFIX_POWER)
+            return ("neg", operand) if text == "-" else operand
+        if text == "(":
+            node = self.expression(0)
+            self.expect(")")
+            return node
+        raise FormulaSyntaxError(f"Unexpected '{text}'")
+
+    def arguments(self) -> list:
+        args = []
+        if self.peek() == ("op", ")"):
+            self.position += 1
+            return args
+        while True:
+            # An omitted argument, as in IF(A1,,0)
+            if self.peek() in (("op", ","), ("op", ")")):
+                args.append(("lit", None))
+            else:
+                args.append(self.expression(0))
+            kind, text = self.next()
+            if text == ")":
+                return args
+            if text != ",":
+                raise FormulaSyntaxError("Expected ',' or ')'")
+
+def parse_reference(text: str, sheet: str):
+    """A ref or range node for a reference like B2, $A$1:C3, A:A or 'My sheet'!B2"""
+    if "!" in text:
+        sheet, text = text.rsplit("!", 1)
+        if sheet.startswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+    letters0, digits0, letters1, digits1 = REFERENCE_PATTERN.match(text).groups()
+    c0, r0 = column_index(letters0), int(digits0) - 1 if digits0 else None
+    if letters1 is None:
+        if c0 >= MAX_COLUMNS or not 0 <= r0 < MAX_ROWS:
+            return ("lit", REF)
+        return ("ref", sheet, r0, c0)
+    c1, r1 = column_index(letters1), int(digits1) - 1 if digits1 else None
+    if max(c0, c1) >= MAX_COLUMNS or (r0 is not None and not (0 <= r0 < MAX_ROWS and 0 <= r1 < MAX_ROWS)):
+        return ("lit", REF)
+    if r0 is None:
+        # Whole columns
+        r0, r1 = 0, MAX_ROWS - 1
+    return ("range", sheet, min(r0, r1), min(c0, c1), max(r0, r1), max(c0, c1))
+
+@lru_cache(maxsize=4096)
+def column_index(letters: str) -> int:
+    """Zero-based column of letters such as A or AB"""
+    column = 0
+    for letter in letters.upper():
+        column = column * 26 + ord(letter) - 64
+    return column - 1
+
+def references(node, cells: Optional[Set[CellKey]] = None, ranges: Optional[list] = None):
+    """(cells, ranges) a node tree reads; ranges are (sheet, r0, c0, r1, c1)"""
+    cells = set() if cells is None else cells
+    ranges = [] if ranges is None else ranges
+    kind = node[0]
+    if kind == "ref":
+        cells.add(node[1:])
+    elif kind == "range":
+        ranges.append(node[1:])
+    elif kind in ("neg", "pct"):
+        references(node[1], cells, ranges)
+    elif kind == "bin":
+        references(node[2], cells, ranges)
+        references(node[3], cells, ranges)
+    elif kind == "call":
+        for arg in node[2]:
+            references(arg, cells, ranges)
+    return cells, ranges
+
+def parse_number(text: str) -> Optional[float]:
+    """The number in a cell's text, or None if it isn't one"""
+    if "_" in text:
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+def parse_input(raw: Any) -> Tuple[Optional[str], Any]:
+    """(formula text, None) for a formula cell, else (None, literal value)"""
+    if raw is None or raw == "":
+        return None, None
+    if isinstance(raw, bool):
+        return None, raw
+    if isinstance(raw, (int, float)):
+        return None, float(raw)
+    if not isinstance(raw, str):
+        return None, str(raw)
+    if raw[0] == "=" and len(raw) > 1:
+        return raw[1:], None
+    number = parse_number(raw)
+    return None, raw if number is None else number
+
+# Value coercion, following Excel
+
+def to_number(value: Any) -> float:
+    if isinstance(value, CellError):
+        raise _Error(value)
+    if value is None:
+        return 0.0
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    if isinstance(value, str):
+        number = parse_number(value)
+        if number is not None:
+            return number
+    raise _Error(VALUE)
+
+def to_text(value: Any) -> str:
+    if isinstance(value, CellError):
+        raise _Error(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else format(value, ".15g")
+    return str(value)
+
+def to_bool(value: Any) -> bool:
+    if isinstance(value, str) and not isinstance(value, CellError):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        raise _Error(VALUE)
+    return to_number(value) != 0
+
+def display_value(value: Any) -> Any:
+    """A cell value as written to JSON and exports: whole numbers as ints"""
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return int(value)
+    return value
+
+class Sheet:
+    """Evaluated values of one sheet, kept as NumPy arrays so ranges are slices"""
+
+    def __init__(self, name: str, inputs: List[list]):
+        self.name = name
+        # Raw cell contents as stored in the document, for diffing the next version against
+        self.inputs = inputs
+        rows = len(inputs)
+        columns = max((len(row) for row in inputs), default=0)
+        self.values = np.full((rows, columns), None, dtype=object)
+        # The numeric value of each cell, NaN for text, booleans, errors and blanks
+        self.numbers = np.full((rows, columns), np.nan)
+        self.errors = np.zeros((rows, columns), dtype=bool)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.values.shape
+
+    def ensure(self, rows: int, columns: int):
+        """Grow the arrays to hold a cell outside the current data"""
+        old_rows, old_columns = self.shape
+        if rows <= old_rows and columns <= old_columns:
+            return
+        shape = (max(rows, old_rows), max(columns, old_columns))
+        for name, fill in (("values", None), ("numbers", np.nan), ("errors", False)):
+            old = getattr(self, name)
+            grown = np.full(shape, fill, dtype=old.dtype)
+            grown[:old_rows, :old_columns] = old
+            setattr(self, name, grown)
+
+    def set(self, row: int, column: int, value: Any):
+        self.values[row, column] = value
+        self.numbers[row, column] = value if isinstance(value, float) else np.nan
+        self.errors[row, column] = isinstance(value, CellError)
+
+    def get(self, row: int, column: int) -> Any:
+        rows, columns = self.shape
+        return self.values[row, column] if row < rows and column < columns else None
+
+    def load_column(self, column: int) -> List[int]:
+        """Fill in literal values of a column from the inputs; returns the rows holding formulas"""
+        cells = [row[column] if column < len(row) else None for row in self.inputs]
+        # Fast path: numbers or numeric text all the way down, possibly under a header
+        for start in (0, 1):
+            try:
+                # fromiter keeps a list cell as one element; np.array would spread it over a new axis
+                numbers = np.fromiter(cells[start:], dtype=object, count=len(cells) - start).astype(np.float64)
+            except (TypeError, ValueError):
+                continue
+            if np.isfinite(numbers).all():
+                self.numbers[start:, column] = numbers
+                self.values[start:, column] = numbers.astype(object)
+                return self._load_cells(column, cells[:start])
+        return self._load_cells(column, cells)
+
+    def _load_cells(self, column: int, cells: List[Any]) -> List[int]:
+        values: List[Any] = [None] * len(cells)
+        numbers = [math.nan] * len(cells)
+        formula_rows = []
+        for row, cell in enumerate(cells):
+            if cell.__class__ is str:
+                # Cheap checks first; most cells are plain text
+                if not cell:
+                    continue
+                if cell[0] == "=" and len(cell) > 1:
+                    formula_rows.append(row)
+                    continue
+                number = parse_number(cell) if cell[0] in NUMERIC_START else None
+                values[row] = cell if number is None else number
+            elif cell is not None:
+                values[row] = parse_input(cell)[1]
+            if values[row].__class__ is float:
+                numbers[row] = values[row]
+        self.values[:len(cells), column] = values
+        self.numbers[:len(cells), column] = numbers
+        return formula_rows
+
+    def grid(self) -> List[List[Any]]:
+        """Evaluated rows, each as long as the stored row"""
+        values = self.values.copy()
+        numbers = self.numbers
+        with np.errstate(invalid="ignore"):
+            whole = np.isfinite(numbers) & (np.abs(numbers) < 1e15)
+            whole &= numbers == np.floor(numbers)
+        values[whole] = numbers[whole].astype(np.int64).astype(object)
+        rows = []
+        for row, source in zip(values.tolist(), self.inputs):
+            row = row[:len(source)]
+            for column, cell in enumerate(source):
+                if cell.__class__ is str and cell and cell[0] in NUMERIC_START and not PLAIN_NUMBER.fullmatch(cell):
+                    row[column] = cell
+            rows.append(row)
+        return rows
+
+class Range:
+    """A rectangle of cells passed to a function; arrays have the range's shape even past the data"""
+
+    def __init__(self, sheet: Sheet, r0: int, c0: int, r1: int, c1: int):
+        if r1 == MAX_ROWS - 1 and r0 == 0:
+            # Whole columns stop at the last row with data
+            r1 = max(sheet.shape[0] - 1, 0)
+        self.sheet = sheet
+        self.r0, self.c0 = r0, c0
+        self.shape = (r1 - r0 + 1, c1 - c0 + 1)
+
+    def _slice(self, array: np.ndarray, fill) -> np.ndarray:
+        part = array[self.r0:self.r0 + self.shape[0], self.c0:self.c0 + self.shape[1]]
+        if part.shape == self.shape:
+            return part
+        padded = np.full(self.shape, fill, dtype=array.dtype)
+        padded[:part.shape[0], :part.shape[1]] = part
+        return padded
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._slice(self.sheet.values, None)
+
+    @property
+    def numbers(self) -> np.ndarray:
+        return self._slice(self.sheet.numbers, np.nan)
+
+    def check_errors(self):
+        """Raise the first error value in the range"""
+        errors = self._slice(self.sheet.errors, False)
+        if errors.any():
+            raise _Error(self.values[errors][0])
+
+    def value(self, row: int, column: int) -> Any:
+        return self.sheet.get(self.r0 + row, self.c0 + column)
+
+    def resized(self, shape: Tuple[int, int]) -> "Range":
+        """A range of ``shape`` with the same top-left cell, as SUMIF reads its sum range"""
+        return Range(self.sheet, self.r0, self.c0, self.r0 + shape[0] - 1, self.c0 + shape[1] - 1)
+
+    def vector(self) -> "Range":
+        """This range if it is one row or column; lookups need that"""
+        if 1 not in self.shape:
+            raise _Error(NA)
+        return self
+
+class RangeIndex:
+    """Ranges read by formulas on one sheet, searched for a cell with one NumPy comparison"""
+
+    def __init__(self):
+        self.bounds: List[Tuple[int, int, int, int]] = []
+        self.readers: List[CellKey] = []
+        self._array: Optional[np.ndarray] = None
+
+    def add(self, bounds: Tuple[int, int, int, int], reader: CellKey):
+        self.bounds.append(bounds)
+        self.readers.append(reader)
+        self._array = None
+
+    def discard(self, readers: Set[CellKey]):
+        """Drop every range read by ``readers``, in one pass for a whole batch of edits"""
+        kept = [(bounds, reader) for bounds, reader in zip(self.bounds, self.readers) if reader not in readers]
+        self.bounds = [bounds for bounds, _ in kept]
+        self.readers = [reader for _, reader in kept]
+        self._array = None
+
+    def readers_of(self, row: int, column: int) -> List[CellKey]:
+        if not self.bounds:
+            return []
+        if self._array is None:
+            self._array = np.array(self.bounds, dtype=np.int64)
+        a = self._array
+        hits = np.flatnonzero((a[:, 0] <= row) & (row <= a[:, 2]) & (a[:, 1] <= column) & (column <= a[:, 3]))
+        return [self.readers[i] for i in hits]
+
+class Workbook:
+    """Evaluated values of a spreadsheet document's sheets
+
+    Formulas form a dependency graph: direct references are indexed per cell
+    and ranges per sheet. Editing cells re-evaluates just the formulas that
+    depend on them, in topological order; formulas on a reference cycle get
+    #REF!. Range functions work on NumPy slices of each sheet's values.
+    """
+
+    def __init__(self, sheets: List[Dict[str, Any]]):
+        self.names = self.sheet_names(sheets)
+        self.sheets: Dict[str, Sheet] = {}
+        self.formulas: Dict[CellKey, Any] = {}
+        self.precedents: Dict[CellKey, Tuple[Set[CellKey], list]] = {}
+        self.cell_readers: Dict[CellKey, Set[CellKey]] = {}
+        self.range_readers: Dict[str, RangeIndex] = {}
+        # Formulas evaluated since this workbook was built
+        self.evaluations = 0
+
+        formula_cells = []
+        for name, sheet_content in zip(self.names, sheets):
+            sheet = Sheet(name, self._rows(sheet_content))
+            self.sheets[name] = sheet
+            for column in range(sheet.shape[1]):
+                for row in sheet.load_column(column):
+                    formula_cells.append((name, row, column, sheet.inputs[row][column]))
+        for name, row, column, raw in formula_cells:
+            self._track((name, row, column), raw[1:])
+        self._recalculate(self.formulas.keys())
+
+    @staticmethod
+    def sheet_names(sheets: List[Dict[str, Any]]) -> List[str]:
+        names = []
+        for index, sheet in enumerate(sheets):
+            name = sheet.get('name') or f"Sheet{index + 1}"
+            # References can only reach the first of two sheets with the same name
+            names.append(name if name not in names else f"{name} ({index + 1})")
+        return names
+
+    @staticmethod
+    def _rows(sheet_content: Dict[str, Any]) -> List[list]:
+        return [row if isinstance(row, list) else [row] for row in sheet_content.get('data') or []]
+
+    def values(self) -> List[Dict[str, Any]]:
+        """The sheets with every formula replaced by its value"""
+        return [{"name": name, "data": self.sheets[name].grid()} for name in self.names]
+
+    def update(self, sheets: List[Dict[str, Any]]) -> bool:
+        """Recalculate for a newer version of the sheets; False if sheets were added, removed or renamed"""
+        if self.sheet_names(sheets) != self.names:
+            return False
+        changes = []
+        for name, sheet_content in zip(self.names, sheets):
+            sheet = self.sheets[name]
+            old_rows, new_rows = sheet.inputs, self._rows(sheet_content)
+            for row in range(max(len(old_rows), len(new_rows))):
+                old = old_rows[row] if row < len(old_rows) else []
+                new = new_rows[row] if row < len(new_rows) else []
+                if old == new:
+                    continue
+                for column in range(max(len(old), len(new))):
+                    before = old[column] if column < len(old) else None
+                    after = new[column] if column < len(new) else None
+                    if before != after or type(before) is not type(after):
+                        changes.append((name, row, column, after))
+            sheet.inputs = new_rows
+        self.set_cells(changes)
+        return True
+
+    def set_cells(self, changes: Iterable[Tuple[str, int, int, Any]]):
+        """Store new raw contents for cells and recalculate what depends on them"""
+        changes = list(changes)
+        replaced = set()
+        for name, row, column, _ in changes:
+            key = (name, row, column)
+            if key in self.formulas:
+                replaced.add(key)
+                self._forget(key)
+        for index in self.range_readers.values():
+            if replaced:
+                index.discard(replaced)
+
+        changed = []
+        for name, row, column, raw in changes:
+            sheet = self.sheets.get(name)
+            if sheet is None:
+                continue
+            key = (name, row, column)
+            sheet.ensure(row + 1, column + 1)
+            formula, value = parse_input(raw)
+            if formula is not None:
+                self._track(key, formula)
+            else:
+                sheet.set(row, column, value)
+            changed.append(key)
+        self._recalculate(changed)
+
+    # Dependency graph
+
+    def _track(self, key: CellKey, formula: str):
+        try:
+            node = parse_formula(formula, key[0])
+        except FormulaSyntaxError:
+            node = ("lit", SYNTAX)
+        cells, ranges = references(node)
+        self.formulas[key] = node
+        self.precedents[key] = (cells, ranges)
+        for cell in cells:
+            self.cell_readers.setdefault(cell, set()).add(key)
+        for sheet, *bounds in ranges:
+            self.range_readers.setdefault(sheet, RangeIndex()).add(tuple(bounds), key)
+
+    def _forget(self, key: CellKey):
+        """Drop a formula's direct references; callers discard its ranges in a batch"""
+        del self.formulas[key]
+        cells, _ = self.precedents.pop(key)
+        for cell in cells:
+            readers = self.cell_readers.get(cell)
+            if readers:
+                readers.discard(key)
+                if not readers:
+                    del self.cell_readers[cell]
+
+    def _dependents(self, key: CellKey) -> List[CellKey]:
+        dependents = list(self.cell_readers.get(key, ()))
+        index = self.range_readers.get(key[0])
+        if index:
+            dependents.extend(index.readers_of(key[1], key[2]))
+        return dependents
+
+    def _readers_by_scan(self, targets: Set[CellKey]) -> Dict[CellKey, List[CellKey]]:
+        """Formulas reading each of ``targets``, from one pass over every formula's ranges
+
+        Searching the range index per cell costs formulas x ranges when a
+        whole workbook or a large paste is recalculated; here each range is
+        instead looked up in the targets, sorted by column and row.
+        """
+        readers = {key: list(self.cell_readers.get(key, ())) for key in targets}
+        located: Dict[str, Dict[int, List[int]]] = {}
+        for name, row, column in targets:
+            located.setdefault(name, {}).setdefault(column, []).append(row)
+        sorted_columns = {}
+        for name, columns in located.items():
+            for rows in columns.values():
+                rows.sort()
+            sorted_columns[name] = sorted(columns)
+        for reader, (_, ranges) in self.precedents.items():
+            for name, r0, c0, r1, c1 in ranges:
+                columns = located.get(name)
+                if columns is None:
+                    continue
+                column_list = sorted_columns[name]
+                for column in column_list[bisect_left(column_list, c0):bisect_right(column_list, c1)]:
+                    rows = columns[column]
+                    for row in rows[bisect_left(rows, r0):bisect_right(rows, r1)]:
+                        readers[(name, row, column)].append(reader)
+        return readers
+
+    def _recalculate(self, changed: Iterable[CellKey]):
+        # Everything downstream of the changed cells, plus changed cells that are formulas
+        dirty = {key for key in changed if key in self.formulas}
+        queue = deque(changed)
+        edges: Dict[CellKey, List[CellKey]] = {key: None for key in queue}
+        scanned: Optional[Dict[CellKey, List[CellKey]]] = None
+        while queue:
+            key = queue.popleft()
+            if scanned is None and len(edges) > RANGE_SCAN_MIN_CELLS:
+                # Too many cells to search the range index one by one
+                scanned = self._readers_by_scan(edges.keys() | self.formulas.keys())
+            edges[key] = scanned[key] if scanned is not None else self._dependents(key)
+            for dependent in edges[key]:
+                dirty.add(dependent)
+                if dependent not in edges:
+                    edges[dependent] = None
+                    queue.append(dependent)
+        if not dirty:
+            return
+
+        # Kahn's algorithm over the dirty formulas; whatever is left is on or behind a cycle
+        indegree = dict.fromkeys(dirty, 0)
+        for key in dirty:
+            for dependent in edges[key]:
+                indegree[dependent] += 1
+        ready = deque(key for key, count in indegree.items() if count == 0)
+        while ready:
+            key = ready.popleft()
+            self.sheets[key[0]].set(key[1], key[2], self._evaluate(key))
+            for dependent in edges[key]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+        for key, count in indegree.items():
+            if count:
+                self.sheets[key[0]].set(key[1], key[2], CYCLE)
+
+    # Evaluation
+
+    def _evaluate(self, key: CellKey) -> Any:
+        self.evaluations += 1
+        try:
+            value = self._scalar(self._eval(self.formulas[key]))
+        except _Error as e:
+            return e.error
+        except ZeroDivisionError:
+            return DIV_ZERO
+        except (OverflowError, ValueError):
+            return NUM
+        except (TypeError, IndexError, RecursionError):
+            # Wrong number of arguments, or nesting too deep to evaluate
+            return VALUE
+        if value is None:
+            return 0.0
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+            if not math.isfinite(value):
+                return NUM
+        return value
+
+    def _eval(self, node) -> Any:
+        kind = node[0]
+        if kind == "lit":
+            return node[1]
+        if kind == "ref":
+            sheet = self.sheets.get(node[1])
+            if sheet is None:
+                raise _Error(REF)
+            return sheet.get(node[2], node[3])
+        if kind == "range":
+            sheet = self.sheets.get(node[1])
+            if sheet is None:
+                raise _Error(REF)
+            return Range(sheet, *node[2:])
+        if kind == "neg":
+            return -to_number(self._scalar(self._eval(node[1])))
+        if kind == "pct":
+            return to_number(self._scalar(self._eval(node[1]))) / 100
+        if kind == "bin":
+            left = self._scalar(self._eval(node[2]))
+            right = self._scalar(self._eval(node[3]))
+            return _binary(node[1], left, right)
+        name, args = node[1], node[2]
+        if name in LAZY_FUNCTIONS:
+            return LAZY_FUNCTIONS[name](self, args)
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise _Error(NAME)
+        return function(*(self._eval(arg) for arg in args))
+
+    def _scalar(self, value: Any) -> Any:
+        """A single value where a range was given; only a one-cell range has one"""
+        if isinstance(value, Range):
+            if value.shape != (1, 1):
+                raise _Error(VALUE)
+            return value.value(0, 0)
+        return value
+
+def _binary(op: str, left: Any, right: Any) -> Any:
+    if op == "&":
+        return to_text(left) + to_text(right)
+    if op in BINARY_ARITHMETIC:
+        return BINARY_ARITHMETIC[op](to_number(left), to_number(right))
+    order = _compare(left, right)
+    return {"=": order == 0, "<>": order != 0, "<": order < 0, ">": order > 0,
+            "<=": order <= 0, ">=": order >= 0}[op]
+
+def _divide(a: float, b: float) -> float:
+    if b == 0:
+        raise _Error(DIV_ZERO)
+    return a / b
+
+BINARY_ARITHMETIC: Dict[str, Callable[[float, float], float]] = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _divide,
+    "^": math.pow,
+}
+
+def _compare(left: Any, right: Any) -> int:
+    """Excel ordering: numbers < text < booleans, text ignoring case; a blank is 0 or empty text"""
+    for value in (left, right):
+        if isinstance(value, CellError):
+            raise _Error(value)
+    if left is None:
+        left = "" if isinstance(right, str) else False if isinstance(right, bool) else 0.0
+    if right is None:
+        right = "" if isinstance(left, str) else False if isinstance(left, bool) else 0.0
+    rank_left, rank_right = _type_rank(left), _type_rank(right)
+    if rank_left != rank_right:
+        return -1 if rank_left < rank_right else 1
+    if isinstance(left, str):
+        left, right = left.lower(), right.lower()
+    return (left > right) - (left < right)
+
+def _type_rank(value: Any) -> int:
+    if isinstance(value, bool):
+        return 2
+    return 1 if isinstance(value, str) else 0
+
+# Functions: arguments arrive evaluated, with ranges as Range objects
+
+def _numbers(args) -> np.ndarray:
+    """Numbers among the arguments as one array; text and booleans in ranges are skipped"""
+    parts = []
+    for arg in args:
+        if isinstance(arg, Range):
+            arg.check_errors()
+            numbers = arg.numbers.ravel()
+            parts.append(numbers[~np.isnan(numbers)])
+        elif isinstance(arg, str) and not isinstance(arg, CellError):
+            # A label in a referenced cell doesn't count
+            number = parse_number(arg)
+            if number is not None:
+                parts.append(np.array([number]))
+        elif arg is not None:
+            parts.append(np.array([to_number(arg)]))
+    return np.concatenate(parts) if parts else np.empty(0)
+
+def _flat_values(args) -> Iterable[Any]:
+    for arg in args:
+        if isinstance(arg, Range):
+            yield from arg.values.ravel().tolist()
+        else:
+            yield arg
+
+def _average(*args):
+    numbers = _numbers(args)
+    if not numbers.size:
+        raise _Error(DIV_ZERO)
+    return float(numbers.mean())
+
+def _count(*args):
+    total = 0
+    for arg in args:
+        if isinstance(arg, Range):
+            total += int(np.count_nonzero(~np.isnan(arg.numbers)))
+        elif isinstance(arg, float):
+            total += 1
+    return float(total)
+
+def _counta(*args):
+    total = 0
+    for arg in args:
+        if isinstance(arg, Range):
+            values = arg.values
+            total += int(np.count_nonzero((values != None) & (values != "")))  # noqa: E711
+        elif arg is not None:
+            total += 1
+    return float(total)
+
+def _countblank(rng):
+    values = _as_range(rng).values
+    return float(np.count_nonzero((values == None) | (values == "")))  # noqa: E711
+
+def _stdev(*args):
+    numbers = _numbers(args)
+    if numbers.size < 2:
+        raise _Error(DIV_ZERO)
+    return float(numbers.std(ddof=1))
+
+def _median(*args):
+    numbers = _numbers(args)
+    if not numbers.size:
+        raise _Error(NUM)
+    return float(np.median(numbers))
+
+def _extreme(reducer):
+    def extreme(*args):
+        numbers = _numbers(args)
+        return float(reducer(numbers)) if numbers.size else 0.0
+    return extreme
+
+def _as_range(value) -> Range:
+    if not isinstance(value, Range):
+        raise _Error(VALUE)
+    return value
+
+def _wildcard(pattern: str) -> "re.Pattern":
+    return re.compile("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern),
+                      re.IGNORECASE | re.DOTALL)
+
+CRITERION_PATTERN = re.compile(r"(<=|>=|<>|<|>|=)?(.*)", re.DOTALL)
+
+def _criterion_mask(rng: Range, criterion: Any) -> np.ndarray:
+    """Cells of ``rng`` matching a SUMIF-style criterion such as 5, ">10", "<>done" or "app*" """
+    if isinstance(criterion, CellError):
+        raise _Error(criterion)
+    numbers, values = rng.numbers, rng.values
+    if isinstance(criterion, float):
+        return numbers == criterion
+    if isinstance(criterion, bool):
+        return np.frompyfunc(lambda v: v is criterion, 1, 1)(values).astype(bool)
+    op, operand = CRITERION_PATTERN.fullmatch(to_text(criterion)).groups()
+    op = op or "="
+    number = parse_number(operand)
+    if number is not None:
+        compare = {"=": np.equal, "<>": np.not_equal, "<": np.less, ">": np.greater,
+                   "<=": np.less_equal, ">=": np.greater_equal}[op]
+        return compare(numbers, number)
+    if operand == "":
+        blank = (values == None) | (values == "")  # noqa: E711
+        return blank if op == "=" else ~blank
+    if op in ("=", "<>"):
+        pattern = _wildcard(operand)
+        mask = np.frompyfunc(lambda v: isinstance(v, str) and pattern.fullmatch(v) is not None, 1, 1)(values)
+        mask = mask.astype(bool)
+        return mask if op == "=" else ~mask
+    target = operand.lower()
+    compare = {"<": str.__lt__, ">": str.__gt__, "<=": str.__le__, ">=": str.__ge__}[op]
+    return np.frompyfunc(lambda v: isinstance(v, str) and compare(v.lower(), target), 1, 1)(values).astype(bool)
+
+def _sumif(rng, criterion, sum_range=None):
+    rng = _as_range(rng)
+    mask = _criterion_mask(rng, criterion)
+    target = _as_range(sum_range).resized(rng.shape) if sum_range is not None else rng
+    target.check_errors()
+    return float(np.nansum(np.where(mask, target.numbers, np.nan)))
+
+def _countif(rng, criterion):
+    return float(np.count_nonzero(_criterion_mask(_as_range(rng), criterion)))
+
+def _averageif(rng, criterion, average_range=None):
+    rng = _as_range(rng)
+    mask = _criterion_mask(rng, criterion)
+    target = _as_range(average_range).resized(rng.shape) if average_range is not None else rng
+    numbers = target.numbers[mask]
+    numbers = numbers[~np.isnan(numbers)]
+    if not numbers.size:
+        raise _Error(DIV_ZERO)
+    return float(numbers.mean())
+
+def _sumproduct(*ranges):
+    arrays = []
+    for rng in ranges:
+        rng = _as_range(rng)
+        rng.check_errors()
+        if arrays and rng.shape != arrays[0].shape:
+            raise _Error(VALUE)
+        arrays.append(np.nan_to_num(rng.numbers, nan=0.0))
+    if not arrays:
+        raise _Error(VALUE)
+    return float(np.sum(np.prod(arrays, axis=0)))
+
+def _lookup_position(value: Any, values: np.ndarray, numbers: np.ndarray, mode: int) -> int:
+    """Index in a row or column of the exact match (mode 0), the largest value <= ``value``
+    (1, data sorted ascending) or the smallest >= ``value`` (-1, sorted descending)"""
+    if isinstance(value, CellError):
+        raise _Error(value)
+    if value is None:
+        raise _Error(NA)
+    if isinstance(value, float):
+        if mode == 0:
+            hits = np.flatnonzero(numbers == value)
+        else:
+            hits = np.flatnonzero(numbers <= value if mode > 0 else numbers >= value)
+    elif isinstance(value, str):
+        target = value.lower()
+        if mode == 0:
+            pattern = _wildcard(value)
+            matches = lambda v: isinstance(v, str) and pattern.fullmatch(v) is not None
+        elif mode > 0:
+            matches = lambda v: isinstance(v, str) and v.lower() <= target
+        else:
+            matches = lambda v: isinstance(v, str) and v.lower() >= target
+        hits = np.flatnonzero(np.frompyfunc(matches, 1, 1)(values).astype(bool))
+    else:
+        hits = np.flatnonzero(np.frompyfunc(lambda v: v is value, 1, 1)(values).astype(bool))
+    if not hits.size:
+        raise _Error(NA)
+    # Sorted data ends its run of candidates at the answer, as Excel's binary search would find
+    return int(hits[0] if mode == 0 else hits[-1])
+
+def _vlookup(value, table, column, approximate=True):
+    table = _as_range(table)
+    column = int(to_number(column))
+    if column < 1:
+        raise _Error(VALUE)
+    if column > table.shape[1]:
+        raise _Error(REF)
+    mode = 1 if approximate is None or to_bool(approximate) else 0
+    row = _lookup_position(value, table.values[:, 0], table.numbers[:, 0], mode)
+    return table.value(row, column - 1)
+
+def _hlookup(value, table, row, approximate=True):
+    table = _as_range(table)
+    row = int(to_number(row))
+    if row < 1:
+        raise _Error(VALUE)
+    if row > table.shape[0]:
+        raise _Error(REF)
+    mode = 1 if approximate is None or to_bool(approximate) else 0
+    column = _lookup_position(value, table.values[0, :], table.numbers[0, :], mode)
+    return table.value(row - 1, column)
+
+def _match(value, rng, match_type=1.0):
+    vector = _as_range(rng).vector()
+    mode = int(to_number(match_type))
+    mode = (mode > 0) - (mode < 0)
+    return float(_lookup_position(value, vector.values.ravel(), vector.numbers.ravel(), mode) + 1)
+
+def _index(rng, row, column=None):
+    rng = _as_range(rng)
+    row = int(to_number(row))
+    if column is None:
+        # One index into a single row counts columns
+        row, column = (1, row) if rng.shape[0] == 1 else (row, 1)
+    else:
+        column = int(to_number(column))
+    if not (1 <= row <= rng.shape[0] and 1 <= column <= rng.shape[1]):
+        raise _Error(REF)
+    return rng.value(row - 1, column - 1)
+
+def _round(number, digits=0.0):
+    digits = int(to_number(digits))
+    rounded = Decimal(repr(to_number(number))).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP)
+    return float(rounded)
+
+def _mod(number, divisor):
+    divisor = to_number(divisor)
+    if divisor == 0:
+        raise _Error(DIV_ZERO)
+    return to_number(number) % divisor
+
+def _sqrt(number):
+    number = to_number(number)
+    if number < 0:
+        raise _Error(NUM)
+    return math.sqrt(number)
+
+def _text_slice(text, start, count):
+    text = to_text(text)
+    start, count = int(to_number(start)), int(to_number(count))
+    if start < 1 or count < 0:
+        raise _Error(VALUE)
+    return text[start - 1:start - 1 + count]
+
+def _right(text, count=1.0):
+    text = to_text(text)
+    count = int(to_number(count))
+    if count < 0:
+        raise _Error(VALUE)
+    return text[len(text) - count:] if count else ""
+
+def _value(text):
+    return to_number(text)
+
+def _logical(reducer):
+    def logical(*args):
+        flags = [to_bool(value) for value in _flat_values(args) if value is not None and value != ""]
+        if not flags:
+            raise _Error(VALUE)
+        return reducer(flags)
+    return logical
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    # Aggregates, vectorized over ranges
+    "SUM": lambda *args: float(_numbers(args).sum()),
+    "AVERAGE": _average,
+    "MIN": _extreme(np.min),
+    "MAX": _extreme(np.max),
+    "COUNT": _count,
+    "COUNTA": _counta,
+    "COUNTBLANK": _countblank,
+    "PRODUCT": lambda *args: float(_numbers(args).prod()),
+    "MEDIAN": _median,
+    "STDEV": _stdev,
+    "SUMIF": _sumif,
+    "COUNTIF": _countif,
+    "AVERAGEIF": _averageif,
+    "SUMPRODUCT": _sumproduct,
+    # Lookups
+    "VLOOKUP": _vlookup,
+    "HLOOKUP": _hlookup,
+    "MATCH": _match,
+    "INDEX": _index,
+    # Math
+    "ABS": lambda number: abs(to_number(number)),
+    "INT": lambda number: float(math.floor(to_number(number))),
+    "ROUND": _round,
+    "MOD": _mod,
+    "POWER": lambda number, power: math.pow(to_number(number), to_number(power)),
+    "SQRT": _sqrt,
+    # Logic
+    "AND": _logical(all),
+    "OR": _logical(any),
+    "NOT": lambda value: not to_bool(value),
+    # Text
+    "CONCATENATE": lambda *args: "".join(to_text(arg) for arg in args),
+    "CONCAT": lambda *args: "".join(to_text(value) for value in _flat_values(args)),
+    "LEN": lambda text: float(len(to_text(text))),
+    "UPPER": lambda text: to_text(text).upper(),
+    "LOWER": lambda text: to_text(text).lower(),
+    "TRIM": lambda text: " ".join(to_text(text).split()),
+    "LEFT": lambda text, count=1.0: _text_slice(text, 1, count),
+    "RIGHT": _right,
+    "MID": _text_slice,
+    "VALUE": _value,
+    # Information
+    "ISBLANK": lambda value: value is None,
+    "ISNUMBER": lambda value: isinstance(value, float),
+    "ISTEXT": lambda value: isinstance(value, str) and not isinstance(value, CellError),
+    "ISERROR": lambda value: isinstance(value, CellError),
+    "ISNA": lambda value: isinstance(value, CellError) and value == NA,
+    "NA": lambda: NA,
+}
+
+def _if(workbook: Workbook, args: list):
+    if not 1 <= len(args) <= 3:
+        raise _Error(VALUE)
+    condition = to_bool(workbook._scalar(workbook._eval(args[0])))
+    if condition:
+        return workbook._eval(args[1]) if len(args) > 1 else True
+    return workbook._eval(args[2]) if len(args) > 2 else False
+
+def _iferror(only: Optional[CellError]):
+    def iferror(workbook: Workbook, args: list):
+        if len(args) != 2:
+            raise _Error(VALUE)
+        try:
+            value = workbook._scalar(workbook._eval(args[0]))
+        except _Error as e:
+            value = e.error
+        except (ZeroDivisionError, OverflowError, ValueError):
+            value = DIV_ZERO
+        if isinstance(value, CellError) and (only is None or value == only):
+            return workbook._eval(args[1])
+        return value
+    return iferror
+
+# Functions that decide which arguments to evaluate
+LAZY_FUNCTIONS: Dict[str, Callable[[Workbook, list], Any]] = {
+    "IF": _if,
+    "IFERROR": _iferror(None),
+    "IFNA": _iferror(NA),
+}
@@ -0,0 +1,287 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+import itertools
+from typing import Any, AsyncIterator, Dict, List, Optional
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from database.database import Database
+from models.models import AIRequest, AIResponse, AIJobCreate, AIJobResponse, JobStatus
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', 4))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv('AI_JOB_MAX_ATTEMPTS', 3))
+AI_JOB_RETRY_DELAY = float(os.getenv('AI_JOB_RETRY_DELAY', 2.0))
+# Jobs left 'running' longer than this by a dead process are queued again on startup
+AI_JOB_STALE_SECONDS = int(os.getenv('AI_JOB_STALE_SECONDS', 900))
+
+FINAL_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+class JobService:
+    """In-process priority queue running AI requests on a pool of worker tasks
+
+    Every job is persisted in ``ai_jobs`` and its result links to the
+    ``ai_processing_history`` row written by ``AIService``, so status survives
+    restarts and can be polled from any process. Workers claim a job with a
+    conditional UPDATE, which keeps several server processes from running the
+    same job.
+    """
+
+    def __init__(self, ai_service, admission=None, workers: int = AI_JOB_WORKERS):
+        self.ai_service = ai_service
+        # Jobs share AI capacity with synchronous requests when an AdmissionController is given
+        self.admission = admission
+        self.worker_count = workers
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._retry_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # Job each busy worker is running
+        self._running: Dict[asyncio.Task, str] = {}
+        self._draining = False
+
+    async def start(self):
+        """Recover unfinished jobs and start the worker tasks"""
+        self._queue = asyncio.PriorityQueue()
+        self._draining = False
+        recovered = await run_in_threadpool(self._recover_jobs)
+        for job in recovered:
+            self._enqueue(job['id'], job['priority'])
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} queued AI jobs")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self, drain_timeout: float = 0):
+        """Stop workers, giving running jobs ``drain_timeout`` seconds to finish
+
+        Queued jobs stay persisted and resume on the next start. Jobs still
+        running at the deadline are put back in the queue right away rather
+        than waiting AI_JOB_STALE_SECONDS to be recovered.
+        """
+        self._draining = True
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles.clear()
+        busy = [worker for worker in self._workers if worker in self._running]
+        for worker in self._workers:
+            if worker not in self._running:
+                worker.cancel()
+        if busy and drain_timeout > 0:
+            await asyncio.wait(busy, timeout=drain_timeout)
+        interrupted = [self._running[worker] for worker in busy if worker in self._running]
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._running.clear()
+        if interrupted:
+            logger.warning(f"Returning {len(interrupted)} unfinished AI jobs to the queue")
+            await run_in_threadpool(self._requeue_jobs, interrupted)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting to run, including those backing off before a retry"""
+        return (self._queue.qsize() if self._queue else 0) + len(self._retry_handles)
+    
+    async def submit(self, job: AIJobCreate, user_id: str) -> AIJobResponse:
+        """Persist a job and queue it, returning immediately"""
+        job_id = str(uuid.uuid4())
+        request = AIRequest(**job.model_dump(exclude={'priority'}))
+        await run_in_threadpool(
+            Database.execute_query,
+            """
+            INSERT INTO ai_jobs (id, user_id, document_id, ai_action, status, priority, max_attempts, request_data)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (job_id, user_id, request.document_id, request.action.value, JobStatus.QUEUED.value,
+             job.priority, AI_JOB_MAX_ATTEMPTS, request.model_dump_json())
+        )
+        self._enqueue(job_id, job.priority)
+        return await run_in_threadpool(self.get_job, job_id, user_id)
+
+    def get_job(self, job_id: str, user_id: str) -> Optional[AIJobResponse]:
+        """Get job status and result"""
+        job = Database.execute_single_query(
+            "SELECT * FROM ai_jobs WHERE id = %s AND user_id = %s",
+            (job_id, user_id)
+        )
+        if not job:
+            return None
+        return self._map_job_response(job)
+
+    def get_user_jobs(self, user_id: str, limit: int = 20) -> List[AIJobResponse]:
+        """Get the most recent jobs for a user"""
+        jobs = Database.execute_query(
+            "SELECT * FROM ai_jobs WHERE user_id = %s ORDER BY created_at DESC LIMIT %s",
+            (user_id, limit),
+            fetch=True
+        )
+        return [self._map_job_response(job) for job in jobs]
+
+    async def wait_for(self, job_id: str, user_id: str, timeout: float) -> Optional[AIJobResponse]:
+        """Long-poll until the job finishes or ``timeout`` seconds pass"""
+        async for job in self.subscribe(job_id, user_id, timeout):
+            if job is None or job.status in FINAL_STATUSES:
+                return job
+        return await run_in_threadpool(self.get_job, job_id, user_id)
+
+    async def subscribe(self, job_id: str, user_id: str, timeout: float) -> AsyncIterator[Optional[AIJobResponse]]:
+        """Yield the job each time its status changes, until it finishes or times out"""
+        updates: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(updates)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_state = None
+        try:
+            while True:
+                job = await run_in_threadpool(self.get_job, job_id, user_id)
+                state = (job.status, job.attempts) if job else None
+                if state != last_state:
+                    last_state = state
+                    yield job
+                if job is None or job.status in FINAL_STATUSES:
+                    return
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                # Local workers notify immediately; the timeout covers jobs run by other processes
+                try:
+                    await asyncio.wait_for(updates.get(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if updates in subscribers:
+                subscribers.remove(updates)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    # Workers
+
+    def _enqueue(self, job_id: str, priority: int):
+        self._retry_handles.pop(job_id, None)
+        # Higher priority first, FIFO within a priority
+        self._queue.put_nowait((-priority, next(self._sequence), job_id))
+
+    async def _worker(self):
+        worker = asyncio.current_task()
+        while not self._draining:
+            _, _, job_id = await self._queue.get()
+            self._running[worker] = job_id
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"AI job {job_id} crashed: {e}")
+            finally:
+                self._running.pop(worker, None)
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = await run_in_threadpool(self._claim_job, job_id)
+        if not job:
+            # Already claimed by another process or no longer queued
+            return
+        self._notify(job_id)
+
+        request = AIRequest(**json.loads(job['request_data']))
+        response = None
+        try:
+            if self.admission:
+                async with self.admission.slot(job['user_id'], shed=False):
+                    response = await run_in_threadpool(self.ai_service.process_ai_request, request, job['user_id'])
+            else:
+                response = await run_in_threadpool(self.ai_service.process_ai_request, request, job['user_id'])
+            error = response.output_data.get('error')
+        except Exception as e:
+            error = str(e)
+
+        attempts = job['attempts'] + 1
+        if error and attempts < job['max_attempts']:
+            await run_in_threadpool(
+                Database.execute_query,
+                "UPDATE ai_jobs SET status = %s, error = %s WHERE id = %s",
+                (JobStatus.QUEUED.value, error, job_id)
+            )
+            delay = AI_JOB_RETRY_DELAY * (2 ** (attempts - 1))
+            loop = asyncio.get_running_loop()
+            self._retry_handles[job_id] = loop.call_later(delay, self._enqueue, job_id, job['priority'])
+            self._notify(job_id)
+            return
+
+        # A fallback result still answers the request; only a missing response fails the job
+        status = JobStatus.SUCCEEDED if response is not None else JobStatus.FAILED
+        await run_in_threadpool(
+            Database.execute_query,
+            """
+            UPDATE ai_jobs SET status = %s, result_data = %s, history_id = %s, error = %s, finished_at = %s
+            WHERE id = %s
+            """,
+            (status.value, response.model_dump_json() if response else None,
+             response.id if response else None, error, datetime.now(), job_id)
+        )
+        self._notify(job_id)
+
+    def _claim_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with Database.primary():
+            job = Database.execute_single_query("SELECT * FROM ai_jobs WHERE id = %s", (job_id,))
+        if not job or job['status'] != JobStatus.QUEUED:
+            return None
+        claimed = Database.execute_query(
+            """
+            UPDATE ai_jobs SET status = %s, attempts = attempts + 1, started_at = %s
+            WHERE id = %s AND status = %s AND attempts = %s
+            """,
+            (JobStatus.RUNNING.value, datetime.now(), job_id, JobStatus.QUEUED.value, job['attempts'])
+        )
+        return job if claimed else None
+
+    def _requeue_jobs(self, job_ids: List[str]):
+        placeholders = ", ".join(["%s"] * len(job_ids))
+        Database.execute_query(
+            f"UPDATE ai_jobs SET status = %s WHERE status = %s AND id IN ({placeholders})",
+            (JobStatus.QUEUED.value, JobStatus.RUNNING.value, *job_ids)
+        )
+
+    def _recover_jobs(self) -> List[Dict[str, Any]]:
+        Database.execute_query(
+            """
+            UPDATE ai_jobs SET status = %s
+            WHERE status = %s AND started_at < NOW() - INTERVAL %s SECOND
+            """,
+            (JobStatus.QUEUED.value, JobStatus.RUNNING.value, AI_JOB_STALE_SECONDS)
+        )
+        with Database.primary():
+            return Database.execute_query(
+                "SELECT id, priority FROM ai_jobs WHERE status = %s ORDER BY created_at",
+                (JobStatus.QUEUED.value,),
+                fetch=True
+            )
+
+    def _notify(self, job_id: str):
+        for updates in self._subscribers.get(job_id, []):
+            updates.put_nowait(job_id)
+
+    @staticmethod
+    def _map_job_response(job: dict) -> AIJobResponse:
+        result = None
+        if job.get('result_data'):
+            result = AIResponse(**json.loads(job['result_data']))
+        return AIJobResponse(
+            id=job['id'],
+            action=job['ai_action'],
+            status=job['status'],
+            priority=job['priority'],
+            attempts=job['attempts'],
+            result=result,
+            error=job.get('error'),
+            created_at=job['created_at'],
+            started_at=job.get('started_at'),
+            finished_at=job.get('finished_at')
+        )
@@ -0,0 +1,256 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    @property
+    def family_name(self) -> str:
+        return self.name
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def _labels(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    @property
+    def family_name(self) -> str:
+        return self.name + "_total"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield self.family_name, self._labels(labelvalues), value
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield self.name, self._labels(labelvalues), value
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[labelvalues] = state
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labelvalues) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = [(labelvalues, list(state[0]), state[1]) for labelvalues, state in self._values.items()]
+        for labelvalues, counts, total in values:
+            labels = self._labels(labelvalues)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, name: str, type_name: str, documentation: str,
+                           collect: Callable[[], Iterable[Sample]]):
+        """Add a family whose samples are computed when /metrics is scraped"""
+        with self._lock:
+            self._collectors.append((name, type_name, documentation, collect))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [(m.family_name, m.type_name, m.documentation, m.samples) for m in metrics] + collectors
+        for name, type_name, documentation, collect in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            try:
+                for sample_name, labels, value in collect():
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                lines.append(f"# collector {name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+REGISTRY = MetricsRegistry()
+
+# HTTP
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+
+# Database
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "Database query latency by calling function",
+    ("call_site", "operation")
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "db_query_errors", "Database query failures by calling function", ("call_site",)
+)
+DB_POOL_WAIT = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent checking a connection out of the pool", ("pool",)
+)
+DB_READS = REGISTRY.counter(
+    "db_reads", "Read queries by the server that answered them", ("target",)
+)
+
+# AI
+AI_UPSTREAM_DURATION = REGISTRY.histogram(
+    "ai_upstream_duration_seconds", "Gemini generate_content latency",
+    ("model", "action", "outcome")
+)
+AI_TOKENS = REGISTRY.counter(
+    "ai_tokens", "Estimated Gemini tokens by model and direction (input, output)", ("model", "direction")
+)
+AI_COST = REGISTRY.counter(
+    "ai_cost_usd", "Estimated Gemini spend by model", ("model",)
+)
+AI_REQUESTS = REGISTRY.counter(
+    "ai_requests", "Processed AI requests by action and outcome (ok, fallback, error)",
+    ("action", "outcome")
+)
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template"""
+
+    def __init__(self, app, skip_paths: Optional[Sequence[str]] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths or ())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_holder[0])
+            )
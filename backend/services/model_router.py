@@ -0,0 +1,254 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Deque, Dict, List, Optional
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, AdaptiveTimeout, UpstreamTimeoutError
+from services.metrics import AI_UPSTREAM_DURATION, AI_TOKENS, AI_COST
+from services import tracing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-1.5-flash')
+GEMINI_LARGE_MODEL = os.getenv('GEMINI_LARGE_MODEL', 'gemini-pro')
+# USD per million tokens
+GEMINI_FAST_INPUT_COST = float(os.getenv('GEMINI_FAST_INPUT_COST', 0.075))
+GEMINI_FAST_OUTPUT_COST = float(os.getenv('GEMINI_FAST_OUTPUT_COST', 0.30))
+GEMINI_LARGE_INPUT_COST = float(os.getenv('GEMINI_LARGE_INPUT_COST', 0.50))
+GEMINI_LARGE_OUTPUT_COST = float(os.getenv('GEMINI_LARGE_OUTPUT_COST', 1.50))
+
+# Prompts up to this size for simple actions go to the fast model
+AI_FAST_MODEL_MAX_CHARS = int(os.getenv('AI_FAST_MODEL_MAX_CHARS', 8000))
+# When the large model's p95 for an action exceeds this, prefer the fast one (0 disables)
+AI_LATENCY_BUDGET_MS = float(os.getenv('AI_LATENCY_BUDGET_MS', 0))
+AI_HEDGING_ENABLED = os.getenv('AI_HEDGING_ENABLED', 'true').lower() == 'true'
+# Send a hedge to the other model once the first call is slower than this percentile
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', 95))
+
+FAST_ACTIONS = {"grammar_check", "format", "improve_writing", "translate"}
+
+class ModelClient:
+    """One Gemini model with its own breaker, pricing and latency record"""
+
+    def __init__(self, tier: str, model_name: str, model, input_cost: float, output_cost: float):
+        self.tier = tier
+        self.model_name = model_name
+        self.model = model
+        self.input_cost = input_cost
+        self.output_cost = output_cost
+        self.breaker = CircuitBreaker(f"gemini:{tier}")
+        self.calls = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self._latencies: Deque[float] = deque(maxlen=500)
+        self._lock = threading.Lock()
+
+    def record(self, duration: float, ok: bool, input_tokens: int, output_tokens: int):
+        cost = (input_tokens * self.input_cost + output_tokens * self.output_cost) / 1_000_000
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self._latencies.append(duration)
+                self.input_tokens += input_tokens
+                self.output_tokens += output_tokens
+                self.cost += cost
+            else:
+                self.errors += 1
+        if ok:
+            AI_TOKENS.inc(self.model_name, "input", amount=input_tokens)
+            AI_TOKENS.inc(self.model_name, "output", amount=output_tokens)
+            AI_COST.inc(self.model_name, amount=cost)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            stats = {
+                "model": self.model_name,
+                "calls": self.calls,
+                "errors": self.errors,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cost_usd": round(self.cost, 6),
+            }
+        if ordered:
+            stats["latency_p50_ms"] = round(ordered[(len(ordered) - 1) // 2] * 1000, 1)
+            stats["latency_p95_ms"] = round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1)
+        stats["circuit"] = self.breaker.stats()
+        return stats
+
+class _Call:
+    """An upstream call the caller may stop waiting for"""
+    __slots__ = ("timed_out",)
+
+    def __init__(self):
+        self.timed_out = False
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class ModelRouter:
+    """Chooses a model per call and runs it with breakers, adaptive timeouts and hedging
+
+    Short prompts for simple actions go to the fast model and everything else
+    to the large one. If the preferred model's breaker is open the other model
+    is used. A call slower than that model's recent p95 for the action is
+    hedged with the same prompt on the other model; the first reply wins.
+    """
+
+    def __init__(self, fast: ModelClient, large: ModelClient, executor: ThreadPoolExecutor):
+        self.fast = fast
+        self.large = large
+        self.executor = executor
+        self.timeouts = AdaptiveTimeout()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+
+    @property
+    def models(self) -> List[ModelClient]:
+        return [self.fast, self.large] if self.fast.model_name != self.large.model_name else [self.large]
+
+    def route(self, action: str, prompt_chars: int) -> List[ModelClient]:
+        """Models to try for a call, in order of preference"""
+        if self.fast.model_name == self.large.model_name:
+            return [self.large]
+        prefer_fast = action in FAST_ACTIONS and prompt_chars <= AI_FAST_MODEL_MAX_CHARS
+        if not prefer_fast and AI_LATENCY_BUDGET_MS and prompt_chars <= AI_FAST_MODEL_MAX_CHARS:
+            large_p95 = self.timeouts.percentile(self._key(self.large, action), 95)
+            prefer_fast = large_p95 is not None and large_p95 * 1000 > AI_LATENCY_BUDGET_MS
+        return [self.fast, self.large] if prefer_fast else [self.large, self.fast]
+
+    def generate(self, prompt: str, action: str):
+        """Run ``prompt`` on the best available model; raises CircuitOpenError if none is"""
+        candidates = self.route(action, len(prompt))
+        primary = self._reserve(candidates)
+        alternates = [model for model in candidates if model is not primary]
+        secondary = alternates[0] if alternates else None
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response, winner = self._call_with_hedge(primary, secondary, prompt, action)
+            outcome = "ok" if winner is primary else "hedged"
+            return response
+        except UpstreamTimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            tracing.record("ai", started, time.perf_counter() - started, f"{action} {primary.model_name} {outcome}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": {model.tier: model.stats() for model in self.models},
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "timeouts": self.timeouts.stats(),
+        }
+
+    @staticmethod
+    def _key(model: ModelClient, action: str) -> str:
+        return f"{model.tier}:{action}"
+
+    @staticmethod
+    def _reserve(candidates: List[ModelClient]) -> ModelClient:
+        """First candidate whose breaker lets a call through"""
+        error = None
+        for model in candidates:
+            try:
+                model.breaker.before_call()
+                return model
+            except CircuitOpenError as e:
+                error = e
+        raise error
+
+    def _call_with_hedge(self, primary: ModelClient, secondary: Optional[ModelClient], prompt: str, action: str):
+        timeout = self.timeouts.timeout(self._key(primary, action))
+        hedge_after = None
+        if AI_HEDGING_ENABLED and secondary is not None:
+            hedge_after = self.timeouts.percentile(self._key(primary, action), AI_HEDGE_PERCENTILE)
+
+        call = _Call()
+        future = self.executor.submit(self._invoke, primary, prompt, action, call)
+        if hedge_after is None or hedge_after >= timeout:
+            return self._wait(future, primary, call, timeout), primary
+
+        done, _ = wait([future], timeout=hedge_after)
+        if done:
+            return future.result(), primary
+        try:
+            secondary.breaker.before_call()
+        except CircuitOpenError:
+            return self._wait(future, primary, call, timeout - hedge_after), primary
+
+        with self._lock:
+            self.hedges_sent += 1
+        hedge_call = _Call()
+        hedge = self.executor.submit(self._invoke, secondary, prompt, action, hedge_call)
+        deadline = time.monotonic() + timeout - hedge_after
+        pending = {future: (primary, call), hedge: (secondary, hedge_call)}
+        error = None
+        while pending:
+            done, _ = wait(list(pending), timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for finished in done:
+                model, _ = pending.pop(finished)
+                try:
+                    response = finished.result()
+                except Exception as e:
+                    error = e
+                    continue
+                # The slower call is left to finish in the background
+                if model is secondary:
+                    with self._lock:
+                        self.hedges_won += 1
+                return response, model
+        if pending:
+            for model, pending_call in pending.values():
+                self._time_out(model, pending_call, timeout)
+            raise UpstreamTimeoutError(f"Upstream call timed out after {timeout:.1f}s")
+        raise error
+
+    def _wait(self, future, model: ModelClient, call: _Call, timeout: float):
+        done, _ = wait([future], timeout=timeout)
+        if not done:
+            self._time_out(model, call, timeout)
+            raise UpstreamTimeoutError(f"Upstream call timed out after {timeout:.1f}s")
+        return future.result()
+
+    @staticmethod
+    def _time_out(model: ModelClient, call: _Call, timeout: float):
+        """Charge a call the caller gave up on to the breaker now rather than when it ends"""
+        call.timed_out = True
+        model.breaker.record(timeout, False)
+
+    def _invoke(self, model: ModelClient, prompt: str, action: str, call: _Call):
+        """Make the upstream call; runs on the executor"""
+        started = time.perf_counter()
+        ok = False
+        response = None
+        try:
+            response = model.model.generate_content(prompt)
+            ok = True
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            AI_UPSTREAM_DURATION.observe(elapsed, model.model_name, action, "ok" if ok else "error")
+            # Timed-out calls were already charged to the breaker by the caller
+            if not call.timed_out:
+                model.breaker.record(elapsed, ok)
+            output_tokens = estimate_tokens(self._text(response)) if ok else 0
+            model.record(elapsed, ok, estimate_tokens(prompt), output_tokens)
+            if ok:
+                self.timeouts.observe(self._key(model, action), elapsed)
+
+    @staticmethod
+    def _text(response) -> str:
+        try:
+            return response.text
+        except Exception:
+            return ""
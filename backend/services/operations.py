@@ -0,0 +1,156 @@
+from typing import Any, Dict, List
+
+# Operations on a JSON document, as sent by collaboration clients:
+#   {"op": "insert", "path": [...], "offset": 3, "text": "abc"}   insert into the string at path
+#   {"op": "delete", "path": [...], "offset": 3, "length": 2}     delete from the string at path
+#   {"op": "set", "path": [...], "value": ...}                    replace a dict key or list item
+# Paths are lists of dict keys and list indexes. Offsets count Unicode code points.
+TEXT_OPS = ("insert", "delete")
+
+class OperationError(ValueError):
+    """An operation that is malformed or doesn't fit the document"""
+
+def parse_operation(raw: Any) -> Dict[str, Any]:
+    """Validate an operation received from a client"""
+    if not isinstance(raw, dict):
+        raise OperationError("Operation must be an object")
+    kind = raw.get("op")
+    path = raw.get("path")
+    if not isinstance(path, list) or not path:
+        raise OperationError("Operation path must be a non-empty list")
+    for key in path:
+        if isinstance(key, bool) or not isinstance(key, (str, int)):
+            raise OperationError("Path items must be strings or integers")
+    if kind == "set":
+        if "value" not in raw:
+            raise OperationError("'set' requires a value")
+        return {"op": kind, "path": path, "value": raw["value"]}
+    offset = raw.get("offset")
+    if not _is_index(offset):
+        raise OperationError("Text operations require a non-negative offset")
+    if kind == "insert":
+        if not isinstance(raw.get("text"), str) or not raw["text"]:
+            raise OperationError("'insert' requires non-empty text")
+        return {"op": kind, "path": path, "offset": offset, "text": raw["text"]}
+    if kind == "delete":
+        if not _is_index(raw.get("length")) or not raw["length"]:
+            raise OperationError("'delete' requires a positive length")
+        return {"op": kind, "path": path, "offset": offset, "length": raw["length"]}
+    raise OperationError(f"Unknown operation '{kind}'")
+
+def apply_operation(document: Any, op: Dict[str, Any]):
+    """Apply ``op`` to ``document`` in place; nothing changes if it raises"""
+    parent = document
+    for key in op["path"][:-1]:
+        parent = _child(parent, key)
+    key = op["path"][-1]
+
+    if op["op"] == "set":
+        if isinstance(parent, dict) and isinstance(key, str):
+            parent[key] = op["value"]
+        elif isinstance(parent, list) and isinstance(key, int) and 0 <= key <= len(parent):
+            if key == len(parent):
+                parent.append(op["value"])
+            else:
+                parent[key] = op["value"]
+        else:
+            raise OperationError(f"Cannot set {op['path']}")
+        return
+
+    text = _child(parent, key)
+    if not isinstance(text, str):
+        raise OperationError(f"{op['path']} is not a string")
+    offset = op["offset"]
+    if op["op"] == "insert":
+        if offset > len(text):
+            raise OperationError("Insert offset is past the end of the text")
+        parent[key] = text[:offset] + op["text"] + text[offset:]
+    else:
+        if offset + op["length"] > len(text):
+            raise OperationError("Delete range is past the end of the text")
+        parent[key] = text[:offset] + text[offset + op["length"]:]
+
+def transform(op: Dict[str, Any], other: Dict[str, Any], op_first: bool = False) -> List[Dict[str, Any]]:
+    """Rewrite ``op`` to apply after a concurrent ``other`` op
+
+    ``op_first`` says which of the two comes first in the final order; it
+    breaks ties between inserts at the same offset and between two sets of
+    the same path (the later set wins). An op inside a value that ``other``
+    replaced is dropped. Returns zero, one or (for a delete split by an
+    insert) two operations.
+    """
+    path, other_path = op["path"], other["path"]
+    if other["op"] == "set":
+        if path[:len(other_path)] != other_path:
+            return [op]
+        if len(other_path) < len(path) or op["op"] in TEXT_OPS or op_first:
+            return []
+        return [op]
+    if op["op"] == "set" or path != other_path:
+        return [op]
+    return _transform_text(op, other, op_first)
+
+def transform_all(ops: List[Dict[str, Any]], applied_ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rebase ``ops``, written against the state before ``applied_ops``, to apply after them"""
+    return _transform_lists(ops, applied_ops)[0]
+
+def _transform_lists(ops: List[Dict[str, Any]], others: List[Dict[str, Any]]):
+    """(``ops`` rebased after ``others``, ``others`` rebased after ``ops``); ``others`` come first
+
+    Each op in a list is relative to the ones before it, so both sides are
+    rebased together. Lists are halved to keep recursion shallow.
+    """
+    if not ops or not others:
+        return ops, others
+    if len(ops) == 1 and len(others) == 1:
+        return transform(ops[0], others[0]), transform(others[0], ops[0], op_first=True)
+    if len(ops) > 1:
+        middle = len(ops) // 2
+        head, others = _transform_lists(ops[:middle], others)
+        tail, others = _transform_lists(ops[middle:], others)
+        return head + tail, others
+    middle = len(others) // 2
+    ops, head = _transform_lists(ops, others[:middle])
+    ops, tail = _transform_lists(ops, others[middle:])
+    return ops, head + tail
+
+def _transform_text(op: Dict[str, Any], other: Dict[str, Any], op_first: bool) -> List[Dict[str, Any]]:
+    offset = op["offset"]
+    if other["op"] == "insert":
+        at, size = other["offset"], len(other["text"])
+        if op["op"] == "insert":
+            shifted = at < offset or (at == offset and not op_first)
+            return [{**op, "offset": offset + size}] if shifted else [op]
+        if at <= offset:
+            return [{**op, "offset": offset + size}]
+        if at >= offset + op["length"]:
+            return [op]
+        # The insert landed inside our delete range: delete around it
+        before = at - offset
+        return [
+            {**op, "length": before},
+            {**op, "offset": offset + size, "length": op["length"] - before},
+        ]
+
+    at, size = other["offset"], other["length"]
+    if op["op"] == "insert":
+        if offset <= at:
+            return [op]
+        return [{**op, "offset": max(at, offset - size)}]
+    end = offset + op["length"]
+    overlap = max(0, min(end, at + size) - max(offset, at))
+    length = op["length"] - overlap
+    if not length:
+        return []
+    removed_before = max(0, min(at + size, offset) - at)
+    return [{**op, "offset": offset - removed_before, "length": length}]
+
+def _child(container: Any, key):
+    if isinstance(container, dict) and isinstance(key, str) and key in container:
+        return container[key]
+    if isinstance(container, list) and isinstance(key, int) and 0 <= key < len(container):
+        return container[key]
+    raise OperationError(f"Path item {key!r} not found")
+
+def _is_index(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
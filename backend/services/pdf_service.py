@@ -0,0 +1,203 @@
+import io
+import os
+import json
+import uuid
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from services.blob_store import BlobStore
+from services.cache import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PDF_MAX_PAGES_PER_REQUEST = int(os.getenv('PDF_MAX_PAGES_PER_REQUEST', 50))
+PDF_PAGE_CACHE_SIZE = int(os.getenv('PDF_PAGE_CACHE_SIZE', 2048))
+
+class PdfService:
+    """Per-page PDF text extraction backed by the blob store
+
+    Extraction runs once per blob and is stored next to the blobs as
+    ``pdf_text/<sha256>/pages.jsonl`` (one JSON object per page) plus a
+    ``meta.json`` holding document metadata and the byte offset of every page
+    line, so a single page can be read with one seek. Because the directory is
+    keyed by content hash, duplicate uploads share one extraction.
+    """
+
+    def __init__(self, blob_store: BlobStore):
+        self.blob_store = blob_store
+        self.text_dir = os.path.join(blob_store.root, 'pdf_text')
+        blob_store.derived_dirs.append(self.text_dir)
+        self.page_cache = LRUCache("pdf_pages", maxsize=PDF_PAGE_CACHE_SIZE)
+        self.meta_cache = LRUCache("pdf_meta", maxsize=256)
+
+    def extract(self, blob_key: str) -> Dict[str, Any]:
+        """Extract per-page text and metadata, reusing a previous extraction"""
+        meta = self._load_meta(blob_key)
+        if meta:
+            return meta
+
+        # PyPDF2 is imported on first use, as most workers never touch a PDF
+        from PyPDF2 import PdfReader
+        reader = PdfReader(self.blob_store.blob_path(blob_key))
+        extraction_dir = self._extraction_dir(blob_key)
+        os.makedirs(extraction_dir, exist_ok=True)
+        suffix = uuid.uuid4().hex
+        pages_tmp = os.path.join(extraction_dir, f"pages.jsonl.{suffix}.tmp")
+
+        offsets = []
+        pages = []
+        with open(pages_tmp, 'wb') as f:
+            for index, page in enumerate(reader.pages):
+                try:
+                    text = page.extract_text() or ""
+                except Exception as e:
+                    logger.warning(f"Text extraction failed for page {index + 1} of {blob_key}: {e}")
+                    text = ""
+                box = page.mediabox
+                page_info = {
+                    "number": index + 1,
+                    "width": float(box.width),
+                    "height": float(box.height),
+                    "rotation": int(page.get('/Rotate', 0) or 0),
+                    "char_count": len(text),
+                }
+                offsets.append(f.tell())
+                f.write(json.dumps({**page_info, "text": text}).encode('utf-8') + b"\n")
+                pages.append(page_info)
+        os.replace(pages_tmp, os.path.join(extraction_dir, 'pages.jsonl'))
+
+        info = reader.metadata or {}
+        meta = {
+            "page_count": len(pages),
+            "metadata": {
+                "title": self._metadata_text(info.get('/Title')),
+                "author": self._metadata_text(info.get('/Author')),
+                "subject": self._metadata_text(info.get('/Subject')),
+                "creator": self._metadata_text(info.get('/Creator')),
+                "producer": self._metadata_text(info.get('/Producer')),
+            },
+            "pages": pages,
+            "offsets": offsets,
+        }
+        # meta.json is written last; its presence marks a finished extraction
+        meta_tmp = os.path.join(extraction_dir, f"meta.json.{suffix}.tmp")
+        with open(meta_tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, os.path.join(extraction_dir, 'meta.json'))
+
+        self.meta_cache.set(blob_key, meta)
+        return meta
+
+    @staticmethod
+    def _metadata_text(value: Any) -> Optional[str]:
+        """A document info entry as plain text; entries may be indirect objects or byte strings"""
+        if hasattr(value, 'get_object'):
+            value = value.get_object()
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            return value.decode('utf-8', 'replace')
+        return str(value)
+
+    def document_content(self, blob_key: str) -> Dict[str, Any]:
+        """Build the lightweight ``content`` stored on a pdf document row"""
+        meta = self.extract(blob_key)
+        return {
+            "page_count": meta["page_count"],
+            "metadata": meta["metadata"],
+            "pages": meta["pages"],
+        }
+
+    def get_pages(self, blob_key: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Return text and geometry for pages ``start``..``end`` (1-based, inclusive)"""
+        meta = self.extract(blob_key)
+        start, end = self.clamp_range(start, end, meta["page_count"])
+        pages = []
+        missing = []
+        for number in range(start, end + 1):
+            page = self.page_cache.get((blob_key, number))
+            if page is None:
+                missing.append(number)
+            pages.append(page)
+
+        if missing:
+            with open(os.path.join(self._extraction_dir(blob_key), 'pages.jsonl'), 'rb') as f:
+                for number in missing:
+                    f.seek(meta["offsets"][number - 1])
+                    page = json.loads(f.readline())
+                    self.page_cache.set((blob_key, number), page)
+                    pages[number - start] = page
+        return pages
+
+    def get_text(self, blob_key: str, page_spec: Optional[str] = None) -> str:
+        """Return extracted text for a page spec such as ``"1-3,7"`` (all pages if empty)"""
+        meta = self.extract(blob_key)
+        ranges = self.parse_page_spec(page_spec, meta["page_count"]) if page_spec else [(1, meta["page_count"])]
+        parts = []
+        for start, end in ranges:
+            for chunk_start in range(start, end + 1, PDF_MAX_PAGES_PER_REQUEST):
+                chunk_end = min(end, chunk_start + PDF_MAX_PAGES_PER_REQUEST - 1)
+                for page in self.get_pages(blob_key, chunk_start, chunk_end):
+                    parts.append(f"[Page {page['number']}]\n{page['text']}")
+        return "\n\n".join(parts)
+
+    def render_pages(self, blob_key: str, start: int, end: int) -> bytes:
+        """Build a standalone PDF containing only the requested pages"""
+        from PyPDF2 import PdfReader, PdfWriter
+        reader = PdfReader(self.blob_store.blob_path(blob_key))
+        start, end = self.clamp_range(start, end, len(reader.pages))
+        writer = PdfWriter()
+        for index in range(start - 1, end):
+            writer.add_page(reader.pages[index])
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    @staticmethod
+    def clamp_range(start: int, end: int, page_count: int,
+                    max_pages: Optional[int] = PDF_MAX_PAGES_PER_REQUEST) -> Tuple[int, int]:
+        if page_count == 0:
+            raise ValueError("Document has no pages")
+        start = max(start, 1)
+        end = min(end, page_count)
+        if max_pages:
+            end = min(end, start + max_pages - 1)
+        if start > end:
+            raise ValueError(f"Page range out of bounds (document has {page_count} pages)")
+        return start, end
+
+    @staticmethod
+    def parse_page_spec(page_spec: str, page_count: int) -> List[Tuple[int, int]]:
+        """Parse ``"1-3,7"`` into [(1, 3), (7, 7)]"""
+        ranges = []
+        for part in str(page_spec).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            first, _, last = part.partition('-')
+            try:
+                start = int(first)
+                end = int(last) if last else start
+            except ValueError:
+                raise ValueError(f"Invalid page range: {part}")
+            ranges.append(PdfService.clamp_range(start, end, page_count, max_pages=None))
+        if not ranges:
+            raise ValueError("Empty page range")
+        return ranges
+
+    def _extraction_dir(self, blob_key: str) -> str:
+        return os.path.join(self.text_dir, os.path.basename(blob_key))
+
+    def _load_meta(self, blob_key: str) -> Optional[Dict[str, Any]]:
+        meta = self.meta_cache.get(blob_key)
+        if meta:
+            return meta
+        try:
+            with open(os.path.join(self._extraction_dir(blob_key), 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        self.meta_cache.set(blob_key, meta)
+        return meta
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+import importlib
+from typing import Dict, List, NamedTuple, Tuple
+from models.models import AIRequest, AIAction
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AI_USER_TOKENS_PER_MINUTE = int(os.getenv('AI_USER_TOKENS_PER_MINUTE', 40000))
+AI_ACTION_REQUESTS_PER_MINUTE = int(os.getenv('AI_ACTION_REQUESTS_PER_MINUTE', 60))
+AI_MAX_PROMPT_TOKENS = int(os.getenv('AI_MAX_PROMPT_TOKENS', 30000))
+# "memory" or "package.module:ClassName" for a shared backend
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+
+# Actions whose output is roughly as long as their input
+TEXT_TRANSFORM_ACTIONS = {AIAction.GRAMMAR_CHECK, AIAction.TRANSLATE, AIAction.FORMAT, AIAction.IMPROVE_WRITING}
+PROMPT_OVERHEAD_TOKENS = 60
+DEFAULT_OUTPUT_TOKENS = 512
+# How often the in-memory backend drops buckets that have refilled
+PRUNE_INTERVAL_SECONDS = 60
+
+class RateLimitExceeded(Exception):
+    """Raised when a request must be rejected with 429 and a Retry-After hint"""
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+class Bucket(NamedTuple):
+    key: str
+    cost: float
+    rate: float  # tokens refilled per second
+    capacity: float
+
+class RateLimitBackend:
+    """Token bucket storage; subclass with an atomic implementation to share limits across processes"""
+
+    def consume(self, buckets: List[Bucket]) -> float:
+        """Take ``cost`` from every bucket or from none; return 0 or seconds until it would fit"""
+        raise NotImplementedError
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self):
+        # key -> (tokens, updated at, when the bucket will be full again)
+        self._state: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+
+    def consume(self, buckets: List[Bucket]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            levels = []
+            retry_after = 0.0
+            for bucket in buckets:
+                tokens, updated_at, _ = self._state.get(bucket.key, (bucket.capacity, now, now))
+                tokens = min(bucket.capacity, tokens + (now - updated_at) * bucket.rate)
+                levels.append(tokens)
+                if tokens < bucket.cost:
+                    retry_after = max(retry_after, (bucket.cost - tokens) / bucket.rate)
+            if retry_after:
+                return retry_after
+            for bucket, tokens in zip(buckets, levels):
+                tokens -= bucket.cost
+                self._state[bucket.key] = (tokens, now, now + (bucket.capacity - tokens) / bucket.rate)
+            return 0.0
+
+    def _prune(self, now: float):
+        # An unknown key starts full, so dropping full buckets changes no limit
+        self._state = {key: state for key, state in self._state.items() if state[2] > now}
+        self._next_prune = now + PRUNE_INTERVAL_SECONDS
+
+def load_backend(spec: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if spec == 'memory':
+        return InMemoryRateLimitBackend()
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def estimate_tokens(request: AIRequest) -> int:
+    """Rough prompt plus completion size, at about four characters per token"""
+    chars = len(request.text_content or "") + len(json.dumps(request.parameters or {}, default=str))
+    prompt_tokens = chars // 4 + PROMPT_OVERHEAD_TOKENS
+    output_tokens = prompt_tokens if request.action in TEXT_TRANSFORM_ACTIONS else DEFAULT_OUTPUT_TOKENS
+    return prompt_tokens + output_tokens
+
+class RateLimiter:
+    """Per-user token budget plus per-user, per-action request rate"""
+
+    def __init__(self, backend: RateLimitBackend = None):
+        self.backend = backend or load_backend()
+        self.rejected = 0
+
+    def check(self, user_id: str, requests: List[AIRequest]):
+        """Charge a group of requests to the user or raise RateLimitExceeded
+
+        Raises ValueError for requests that exceed a limit on their own, which
+        waiting wouldn't fix.
+        """
+        tokens_per_second = AI_USER_TOKENS_PER_MINUTE / 60
+        requests_per_second = AI_ACTION_REQUESTS_PER_MINUTE / 60
+
+        total_tokens = 0
+        action_counts: Dict[str, int] = {}
+        for request in requests:
+            estimated = estimate_tokens(request)
+            if estimated > AI_MAX_PROMPT_TOKENS:
+                raise ValueError(f"Request too large: about {estimated} tokens (limit {AI_MAX_PROMPT_TOKENS})")
+            total_tokens += estimated
+            action_counts[request.action.value] = action_counts.get(request.action.value, 0) + 1
+        # More than a full bucket could never be admitted, so it's rejected outright rather than retried
+        if total_tokens > AI_USER_TOKENS_PER_MINUTE:
+            raise ValueError(f"Requests too large: about {total_tokens} tokens "
+                             f"(limit {AI_USER_TOKENS_PER_MINUTE} per minute)")
+        for action, count in action_counts.items():
+            if count > AI_ACTION_REQUESTS_PER_MINUTE:
+                raise ValueError(f"Too many {action} requests: {count} (limit {AI_ACTION_REQUESTS_PER_MINUTE} per minute)")
+
+        buckets = [Bucket(f"tokens:{user_id}", total_tokens, tokens_per_second, AI_USER_TOKENS_PER_MINUTE)]
+        for action, count in action_counts.items():
+            buckets.append(Bucket(f"action:{user_id}:{action}", count, requests_per_second,
+                                  AI_ACTION_REQUESTS_PER_MINUTE))
+
+        retry_after = self.backend.consume(buckets)
+        if retry_after:
+            self.rejected += 1
+            raise RateLimitExceeded("AI rate limit exceeded", retry_after)
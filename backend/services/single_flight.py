@@ -0,0 +1,53 @@
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into a single execution
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block on the same future and receive a deep copy of its result
+    (or its exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight key; returns (result, shared)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return copy.deepcopy(future.result()), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            # Followers copy from a private snapshot the leader's caller cannot mutate
+            future.set_result(copy.deepcopy(result))
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
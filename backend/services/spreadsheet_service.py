@@ -0,0 +1,148 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import orjson
+from services.cache import LRUCache
+from models.models import AggregationQuery, DocumentResponse, DocumentType
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Evaluated spreadsheets kept per document; a newer version recalculates only what changed
+FORMULA_CACHE_SIZE = int(os.getenv('FORMULA_CACHE_SIZE', 64))
+# Aggregation results kept per (document, version, query), as response-ready JSON
+AGGREGATION_CACHE_SIZE = int(os.getenv('AGGREGATION_CACHE_SIZE', 256))
+
+workbook_cache = LRUCache("formula_workbooks", maxsize=FORMULA_CACHE_SIZE)
+aggregation_cache = LRUCache("aggregations", maxsize=AGGREGATION_CACHE_SIZE)
+
+class CachedWorkbook:
+    """A document's evaluated workbook and the version it reflects"""
+
+    def __init__(self, workbook, version: int):
+        self.workbook = workbook
+        self.version = version
+        self.sheets = workbook.values()
+        # Factorized columns for aggregations over this version
+        self.columns: Dict[tuple, Any] = {}
+        # Workbooks are updated in place, so one thread at a time
+        self.lock = threading.Lock()
+
+class _VersionChanged(Exception):
+    """The document moved on between reading its version and reading its content"""
+
+    def __init__(self, document: Optional[DocumentResponse]):
+        super().__init__()
+        self.document = document
+
+class SpreadsheetService:
+    @staticmethod
+    def evaluate(document: DocumentResponse) -> List[Dict[str, Any]]:
+        """The document's sheets with every formula replaced by its value"""
+        content = document.content if isinstance(document.content, dict) else {}
+        if document.document_type != DocumentType.SPREADSHEET:
+            return content.get('sheets') or []
+        if document.buffered:
+            # Unwritten autosaves share their version with other content, so they stay out of the cache
+            from services.formulas import Workbook
+            return Workbook(content.get('sheets') or []).values()
+        with SpreadsheetService._workbook(document.id, document.version or 1, lambda: content.get('sheets') or []) as cached:
+            return cached.sheets
+
+    @staticmethod
+    def evaluate_grid(data: List[Any]) -> List[List[Any]]:
+        """Evaluate formulas in a single sheet's rows that aren't stored in a document"""
+        from services.formulas import Workbook
+        return Workbook([{"name": "Sheet1", "data": data}]).values()[0]["data"]
+
+    @staticmethod
+    def aggregate(document_id: str, user_id: str, query: AggregationQuery) -> Optional[bytes]:
+        """Group-by/pivot results for a spreadsheet as JSON, or None if the user can't see it"""
+        from services.document_service import DocumentService
+        document = DocumentService.get_document_by_id(document_id, user_id, include_content=False)
+        if document is None:
+            return None
+        if document.document_type != DocumentType.SPREADSHEET:
+            raise ValueError("Only spreadsheets can be aggregated")
+        if document.buffered:
+            # Unwritten autosaves share their version with other content, so nothing is cached
+            document = DocumentService.get_document_by_id(document_id, user_id)
+            return orjson.dumps(SpreadsheetService._aggregate_uncached(document, query)) if document else None
+        version = document.version or 1
+        query_json = query.model_dump_json()
+        body = aggregation_cache.get((document_id, version, query_json))
+        if body is not None:
+            return body
+
+        def load_sheets() -> List[Dict[str, Any]]:
+            # Content is only read when the workbook for this version isn't cached
+            loaded = DocumentService.get_document_by_id(document_id, user_id)
+            if loaded is None or loaded.buffered or (loaded.version or 1) != version:
+                raise _VersionChanged(loaded)
+            content = loaded.content if isinstance(loaded.content, dict) else {}
+            return content.get('sheets') or []
+
+        try:
+            with SpreadsheetService._workbook(document_id, version, load_sheets) as cached:
+                result = SpreadsheetService._run_query(cached.workbook, query, cached.columns)
+                result["version"] = cached.version
+        except _VersionChanged as changed:
+            # A save landed in between; answer from what was read rather than cache it under the wrong version
+            if changed.document is None:
+                return None
+            return orjson.dumps(SpreadsheetService._aggregate_uncached(changed.document, query))
+        body = orjson.dumps(result)
+        aggregation_cache.set((document_id, result["version"], query_json), body)
+        return body
+
+    @staticmethod
+    def _aggregate_uncached(document: DocumentResponse, query: AggregationQuery) -> Dict[str, Any]:
+        from services.formulas import Workbook
+        content = document.content if isinstance(document.content, dict) else {}
+        result = SpreadsheetService._run_query(Workbook(content.get('sheets') or []), query, {})
+        result["version"] = document.version or 1
+        return result
+
+    @staticmethod
+    def _run_query(workbook, query: AggregationQuery, columns: Dict[tuple, Any]) -> Dict[str, Any]:
+        from services.aggregation import aggregate
+        name = query.sheet or (workbook.names[0] if workbook.names else None)
+        if name not in workbook.sheets:
+            raise ValueError(f"Unknown sheet '{name}'" if name else "The spreadsheet has no sheets")
+        return aggregate(workbook.sheets[name], query, columns)
+
+    @staticmethod
+    @contextmanager
+    def _workbook(document_id: str, version: int,
+                  load_sheets: Callable[[], List[Dict[str, Any]]]) -> Iterator[CachedWorkbook]:
+        """The evaluated workbook for a document version, locked while the caller reads it"""
+        # NumPy and the formula engine load on the first spreadsheet evaluated
+        from services.formulas import Workbook
+        cached: Optional[CachedWorkbook] = workbook_cache.get(document_id)
+        if cached is not None:
+            with cached.lock:
+                if cached.version == version:
+                    yield cached
+                    return
+                updated = False
+                if cached.version < version:
+                    sheets = load_sheets()
+                    try:
+                        updated = cached.workbook.update(sheets)
+                    except Exception:
+                        # Half-applied; don't let anyone build on it
+                        workbook_cache.delete(document_id)
+                        raise
+                    if updated:
+                        cached.version = version
+                        cached.sheets = cached.workbook.values()
+                        cached.columns = {}
+                if updated:
+                    yield cached
+                    return
+        fresh = CachedWorkbook(Workbook(load_sheets()), version)
+        if cached is None or cached.version < version:
+            workbook_cache.set(document_id, fresh)
+        with fresh.lock:
+            yield fresh
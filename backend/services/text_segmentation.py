@@ -0,0 +1,57 @@
+import re
+import hashlib
+from typing import List, NamedTuple
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\r\n\s*\r\n")
+# Whitespace after terminal punctuation, optionally followed by a closing quote or bracket
+SENTENCE_END = re.compile(r"(?<=[.!?][\"')\]])\s+|(?<=[.!?])\s+")
+
+class Segment(NamedTuple):
+    start: int
+    end: int
+    text: str
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(self.text.encode('utf-8')).hexdigest()
+
+def split_paragraphs(text: str) -> List[Segment]:
+    """Split text on blank lines; separators are left out of the segments"""
+    return _split(text, PARAGRAPH_BREAK)
+
+def split_sentences(text: str) -> List[Segment]:
+    """Split text into sentences, never joining across paragraphs"""
+    segments = []
+    for paragraph in split_paragraphs(text):
+        for sentence in _split(paragraph.text, SENTENCE_END):
+            segments.append(Segment(paragraph.start + sentence.start, paragraph.start + sentence.end, sentence.text))
+    return segments
+
+def reassemble(text: str, segments: List[Segment], replacements: List[str]) -> str:
+    """Rebuild ``text`` with each segment replaced, keeping the original separators"""
+    parts = []
+    position = 0
+    for segment, replacement in zip(segments, replacements):
+        parts.append(text[position:segment.start])
+        parts.append(replacement)
+        position = segment.end
+    parts.append(text[position:])
+    return "".join(parts)
+
+def _split(text: str, separator: re.Pattern) -> List[Segment]:
+    segments = []
+    position = 0
+    for match in separator.finditer(text):
+        _append_stripped(segments, text, position, match.start())
+        position = match.end()
+    _append_stripped(segments, text, position, len(text))
+    return segments
+
+def _append_stripped(segments: List[Segment], text: str, start: int, end: int):
+    """Append text[start:end] without surrounding whitespace, skipping blanks"""
+    chunk = text[start:end]
+    stripped = chunk.strip()
+    if not stripped:
+        return
+    start += len(chunk) - len(chunk.lstrip())
+    segments.append(Segment(start, start + len(stripped), stripped))
@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+# Fraction of requests traced; requests sending X-Trace: 1 are always traced
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+TRACE_SERVER_TIMING = os.getenv('TRACE_SERVER_TIMING', 'true').lower() == 'true'
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+class Span(NamedTuple):
+    name: str
+    start_ms: float
+    duration_ms: float
+    detail: str
+
+class Trace:
+    """Spans recorded while serving one request, shared with worker threads"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, duration: float, detail: str = ""):
+        span = Span(name, (started - self.started) * 1000, duration * 1000, detail)
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self) -> Dict[str, List[float]]:
+        """{span name: [total ms, count]}"""
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span.name, [0.0, 0])
+            entry[0] += span.duration_ms
+            entry[1] += 1
+        return totals
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('current_trace', default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, detail: str = ""):
+    """Time a block as part of the current request's trace, if it is being traced"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, detail)
+
+def record(name: str, started: float, duration: float, detail: str = ""):
+    """Add an already-timed span to the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, started, duration, detail)
+
+def propagate(fn: Callable) -> Callable:
+    """Bind ``fn`` to the caller's context so spans from executor threads reach the trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace, literals and placeholder lists so similar queries group together"""
+    normalized = _STRING_LITERAL.sub("?", query)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    normalized = _VALUES_LIST.sub(r"\1, ...", normalized)
+    return _PLACEHOLDER_LIST.sub("(...)", normalized)
+
+def record_query(call_site: str, query: str, started: float, duration: float):
+    """Add a query span to the current trace and log it if it was slow"""
+    trace = _current_trace.get()
+    slow = duration * 1000 >= SLOW_QUERY_MS
+    if trace is None and not slow:
+        return
+    normalized = normalize_sql(query)
+    if trace is not None:
+        trace.add("db", started, duration, f"{call_site}: {normalized}")
+    if slow:
+        logger.warning(f"Slow query ({duration * 1000:.1f} ms) in {call_site}: {normalized}")
+
+class TracingMiddleware:
+    """ASGI middleware tracing a sample of requests
+
+    Traced requests get a ``Server-Timing`` header summarising time per span
+    name, and any request slower than SLOW_REQUEST_MS is logged with its
+    slowest spans.
+    """
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE, server_timing: bool = TRACE_SERVER_TIMING):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Unsampled requests are only timed, so slow ones are still logged
+        trace = Trace(scope["method"], scope["path"]) if self._sampled(scope) else None
+        started = trace.started if trace else time.perf_counter()
+        token = _current_trace.set(trace) if trace else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and trace and self.server_timing:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", self._server_timing(trace).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token:
+                _current_trace.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= SLOW_REQUEST_MS:
+                self._log_slow_request(scope, trace, elapsed_ms)
+
+    def _sampled(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"x-trace":
+                return value == b"1"
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    @staticmethod
+    def _server_timing(trace: Trace) -> str:
+        entries = [
+            f'{name};dur={total:.1f};desc="{count:d} call{"s" if count != 1 else ""}"'
+            for name, (total, count) in trace.totals().items()
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - trace.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    @staticmethod
+    def _log_slow_request(scope, trace: Optional[Trace], elapsed_ms: float):
+        route = getattr(scope.get("route"), "path", scope["path"])
+        if trace is None:
+            logger.warning(f"Slow request {scope['method']} {route} took {elapsed_ms:.1f} ms (not sampled)")
+            return
+        breakdown = ", ".join(
+            f"{name} {total:.1f} ms x{count:d}" for name, (total, count) in trace.totals().items()
+        ) or "no spans"
+        slowest = sorted(trace.spans, key=lambda s: s.duration_ms, reverse=True)[:5]
+        details = "; ".join(f"{s.name} {s.duration_ms:.1f} ms at +{s.start_ms:.1f} {s.detail}".rstrip() for s in slowest)
+        logger.warning(f"Slow request {trace.method} {route} took {elapsed_ms:.1f} ms ({breakdown}) slowest: {details}")
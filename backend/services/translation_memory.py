@@ -0,0 +1,119 @@
+import os
+import difflib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from database.database import Database
+from services.cache import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TM_CACHE_SIZE = int(os.getenv('TM_CACHE_SIZE', 50000))
+# Recent source segments per language considered for fuzzy matching
+TM_FUZZY_CANDIDATES = int(os.getenv('TM_FUZZY_CANDIDATES', 5000))
+
+class TranslationMemory:
+    """Segment-level translation memory keyed by (source hash, target language)
+
+    Exact matches are served from an in-process LRU cache in front of the
+    ``translation_memory`` table. Fuzzy matching compares against segments this
+    process has recently seen for the same language and is opt-in per request.
+    """
+
+    def __init__(self):
+        self.cache = LRUCache("translation_memory", maxsize=TM_CACHE_SIZE)
+        self._recent: Dict[str, "OrderedDict[str, Tuple[str, str]]"] = {}
+        self._recent_lock = threading.Lock()
+
+    @staticmethod
+    def source_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def lookup(self, texts: List[str], target_language: str) -> Dict[str, str]:
+        """Return {source_hash: translation} for every text found in memory"""
+        found = {}
+        missing = []
+        for text in texts:
+            source_hash = self.source_hash(text)
+            translation = self.cache.get((source_hash, target_language))
+            if translation is not None:
+                found[source_hash] = translation
+            else:
+                missing.append(source_hash)
+
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            try:
+                placeholders = ", ".join(["%s"] * len(missing))
+                rows = Database.execute_query(
+                    f"""
+                    SELECT source_hash, source_text, translated_text FROM translation_memory
+                    WHERE target_language = %s AND source_hash IN ({placeholders})
+                    """,
+                    [target_language] + missing,
+                    fetch=True
+                )
+            except Exception as e:
+                # The memory is an optimisation; translation proceeds without it
+                logger.warning(f"Translation memory lookup failed: {e}")
+                rows = []
+            for row in rows:
+                found[row['source_hash']] = row['translated_text']
+                self._remember(row['source_hash'], row['source_text'], row['translated_text'], target_language)
+        return found
+
+    def fuzzy_lookup(self, text: str, target_language: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """Best recent translation whose source is at least ``threshold`` similar"""
+        with self._recent_lock:
+            candidates = list(self._recent.get(target_language, {}).values())
+
+        best = None
+        best_ratio = threshold
+        length = len(text)
+        for source_text, translated_text in candidates:
+            # Length difference alone bounds the achievable ratio
+            if 2 * min(length, len(source_text)) / (length + len(source_text) or 1) < best_ratio:
+                continue
+            matcher = difflib.SequenceMatcher(a=text, b=source_text, autojunk=False)
+            if matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = translated_text, ratio
+        return (best, best_ratio) if best is not None else None
+
+    def store(self, pairs: List[Tuple[str, str]], target_language: str):
+        """Save (source, translation) pairs with one multi-row upsert"""
+        if not pairs:
+            return
+        rows = []
+        for source_text, translated_text in pairs:
+            source_hash = self.source_hash(source_text)
+            self._remember(source_hash, source_text, translated_text, target_language)
+            rows.append((source_hash, target_language, source_text, translated_text))
+
+        try:
+            Database.executemany(
+                """
+                INSERT INTO translation_memory (source_hash, target_language, source_text, translated_text)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE translated_text = VALUES(translated_text)
+                """,
+                rows
+            )
+        except Exception as e:
+            logger.warning(f"Translation memory store failed: {e}")
+
+    def _remember(self, source_hash: str, source_text: str, translated_text: str, target_language: str):
+        self.cache.set((source_hash, target_language), translated_text)
+        with self._recent_lock:
+            recent = self._recent.setdefault(target_language, OrderedDict())
+            recent[source_hash] = (source_text, translated_text)
+            recent.move_to_end(source_hash)
+            while len(recent) > TM_FUZZY_CANDIDATES:
+                recent.popitem(last=False)
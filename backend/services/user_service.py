@@ -9,10 +9,11 @@ class UserService:
     def create_user(user: UserCreate) -> UserResponse:
         """Create new user"""
         # Check if user already exists
-        existing_user = Database.execute_single_query(
-            "SELECT id FROM users WHERE email = %s", 
-            (user.email,)
-        )
+        with Database.primary():
+            existing_user = Database.execute_single_query(
+                "SELECT id FROM users WHERE email = %s", 
+                (user.email,)
+            )
         
         if existing_user:
             raise ValueError("User with this email already exists")
@@ -20,26 +21,34 @@ class UserService:
         user_id = str(uuid.uuid4())
         password_hash = get_password_hash(user.password)
         
-        Database.execute_query(
-            "INSERT INTO users (id, email, name, password_hash) VALUES (%s, %s, %s, %s)",
-            (user_id, user.email, user.name, password_hash)
-        )
-        
-        # Create user settings
-        Database.execute_query(
-            "INSERT INTO user_settings (user_id) VALUES (%s)",
-            (user_id,)
-        )
-        
-        return UserService.get_user_by_id(user_id)
+        # Record the insert as this user's write, so their first authenticated
+        # requests read from the primary instead of a replica that may not have them yet
+        Database.bind_session(user_id)
+        
+        # User, settings and the read-back share one connection and one commit
+        with Database.transaction():
+            Database.execute_query(
+                "INSERT INTO users (id, email, name, password_hash) VALUES (%s, %s, %s, %s)",
+                (user_id, user.email, user.name, password_hash)
+            )
+            
+            # Create user settings
+            Database.execute_query(
+                "INSERT INTO user_settings (user_id) VALUES (%s)",
+                (user_id,)
+            )
+            
+            return UserService.get_user_by_id(user_id)
     
     @staticmethod
     def authenticate_user(login: UserLogin) -> Optional[UserResponse]:
         """Authenticate user"""
-        user_data = Database.execute_single_query(
-            "SELECT * FROM users WHERE email = %s", 
-            (login.email,)
-        )
+        # The account may have been created moments ago
+        with Database.primary():
+            user_data = Database.execute_single_query(
+                "SELECT * FROM users WHERE email = %s", 
+                (login.email,)
+            )
         
         if not user_data:
             return None
@@ -111,8 +120,9 @@ class UserService:
         params.append(user_id)
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
         
-        Database.execute_query(query, params)
-        return UserService.get_user_by_id(user_id)
+        with Database.transaction():
+            Database.execute_query(query, params)
+            return UserService.get_user_by_id(user_id)
     
     @staticmethod
     def get_user_settings(user_id: str) -> dict:
@@ -136,9 +146,11 @@ class UserService:
                 update_fields.append(f"{field} = %s")
                 params.append(settings[field])
         
-        if update_fields:
-            params.append(user_id)
-            query = f"UPDATE user_settings SET {', '.join(update_fields)} WHERE user_id = %s"
-            Database.execute_query(query, params)
+        if not update_fields:
+            return UserService.get_user_settings(user_id)
         
-        return UserService.get_user_settings(user_id)
\ No newline at end of file
+        params.append(user_id)
+        query = f"UPDATE user_settings SET {', '.join(update_fields)} WHERE user_id = %s"
+        with Database.transaction():
+            Database.execute_query(query, params)
+            return UserService.get_user_settings(user_id)
\ No newline at end of file
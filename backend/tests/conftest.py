@@ -0,0 +1,20 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from auth.auth import get_current_user
+from models.models import UserResponse
+
+USER = UserResponse(
+    id="user-1", email="user@example.com", name="Test User",
+    created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1)
+)
+
+@pytest.fixture
+def client():
+    """The API signed in as USER; startup hooks don't run, so nothing connects to the database"""
+    from main import app
+    app.dependency_overrides[get_current_user] = lambda: USER
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from services.admission import AdmissionController
+from services.rate_limiter import RateLimitExceeded
+
+async def hold(admission, user_id, order, release, shed=True):
+    async with admission.slot(user_id, shed=shed):
+        order.append(user_id)
+        await release.wait()
+
+@pytest.mark.asyncio
+async def test_free_slots_rotate_between_waiting_users():
+    admission = AdmissionController(max_concurrent=1, max_queue=10)
+    order, release = [], asyncio.Event()
+    release.set()
+    async with admission.slot("busy"):
+        tasks = [asyncio.create_task(hold(admission, user_id, order, release))
+                 for user_id in ("alice", "alice", "alice", "bob", "carol")]
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 5
+    await asyncio.gather(*tasks)
+    # alice queued three first, but bob and carol don't wait behind all of them
+    assert order == ["alice", "bob", "carol", "alice", "alice"]
+    assert admission.stats()["active"] == 0 and admission.queued == 0
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_with_retry_after():
+    admission = AdmissionController(max_concurrent=1, max_queue=1)
+    order, release = [], asyncio.Event()
+    running = asyncio.create_task(hold(admission, "a", order, release))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(hold(admission, "b", order, release))
+    await asyncio.sleep(0)
+    with pytest.raises(RateLimitExceeded) as raised:
+        async with admission.slot("c"):
+            pass
+    assert raised.value.retry_after >= 1 and admission.shed == 1
+    # Background jobs wait instead of being shed
+    background = asyncio.create_task(hold(admission, "job", order, release, shed=False))
+    await asyncio.sleep(0)
+    assert admission.queued == 2
+    release.set()
+    await asyncio.gather(running, waiting, background)
+    assert order == ["a", "b", "job"]
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_give_up_their_place():
+    admission = AdmissionController(max_concurrent=1, max_queue=10)
+    order, release = [], asyncio.Event()
+    running = asyncio.create_task(hold(admission, "a", order, release))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(hold(admission, "b", order, release))
+    waiting = asyncio.create_task(hold(admission, "c", order, release))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    assert admission.queued == 1
+    release.set()
+    await asyncio.gather(running, waiting)
+    assert order == ["a", "c"] and admission.active == 0
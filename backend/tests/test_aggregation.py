@@ -0,0 +1,69 @@
+import pytest
+from models.models import AggregationQuery
+from services.aggregation import aggregate
+from services.formulas import Workbook
+
+SALES = [
+    ["Region", "Product", "Units", "Price"],
+    ["North", "Pen", 10, 1.5],
+    ["south", "Pen", 4, 1.5],
+    ["North", "Ink", 2, "=D2*4"],
+    ["South", "Ink", 5, 6],
+    ["East", "Pen", "", 1.5],
+    ["North", "Pen", 1, 2],
+]
+
+def run(rows=SALES, **query):
+    sheet = Workbook([{"name": "Sales", "data": rows}]).sheets["Sales"]
+    return aggregate(sheet, AggregationQuery(**query), {})
+
+def test_group_by_with_measures():
+    result = run(group_by=["Region"], measures=[
+        {"function": "count"}, {"function": "sum", "column": "Units"}, {"function": "max", "column": "Price"},
+        {"function": "count", "column": "Units", "alias": "with units"},
+    ])
+    assert result["columns"] == ["Region", "count", "sum(Units)", "max(Price)", "with units"]
+    # Text groups ignore case, sorted as a spreadsheet sorts
+    assert result["rows"] == [
+        ["East", 1, 0, 1.5, 0],
+        ["North", 3, 13, 6, 3],
+        ["south", 2, 9, 6, 2],
+    ]
+    assert (result["total_groups"], result["matched_rows"], result["source_rows"]) == (3, 6, 6)
+
+def test_filters_sort_and_limit():
+    result = run(group_by=["Product"], measures=[{"function": "avg", "column": "Units"}],
+                 filters=[{"column": "Region", "op": "in", "value": ["north", "SOUTH"]},
+                          {"column": "C", "op": "ge", "value": 2}],
+                 sort=[{"by": "avg(Units)", "descending": True}], limit=1)
+    assert result["rows"] == [["Pen", 7]]
+    assert result["total_groups"] == 2 and result["matched_rows"] == 4
+
+def test_pivot():
+    result = run(group_by=["Region"], pivot="Product", measures=[{"function": "sum", "column": "Units"}])
+    assert result["columns"] == ["Region", "Ink", "Pen"]
+    assert result["rows"] == [["East", None, 0], ["North", 2, 11], ["south", 5, 4]]
+
+def test_totals_without_group_by():
+    assert run(measures=[{"function": "sum", "column": "Units"}], filters=[{"column": "Product", "op": "contains", "value": "EN"}])["rows"] == [[15]]
+
+def test_range_without_header():
+    result = run(range="A2:C7", header=False, group_by=["B"], measures=[{"function": "min", "column": "C"}])
+    assert result["rows"] == [["Ink", 2], ["Pen", 1]]
+
+@pytest.mark.parametrize("query, message", [
+    ({"group_by": ["Colour"]}, "Unknown column"),
+    ({"range": "A1:"}, "Invalid range"),
+    ({"measures": [{"function": "sum"}]}, "needs a column"),
+    ({"sort": [{"by": "Units"}]}, "isn't an output column"),
+    ({"filters": [{"column": "Units", "op": "lt", "value": True}]}, "need a number or text"),
+    ({"filters": [{"column": "Units", "op": "in", "value": 3}]}, "need a list"),
+])
+def test_invalid_queries(query, message):
+    with pytest.raises(ValueError, match=message):
+        run(**query)
+
+def test_too_many_pivot_values():
+    rows = [["Key", "Value"]] + [[f"k{i}", i] for i in range(201)]
+    with pytest.raises(ValueError, match="distinct values"):
+        run(rows, pivot="Key")
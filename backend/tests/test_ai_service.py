@@ -0,0 +1,118 @@
+import re
+from types import SimpleNamespace
+import pytest
+from database.database import Database
+from services import ai_service
+from services.ai_service import ITEM_MARKER_PATTERN, AIService
+from services.text_segmentation import reassemble, split_paragraphs, split_sentences
+
+class FakeModel:
+    """Answers single and packed prompts by applying ``fix`` to each item"""
+
+    def __init__(self, fix, drop_items=()):
+        self.fix = fix
+        self.drop_items = set(drop_items)
+        self.prompts = []
+
+    def generate(self, prompt, action):
+        self.prompts.append(prompt)
+        if "Return only the result:\n\n" in prompt:
+            return SimpleNamespace(text=self.fix(prompt.split("Return only the result:\n\n", 1)[1]))
+        body = prompt.split("\n\n", 1)[1]
+        markers = list(ITEM_MARKER_PATTERN.finditer(body))
+        reply = []
+        for position, match in enumerate(markers):
+            end = markers[position + 1].start() if position + 1 < len(markers) else len(body)
+            if int(match.group(1)) not in self.drop_items:
+                reply.append(f"<<<ITEM {match.group(1)}>>>\n{self.fix(body[match.end():end].strip())}")
+        return SimpleNamespace(text="\n".join(reply))
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(Database, "execute_query", staticmethod(lambda query, params=None, fetch=False: []))
+    monkeypatch.setattr(Database, "executemany", staticmethod(lambda query, rows: len(rows)))
+    service = AIService()
+    service.enabled = True
+    return service
+
+def use_model(service, model):
+    service._generate = model.generate
+    return model
+
+def test_segments_keep_offsets_into_the_text():
+    text = "First one.  Second? \n\n  Third para.\r\n\r\nLast"
+    sentences = split_sentences(text)
+    assert [segment.text for segment in sentences] == ["First one.", "Second?", "Third para.", "Last"]
+    assert all(text[segment.start:segment.end] == segment.text for segment in sentences)
+    assert [segment.text for segment in split_paragraphs(text)] == ["First one.  Second?", "Third para.", "Last"]
+    assert reassemble(text, sentences, ["1", "2", "3", "4"]) == "1  2 \n\n  3\r\n\r\n4"
+    assert split_sentences("  \n\n ") == []
+
+def test_pack_and_unpack_round_trip():
+    prompt = AIService._pack_prompt("Fix these.", ["one", "two\nlines"])
+    assert "<<<ITEM 1>>>\none\n<<<ITEM 2>>>\ntwo\nlines" in prompt
+    assert AIService._unpack_response("<<<ITEM 2>>>\nB\n<<<ITEM 1>>> A\n<<<ITEM 9>>>\nX", 3) == ["A", "B", None]
+
+def test_chunks_respect_item_and_character_limits(monkeypatch):
+    monkeypatch.setattr(ai_service, "AI_BATCH_PACK_MAX_ITEMS", 3)
+    monkeypatch.setattr(ai_service, "AI_BATCH_PACK_MAX_CHARS", 10)
+    assert AIService._chunk_by_size([1, 1, 1, 1, 5, 6, 20, 1]) == [[0, 1, 2], [3, 4], [5], [6], [7]]
+
+def test_items_missing_from_a_packed_reply_are_retried_alone(service):
+    model = use_model(service, FakeModel(str.upper, drop_items={2}))
+    assert service._run_items("grammar_check", "Fix.", ["a", "b", "c"]) == ["A", "B", "C"]
+    assert len(model.prompts) == 2
+
+def test_grammar_checks_only_segments_not_seen_before(service):
+    model = use_model(service, FakeModel(lambda text: text.replace("teh", "the")))
+    first = service._check_grammar("I saw teh cat.\n\nIt was fine.")
+    assert first["corrected"] == "I saw the cat.\n\nIt was fine."
+    assert first["corrections"] == [{"offset": 6, "length": 3, "original": "teh", "replacement": "the", "type": "replace"}]
+    assert first["segments_checked"] == 2 and len(model.prompts) == 1
+
+    second = service._check_grammar("It was fine.\n\nNew teh paragraph.")
+    assert second["corrected"] == "It was fine.\n\nNew the paragraph."
+    assert (second["segments_cached"], second["segments_checked"]) == (1, 1)
+    assert "It was fine." not in model.prompts[-1]
+
+def test_grammar_check_fails_only_when_every_segment_does(service):
+    def broken(prompt, action):
+        raise RuntimeError("upstream down")
+    service._generate = broken
+    assert service._check_grammar("One.\n\nTwo.")["type"] == "fallback"
+
+def test_translation_reuses_memory_per_sentence(service):
+    model = use_model(service, FakeModel(lambda text: f"[{text}]"))
+    parameters = {"target_language": "French"}
+    first = service._translate_text("Hello there. How are you?", parameters)
+    assert first["translated"] == "[Hello there.] [How are you?]"
+    assert first["translation_memory"]["exact_hits"] == 0
+
+    second = service._translate_text("How are you? Fine.", parameters)
+    assert second["translated"] == "[How are you?] [Fine.]"
+    assert second["translation_memory"] == {
+        "segments": 2, "exact_hits": 1, "fuzzy_hits": 0, "translated": 1, "failed": 0, "hit_ratio": 0.5
+    }
+    assert "How are you?" not in model.prompts[-1]
+    # Memory is per target language
+    assert service._translate_text("Fine.", {"target_language": "German"})["translation_memory"]["exact_hits"] == 0
+
+def test_fuzzy_matches_are_opt_in(service):
+    use_model(service, FakeModel(lambda text: f"[{text}]"))
+    service._translate_text("The quarterly report is ready.", {"target_language": "French"})
+    near = "The quarterly reports are ready."
+    exact_only = service._translate_text(near, {"target_language": "French"})
+    assert exact_only["translation_memory"]["fuzzy_hits"] == 0
+    fuzzy = service._translate_text("The quarterly report is ready!", {"target_language": "French", "fuzzy_threshold": 0.9})
+    assert fuzzy["translated"] == "[The quarterly report is ready.]"
+    assert fuzzy["translation_memory"]["fuzzy_hits"] == 1
+
+def test_batch_groups_compatible_requests(service, monkeypatch):
+    from models.models import AIRequest
+    monkeypatch.setattr(service, "_save_ai_history_batch", lambda entries, user_id: [f"h{i}" for i in range(len(entries))])
+    model = use_model(service, FakeModel(lambda text: re.sub("teh", "the", text)))
+    requests = [AIRequest(action="grammar_check", document_id=f"doc-{i}", text_content=f"Teh {i} and teh.") for i in range(3)]
+    responses = service.process_batch(requests, "user-1")
+    assert [response.output_data["corrected"] for response in responses] == [f"Teh {i} and the." for i in range(3)]
+    assert [response.id for response in responses] == ["h0", "h1", "h2"]
+    assert len(model.prompts) == 1
@@ -0,0 +1,119 @@
+import os
+import time
+from datetime import datetime
+import orjson
+import pytest
+import pytest_asyncio
+from models.models import DocumentUpdate
+from services import autosave
+from services.autosave import AutosaveBuffer, AutosaveJournal
+from services.document_service import DocumentConflictError, DocumentService
+
+class StoredDocuments:
+    """The DocumentService calls the buffer makes, over rows in a dict"""
+
+    def __init__(self):
+        self.rows = {"doc-1": {"id": "doc-1", "title": "Notes", "content": '{"text":"a"}', "version": 4,
+                               "access_level": "owner", "updated_at": datetime(2024, 1, 1)}}
+        self.writes = []
+
+    def get_editable_document(self, document_id, user_id):
+        row = self.rows.get(document_id)
+        return dict(row) if row else None
+
+    def get_access_level(self, document_id, user_id):
+        return "owner" if document_id in self.rows else None
+
+    def write_changes(self, document_id, title, content_json, expected_version):
+        self.writes.append((document_id, title, content_json, expected_version))
+        row = self.rows.get(document_id)
+        if row is None or row["version"] != expected_version:
+            return None
+        if title is not None:
+            row["title"] = title
+        if content_json is not None:
+            row["content"] = content_json
+        row["version"] += 1
+        return row["version"]
+
+@pytest.fixture
+def documents(monkeypatch):
+    stored = StoredDocuments()
+    for name in ("get_editable_document", "get_access_level", "write_changes"):
+        monkeypatch.setattr(DocumentService, name, staticmethod(getattr(stored, name)))
+    monkeypatch.setattr(DocumentService, "render_document_json", staticmethod(lambda row: orjson.dumps(row)))
+    monkeypatch.setattr(autosave, "AUTOSAVE_FSYNC", False)
+    return stored
+
+@pytest_asyncio.fixture
+async def buffer(tmp_path, documents):
+    buffer = AutosaveBuffer(flush_interval=3600, journal_dir=str(tmp_path))
+    await buffer.start()
+    yield buffer
+    await buffer.stop()
+
+@pytest.mark.asyncio
+async def test_saves_are_merged_into_one_write(buffer, documents):
+    await buffer.save("doc-1", "user-1", DocumentUpdate(title="Draft"))
+    response = await buffer.save("doc-1", "user-1", DocumentUpdate(content={"text": "ab"}))
+    assert orjson.loads(response)["version"] == 5 and orjson.loads(response)["title"] == "Draft"
+    assert documents.writes == []
+
+    rows = [{"id": "doc-1", "title": "Notes", "content": '{"text":"a"}', "version": 4}]
+    buffer.overlay(rows)
+    assert rows[0]["title"] == "Draft" and rows[0]["content"] == '{"text":"ab"}' and rows[0]["buffered"]
+
+    await buffer.flush()
+    assert documents.writes == [("doc-1", "Draft", '{"text":"ab"}', 4)]
+    assert documents.rows["doc-1"]["version"] == 5 and "doc-1" not in buffer.pending
+    assert AutosaveJournal.read(buffer.journal.path) == {}
+
+@pytest.mark.asyncio
+async def test_a_change_elsewhere_drops_the_buffered_saves(buffer, documents):
+    await buffer.save("doc-1", "user-1", DocumentUpdate(title="Mine"))
+    documents.rows["doc-1"]["version"] = 5
+    await buffer.flush()
+    assert documents.rows["doc-1"]["title"] == "Notes" and buffer.write_conflicts == 1
+    with pytest.raises(DocumentConflictError):
+        await buffer.save("doc-1", "user-1", DocumentUpdate(title="Again"))
+    # Only the next saver is told; later saves start from the current document
+    await buffer.save("doc-1", "user-1", DocumentUpdate(title="Again"))
+    await buffer.flush()
+    assert documents.rows["doc-1"]["title"] == "Again"
+
+@pytest.mark.asyncio
+async def test_saves_of_documents_the_user_cannot_see_are_refused(buffer):
+    assert await buffer.save("doc-missing", "user-1", DocumentUpdate(title="x")) is None
+
+def test_journal_read_merges_saves_on_the_latest_base(tmp_path):
+    path = tmp_path / "journal.log"
+    records = [
+        {"document_id": "doc-1", "base_version": 3, "title": "old", "content": None},
+        {"document_id": "doc-1", "base_version": 4, "title": "T", "content": None},
+        {"document_id": "doc-1", "base_version": 4, "title": None, "content": '{"a":1}'},
+        {"document_id": "doc-2", "base_version": 1, "title": "U", "content": None},
+    ]
+    path.write_bytes(b"".join(orjson.dumps(record) + b"\n" for record in records) + b'{"document_id": "do')
+    assert AutosaveJournal.read(str(path)) == {
+        "doc-1": {"document_id": "doc-1", "base_version": 4, "title": "T", "content": '{"a":1}'},
+        "doc-2": {"document_id": "doc-2", "base_version": 1, "title": "U", "content": None},
+    }
+
+@pytest.mark.asyncio
+async def test_orphaned_journals_are_replayed_onto_unchanged_documents(buffer, documents, tmp_path):
+    orphan = tmp_path / "journal-dead.log"
+    orphan.write_bytes(
+        orjson.dumps({"document_id": "doc-1", "base_version": 4, "title": "Recovered", "content": None}) + b"\n"
+        + orjson.dumps({"document_id": "doc-gone", "base_version": 2, "title": "Lost", "content": None}) + b"\n"
+    )
+    stale = time.time() - autosave.AUTOSAVE_JOURNAL_STALE_SECONDS - 10
+    os.utime(orphan, (stale, stale))
+
+    claimed = buffer.journal.claim_orphans()
+    assert len(claimed) == 1 and not orphan.exists()
+    # A fresh journal belongs to a live process
+    assert buffer.journal.claim_orphans() == []
+    await buffer._replay(claimed[0])
+    assert documents.rows["doc-1"]["title"] == "Recovered"
+    assert (buffer.replayed, buffer.replay_conflicts) == (1, 1)
+    assert not os.path.exists(claimed[0])
@@ -0,0 +1,104 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import time
+import pytest
+from services import blob_store
+from services.blob_store import BlobStore, UploadBusyError, UploadNotFoundError, UploadOffsetError, content_disposition
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path))
+
+async def stream(*chunks, pause: float = 0):
+    for chunk in chunks:
+        if pause:
+            await asyncio.sleep(pause)
+        yield chunk
+
+@pytest.mark.asyncio
+async def test_resumable_upload_is_content_addressed(store):
+    upload = await store.create_upload("user-1", "report.pdf", total_size=6)
+    assert await store.append_chunk(upload["upload_id"], "user-1", 0, stream(b"abc")) == 3
+    with pytest.raises(UploadOffsetError) as raised:
+        await store.append_chunk(upload["upload_id"], "user-1", 0, stream(b"abc"))
+    assert raised.value.expected_offset == 3
+    await store.append_chunk(upload["upload_id"], "user-1", 3, stream(b"d", b"ef"))
+    blob = await store.complete_upload(upload["upload_id"], "user-1")
+    digest = hashlib.sha256(b"abcdef").hexdigest()
+    assert blob == {"file_path": store.blob_key(digest), "file_size": 6, "sha256": digest, "filename": "report.pdf"}
+    with open(store.blob_path(blob["file_path"]), "rb") as f:
+        assert f.read() == b"abcdef"
+
+@pytest.mark.asyncio
+async def test_uploads_belong_to_their_user(store):
+    upload = await store.create_upload("user-1", "a.txt")
+    with pytest.raises(UploadNotFoundError):
+        await store.append_chunk(upload["upload_id"], "user-2", 0, stream(b"x"))
+
+@pytest.mark.asyncio
+async def test_declared_size_is_enforced(store):
+    upload = await store.create_upload("user-1", "a.txt", total_size=2)
+    with pytest.raises(ValueError):
+        await store.append_chunk(upload["upload_id"], "user-1", 0, stream(b"abc"))
+
+@pytest.mark.asyncio
+async def test_concurrent_chunks_at_one_offset_do_not_interleave(store):
+    upload = await store.create_upload("user-1", "a.bin")
+    upload_id = upload["upload_id"]
+    first = store.append_chunk(upload_id, "user-1", 0, stream(b"a" * 10, b"a" * 10, pause=0.01))
+    second = store.append_chunk(upload_id, "user-1", 0, stream(b"b" * 10, b"b" * 10, pause=0.01))
+    results = await asyncio.gather(first, second, return_exceptions=True)
+    assert 20 in results
+    rejected = next(result for result in results if result != 20)
+    assert isinstance(rejected, UploadOffsetError) and rejected.expected_offset == 20
+    blob = await store.complete_upload(upload_id, "user-1")
+    winner = b"a" if results[0] == 20 else b"b"
+    assert blob["sha256"] == hashlib.sha256(winner * 20).hexdigest()
+    assert store._locks == {}
+
+@pytest.mark.asyncio
+async def test_upload_written_by_another_process_is_busy(store):
+    upload = await store.create_upload("user-1", "a.bin")
+    fd = os.open(store._session_path(upload["upload_id"]), os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with pytest.raises(UploadBusyError):
+            await store.append_chunk(upload["upload_id"], "user-1", 0, stream(b"x"))
+    finally:
+        os.close(fd)
+    assert await store.append_chunk(upload["upload_id"], "user-1", 0, stream(b"x")) == 1
+
+@pytest.mark.asyncio
+async def test_garbage_collection_spares_active_uploads(store, monkeypatch):
+    monkeypatch.setattr(blob_store, "UPLOAD_SESSION_TTL", 60)
+    old = time.time() - 3600
+    active = await store.create_upload("user-1", "active.bin")
+    abandoned = await store.create_upload("user-1", "abandoned.bin")
+    for upload in (active, abandoned):
+        for path in (store._session_path(upload["upload_id"]), store._part_path(upload["upload_id"])):
+            os.utime(path, (old, old))
+    # A chunk arriving now marks the upload as active, though it was created long ago
+    await store.append_chunk(active["upload_id"], "user-1", 0, stream(b"x"))
+
+    assert store.collect_garbage([]) == {"removed_blobs": 0, "removed_uploads": 2}
+    assert (await store.get_upload(active["upload_id"], "user-1"))["offset"] == 1
+    with pytest.raises(UploadNotFoundError):
+        await store.get_upload(abandoned["upload_id"], "user-1")
+
+def test_parse_range():
+    assert BlobStore.parse_range("bytes=0-99", 1000) == (0, 99)
+    assert BlobStore.parse_range("bytes=900-", 1000) == (900, 999)
+    assert BlobStore.parse_range("bytes=-100", 1000) == (900, 999)
+    assert BlobStore.parse_range("bytes=990-2000", 1000) == (990, 999)
+    for header in ("bytes=1000-", "bytes=5-1", "bytes=0-1,5-6", "items=0-1", "bytes=x-"):
+        assert BlobStore.parse_range(header, 1000) is None
+
+def test_content_disposition_is_latin1_safe():
+    assert content_disposition("report.pdf") == 'attachment; filename="report.pdf"'
+    header = content_disposition("Überblick 报告.xlsx")
+    header.encode("latin-1")
+    assert header == ("attachment; filename=\"Uberblick.xlsx\"; "
+                      "filename*=UTF-8''%C3%9Cberblick%20%E6%8A%A5%E5%91%8A.xlsx")
+    assert content_disposition("报告.pdf").startswith('attachment; filename="download.pdf"')
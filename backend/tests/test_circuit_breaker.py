@@ -0,0 +1,84 @@
+import pytest
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+def breaker():
+    return CircuitBreaker("gemini", window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=5,
+                          slow_call_rate=0.8, open_seconds=30, half_open_probes=2)
+
+def call(breaker, duration=0.1, success=True):
+    breaker.before_call()
+    breaker.record(duration, success)
+
+def test_opens_on_failure_rate_once_enough_calls_are_seen(clock):
+    circuit = breaker()
+    for _ in range(3):
+        call(circuit, success=False)
+    assert circuit.state == CLOSED
+    call(circuit)
+    assert circuit.state == OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        circuit.before_call()
+    assert raised.value.retry_after == 30
+    assert circuit.stats()["rejected"] == 1
+
+def test_opens_on_slow_calls(clock):
+    circuit = breaker()
+    for _ in range(4):
+        call(circuit, duration=6)
+    assert circuit.state == OPEN
+
+def test_half_open_probes_close_the_breaker(clock):
+    circuit = breaker()
+    for _ in range(4):
+        call(circuit, success=False)
+    clock.now += 31
+    assert circuit.stats()["state"] == HALF_OPEN
+    circuit.before_call()
+    circuit.before_call()
+    # Only half_open_probes calls get through while probing
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    circuit.record(0.1, True)
+    circuit.record(0.1, True)
+    assert circuit.state == CLOSED and circuit.stats()["window_calls"] == 0
+
+def test_failed_probe_opens_again(clock):
+    circuit = breaker()
+    for _ in range(4):
+        call(circuit, success=False)
+    clock.now += 31
+    call(circuit, success=False)
+    assert circuit.state == OPEN and circuit.times_opened == 2
+    assert circuit.stats()["retry_after"] == 30
+
+def test_adaptive_timeout_follows_observed_latency():
+    timeouts = AdaptiveTimeout(window=100, percentile=99, multiplier=2, min_seconds=1, max_seconds=60, min_samples=20)
+    assert timeouts.timeout("summarize") == 60
+    for _ in range(19):
+        timeouts.observe("summarize", 2.0)
+    assert timeouts.percentile("summarize", 50) is None
+    timeouts.observe("summarize", 2.0)
+    assert timeouts.timeout("summarize") == 4.0
+    assert timeouts.percentile("summarize", 50) == 2.0
+    for _ in range(10):
+        timeouts.observe("summarize", 0.1)
+    # Bounded below by min_seconds, and keyed per action
+    assert timeouts.timeout("summarize") == 4.0
+    assert timeouts.timeout("translate") == 60
+    for _ in range(100):
+        timeouts.observe("translate", 0.1)
+    assert timeouts.timeout("translate") == 1
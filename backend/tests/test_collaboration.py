@@ -0,0 +1,111 @@
+import asyncio
+import orjson
+import pytest
+from services.collaboration import CLOSE_NOT_FOUND, CollaborationService, Editor, StaleRevisionError
+
+class StoredDocuments(CollaborationService):
+    """Documents in a dict with a version each, written only over the expected version"""
+
+    def __init__(self):
+        super().__init__(broadcast_interval_ms=0, persist_interval=3600)
+        self.documents = {}
+
+    def _load_document(self, document_id):
+        if document_id not in self.documents:
+            return None
+        content_json, version = self.documents[document_id]
+        return orjson.loads(content_json), version
+
+    def _save_document(self, document_id, content_json, expected_version):
+        if document_id not in self.documents or self.documents[document_id][1] != expected_version:
+            return None
+        self.documents[document_id] = (content_json, expected_version + 1)
+        return expected_version + 1
+
+    def _stored_version(self, document_id):
+        return self.documents[document_id][1] if document_id in self.documents else None
+
+    def save_elsewhere(self, document_id, content):
+        """A REST save or flushed autosave that doesn't go through the session"""
+        _, version = self.documents[document_id]
+        self.documents[document_id] = (orjson.dumps(content).decode(), version + 1)
+
+class FakeSocket:
+    def __init__(self):
+        self.close_code = None
+
+    async def close(self, code):
+        self.close_code = code
+
+def frames(editor):
+    messages = []
+    while not editor.outbox.empty():
+        messages.append(orjson.loads(editor.outbox.get_nowait()))
+    return messages
+
+async def open_with_editor(service, document_id="doc-1"):
+    session = await service._open(document_id)
+    editor = Editor(FakeSocket(), "user-1", can_edit=True)
+    session.editors[editor.id] = editor
+    return session, editor
+
+def insert(offset, text):
+    return {"op": "insert", "path": ["text"], "offset": offset, "text": text}
+
+@pytest.mark.asyncio
+async def test_persist_writes_over_the_loaded_version():
+    service = StoredDocuments()
+    service.documents["doc-1"] = ('{"text": "hello"}', 3)
+    session, editor = await open_with_editor(service)
+    session.submit(editor.id, 0, [insert(5, " world")], 1)
+    await service._persist(session)
+    assert service.documents["doc-1"] == ('{"text":"hello world"}', 4)
+    assert session.version == 4 and not session.dirty
+
+@pytest.mark.asyncio
+async def test_save_elsewhere_wins_over_unwritten_session_edits():
+    service = StoredDocuments()
+    service.documents["doc-1"] = ('{"text": "hello"}', 1)
+    session, editor = await open_with_editor(service)
+    session.submit(editor.id, 0, [insert(5, "!")], 1)
+    service.save_elsewhere("doc-1", {"text": "rewritten"})
+
+    await service._persist(session)
+    assert service.documents["doc-1"] == ('{"text":"rewritten"}', 2)
+    assert session.content == {"text": "rewritten"} and session.version == 2
+    snapshot = frames(editor)[-1]
+    assert snapshot["type"] == "snapshot" and snapshot["content"] == {"text": "rewritten"}
+    assert snapshot["rev"] == session.revision == 2
+    # Ops based on the discarded revisions are answered with the snapshot again
+    with pytest.raises(StaleRevisionError):
+        session.submit(editor.id, 1, [insert(0, "x")], 2)
+    session.submit(editor.id, 2, [insert(0, "x")], 3)
+    await service._persist(session)
+    assert service.documents["doc-1"] == ('{"text":"xrewritten"}', 3)
+
+@pytest.mark.asyncio
+async def test_idle_session_picks_up_saves_elsewhere():
+    service = StoredDocuments()
+    service.documents["doc-1"] = ('{"text": "hello"}', 1)
+    session, editor = await open_with_editor(service)
+    await service._check_stored_version(session)
+    assert frames(editor) == []
+
+    service.save_elsewhere("doc-1", {"text": "from the REST API"})
+    await service._check_stored_version(session)
+    assert frames(editor)[-1]["content"] == {"text": "from the REST API"}
+    assert service.external_writes == 1
+
+@pytest.mark.asyncio
+async def test_deleted_document_closes_the_session():
+    service = StoredDocuments()
+    service.documents["doc-1"] = ('{"text": "hello"}', 1)
+    session, editor = await open_with_editor(service)
+    session.submit(editor.id, 0, [insert(0, "a")], 1)
+    del service.documents["doc-1"]
+
+    await service._persist(session)
+    await asyncio.sleep(0)
+    assert editor.websocket.close_code == CLOSE_NOT_FOUND
+    assert "doc-1" not in service.sessions
+    assert not session.dirty
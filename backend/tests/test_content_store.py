@@ -0,0 +1,65 @@
+import zlib
+import pytest
+from database.database import Database
+from services import content_store
+from services.content_store import ContentStore, content_cache
+
+@pytest.fixture
+def bodies(monkeypatch):
+    """document_contents in a dict; records which hashes each SELECT asked for"""
+    table = {}
+    selects = []
+
+    def execute_query(query, params=None, fetch=False):
+        query = " ".join(query.split())
+        if query.startswith("INSERT INTO document_contents"):
+            content_hash, encoding, size, body = params
+            table.setdefault(content_hash, {"hash": content_hash, "encoding": encoding, "size": size, "body": body})
+            return 1
+        if query.startswith("SELECT hash, encoding, body FROM document_contents"):
+            selects.append(list(params))
+            return [table[content_hash] for content_hash in params if content_hash in table]
+        raise AssertionError(f"unexpected query {query}")
+
+    monkeypatch.setattr(Database, "execute_query", staticmethod(execute_query))
+    monkeypatch.setattr(content_store, "DOCUMENT_INLINE_MAX_BYTES", 64)
+    content_cache.clear()
+    yield table, selects
+    content_cache.clear()
+
+def test_small_content_stays_inline(bodies):
+    assert ContentStore.store('{"text": "short"}') == ('{"text": "short"}', None)
+    assert ContentStore.store(None) == (None, None)
+    assert bodies[0] == {}
+
+def test_large_content_is_stored_once_per_hash_and_compressed(bodies):
+    table, _ = bodies
+    content_json = '{"text": "' + "repetitive " * 50 + '"}'
+    content, content_hash = ContentStore.store(content_json)
+    assert content is None and ContentStore.store(content_json) == (None, content_hash)
+    stored = table[content_hash]
+    assert stored["encoding"] == "zlib" and stored["size"] == len(content_json)
+    assert zlib.decompress(stored["body"]).decode() == content_json
+
+def test_compression_can_be_turned_off(bodies, monkeypatch):
+    table, _ = bodies
+    monkeypatch.setattr(content_store, "DOCUMENT_CONTENT_COMPRESSION", "none")
+    content_json = '{"text": "' + "repetitive " * 50 + '"}'
+    _, content_hash = ContentStore.store(content_json)
+    assert table[content_hash]["encoding"] == "identity" and table[content_hash]["body"] == content_json.encode()
+
+def test_load_many_reads_uncached_bodies_in_one_query(bodies):
+    _, selects = bodies
+    hashes = [ContentStore.store('{"n": %d, "pad": "%s"}' % (n, "x" * 80))[1] for n in range(3)]
+    content_cache.delete(hashes[1])
+    content_cache.delete(hashes[2])
+    loaded = ContentStore.load_many(hashes + [hashes[2], "missing"])
+    assert sorted(loaded) == sorted(hashes)
+    assert loaded[hashes[1]].startswith(b'{"n": 1')
+    # The replica pass and the primary retry for the hash nobody has
+    assert selects == [[hashes[1], hashes[2], "missing"], ["missing"]]
+    assert ContentStore.load(hashes[2]) == loaded[hashes[2]] and len(selects) == 2
+
+def test_unknown_encoding_is_an_error():
+    with pytest.raises(ValueError):
+        ContentStore._decode("brotli", b"")
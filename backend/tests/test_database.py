@@ -0,0 +1,81 @@
+import pytest
+from database import database
+from database.database import Database, Replica, statement_operation
+from services.document_service import DocumentService
+
+@pytest.mark.parametrize("query, operation", [
+    ("SELECT * FROM documents", "SELECT"),
+    ("  \n\tselect 1", "SELECT"),
+    ("(SELECT 1) UNION ALL (SELECT 2) ORDER BY 1", "SELECT"),
+    ("/* listing */ -- first page\n ((SELECT 1))", "SELECT"),
+    ("# note\nSELECT 1", "SELECT"),
+    ("WITH recent AS (SELECT id FROM documents) SELECT * FROM recent", "SELECT"),
+    ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT i FROM n", "SELECT"),
+    ("WITH old AS (SELECT ')' AS x) DELETE FROM documents WHERE id IN (SELECT x FROM old)", "DELETE"),
+    ("INSERT INTO documents SELECT * FROM drafts", "INSERT"),
+    ("update documents set version = version + 1", "UPDATE"),
+    ("", "UNKNOWN"),
+])
+def test_statement_operation(query, operation):
+    assert statement_operation(query) == operation
+
+@pytest.fixture
+def replica(monkeypatch):
+    """One healthy replica; reads sent to it are recorded instead of run"""
+    replica = Replica(0, "replica-1")
+    reads = []
+
+    def replica_read(cls, replica, call_site, query, params, single):
+        reads.append(query)
+        return None if single else []
+
+    def no_primary(cls):
+        raise AssertionError("read went to the primary")
+
+    monkeypatch.setattr(Database, "_replicas", [replica])
+    monkeypatch.setattr(Database, "_replica_read", classmethod(replica_read))
+    monkeypatch.setattr(Database, "get_connection", classmethod(no_primary))
+    Database.bind_session(None)
+    replica.reads = reads
+    return replica
+
+def test_document_listing_reads_from_replica(replica):
+    assert DocumentService._fetch_accessible_documents("user-1", [], [], limit=10) == []
+    assert len(replica.reads) == 1
+    assert replica.reads[0].lstrip().startswith("(SELECT")
+
+def test_recent_writer_reads_from_primary(replica, monkeypatch):
+    monkeypatch.setattr(database, "recent_writers", {"user-1": True})
+    Database.bind_session("user-1")
+    try:
+        assert Database._read_replica("(SELECT 1) UNION (SELECT 2)") is None
+        assert Database.reads_from_primary()
+    finally:
+        Database.bind_session(None)
+
+def test_writes_and_forced_reads_stay_on_primary(replica):
+    assert Database._read_replica("UPDATE documents SET title = 'x'") is None
+    with Database.primary():
+        assert Database._read_replica("SELECT 1") is None
+    assert Database._read_replica("SELECT 1") is replica
+
+def test_ejected_replica_gets_no_reads(replica):
+    replica.eject("lag 10s")
+    assert Database._read_replica("SELECT 1") is None
+
+def test_call_site_names_the_calling_method():
+    def execute_query():
+        return Database._call_site()
+
+    class Service:
+        @staticmethod
+        def load():
+            return execute_query()
+
+    assert Service.load().endswith("Service.load")
+
+def test_call_site_falls_back_to_the_bare_name_before_python_311():
+    class Code:
+        co_name = "get_document"
+
+    assert database._qualname(Code()) == "get_document"
@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from datetime import datetime
+import orjson
+import pytest
+from database.database import Database
+from models.models import DocumentResponse
+from services.content_store import ContentStore
+from services.document_service import DocumentAccessError, DocumentService, access_cache
+
+@pytest.fixture
+def shared_document(monkeypatch):
+    """doc-1 owned by owner and shared with two editors, their access already cached"""
+    documents = {"doc-1": ["editor-1", "editor-2"]}
+    statements = []
+
+    def execute_query(query, params=None, fetch=False):
+        query = " ".join(query.split())
+        statements.append(query)
+        if query.startswith("SELECT user_id FROM document_collaborators"):
+            return [{"user_id": user_id} for user_id in documents.get(params[0], [])]
+        if query.startswith("DELETE FROM documents"):
+            return 1 if documents.pop(params[0], None) is not None else 0
+        raise AssertionError(f"unexpected query {query}")
+
+    @contextmanager
+    def transaction():
+        yield None
+
+    monkeypatch.setattr(Database, "execute_query", staticmethod(execute_query))
+    monkeypatch.setattr(Database, "transaction", staticmethod(transaction))
+    access_cache.clear()
+    access_cache.set(("doc-1", "owner"), "owner")
+    access_cache.set(("doc-1", "editor-1"), "edit")
+    access_cache.set(("doc-1", "editor-2"), "view")
+    access_cache.set(("doc-2", "editor-1"), "edit")
+    yield statements
+    access_cache.clear()
+
+def test_delete_evicts_every_collaborators_access(shared_document):
+    assert DocumentService.delete_document("doc-1", "owner")
+    for user_id in ("owner", "editor-1", "editor-2"):
+        assert access_cache.get(("doc-1", user_id)) is None
+    assert access_cache.get(("doc-2", "editor-1")) == "edit"
+
+def test_only_the_owner_can_delete(shared_document):
+    with pytest.raises(DocumentAccessError):
+        DocumentService.delete_document("doc-1", "editor-1")
+    assert shared_document == []
+    assert access_cache.get(("doc-1", "editor-2")) == "view"
+
+def test_document_json_splices_stored_content(monkeypatch):
+    row = {"id": "doc-1", "user_id": "owner", "title": "Notes", "document_type": "writer", "file_path": None,
+           "file_size": None, "version": None, "created_at": datetime(2024, 1, 1), "updated_at": datetime(2024, 1, 2),
+           "access_level": "owner", "content": '{"text": "héllo",  "n": 1}', "content_hash": None}
+    rendered = DocumentService._document_json(row)
+    # Stored bytes go out untouched, spacing included
+    assert rendered.endswith(b',"content":{"text": "h\xc3\xa9llo",  "n": 1}}')
+    document = DocumentResponse.model_validate_json(rendered)
+    assert document.version == 1 and document.content == {"text": "héllo", "n": 1}
+
+    offloaded = {**row, "content": None, "content_hash": "abc"}
+    monkeypatch.setattr(ContentStore, "load", staticmethod(lambda content_hash: b'{"big": true}'))
+    assert orjson.loads(DocumentService._document_json(offloaded))["content"] == {"big": True}
+    assert orjson.loads(DocumentService._document_json({**row, "content": None}))["content"] is None
@@ -0,0 +1,67 @@
+import io
+from datetime import datetime
+import pytest
+from openpyxl import load_workbook
+from models.models import DocumentResponse, DocumentType
+from services.export_service import ExportService
+
+def spreadsheet(sheets, document_id="doc-export"):
+    return DocumentResponse(
+        id=document_id, user_id="user-1", title="Export", document_type=DocumentType.SPREADSHEET,
+        content={"sheets": sheets}, version=1, created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1)
+    )
+
+@pytest.mark.parametrize("value, expected", [
+    ("12", 12),
+    ("-3", -3),
+    ("0", 0),
+    ("2.50", 2.5),
+    ("1e3", 1000.0),
+    ("0.5", 0.5),
+    ("007", "007"),
+    ("00.5", "00.5"),
+    ("1_000", "1_000"),
+    (" 12 ", " 12 "),
+    ("+5", "+5"),
+    ("1.", "1."),
+    ("nan", "nan"),
+    ("inf", "inf"),
+    ("1e999", "1e999"),
+    ("4111111111111111", "4111111111111111"),
+    ("", ""),
+    (None, None),
+    (True, True),
+    (7, 7),
+    ({"a": 1}, "{'a': 1}"),
+])
+def test_xlsx_cell(value, expected):
+    assert ExportService._xlsx_cell(value) == expected
+
+def test_xlsx_titles_are_sanitized_and_unique():
+    taken = set()
+    assert ExportService._xlsx_title("Q1/Q2 [draft]: *totals?*", taken) == "Q1_Q2 _draft__ _totals__"
+    assert ExportService._xlsx_title("Budget", taken) == "Budget"
+    assert ExportService._xlsx_title("budget", taken) == "budget (2)"
+    assert ExportService._xlsx_title("BUDGET", taken) == "BUDGET (3)"
+    long_name = "x" * 40
+    assert ExportService._xlsx_title(long_name, taken) == "x" * 31
+    assert ExportService._xlsx_title(long_name + "y", taken) == "x" * 27 + " (2)"
+    assert ExportService._xlsx_title("''", taken) == "Sheet"
+    assert ExportService._xlsx_title(2024, taken) == "2024"
+
+def test_write_xlsx_with_awkward_sheet_names():
+    document = spreadsheet([
+        {"name": "Sales/2024", "data": [["id", "amount"], ["007", "12"], ["A1", "=B2*2"]]},
+        {"name": "sales/2024", "data": [["second"]]},
+    ])
+    output = io.BytesIO()
+    ExportService._write_xlsx(document, output)
+    workbook = load_workbook(io.BytesIO(output.getvalue()))
+    assert workbook.sheetnames == ["Sales_2024", "sales_2024 (2)"]
+    rows = [list(row) for row in workbook["Sales_2024"].iter_rows(values_only=True)]
+    assert rows == [["id", "amount"], ["007", 12], ["A1", 24]]
+
+def test_write_xlsx_without_rows_has_a_sheet():
+    output = io.BytesIO()
+    ExportService._write_xlsx(spreadsheet([], document_id="doc-empty"), output)
+    assert load_workbook(io.BytesIO(output.getvalue())).sheetnames == ["Sheet1"]
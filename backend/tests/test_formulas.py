@@ -0,0 +1,127 @@
+import pytest
+from services import formulas
+from services.formulas import (
+    CYCLE, DIV_ZERO, MAX_ROWS, NAME, REF, SYNTAX, VALUE, FormulaSyntaxError, Workbook, parse_formula, references
+)
+
+def grid(workbook: Workbook, sheet: int = 0):
+    return workbook.values()[sheet]["data"]
+
+def evaluate(*rows):
+    return grid(Workbook([{"name": "Sheet1", "data": [list(row) for row in rows]}]))
+
+# Parsing
+
+def test_operator_precedence():
+    assert parse_formula("1+2*3", "S") == ("bin", "+", ("lit", 1.0), ("bin", "*", ("lit", 2.0), ("lit", 3.0)))
+    assert parse_formula("-2^2", "S") == ("bin", "^", ("neg", ("lit", 2.0)), ("lit", 2.0))
+    assert evaluate(["=1+2*3", "=(1+2)*3", "=2^3^2", "=50%", '="a"&1']) == [[7, 9, 64, 0.5, "a1"]]
+
+def test_references():
+    assert parse_formula("$B$2", "S") == ("ref", "S", 1, 1)
+    assert parse_formula("'My sheet'!C3:A1", "S") == ("range", "My sheet", 0, 0, 2, 2)
+    assert parse_formula("A:B", "S") == ("range", "S", 0, 0, MAX_ROWS - 1, 1)
+    cells, ranges = references(parse_formula("SUM(A1:A3, B1) + Other!C2", "S"))
+    assert cells == {("S", 0, 1), ("Other", 1, 2)}
+    assert ranges == [("S", 0, 0, 2, 0)]
+
+def test_function_calls():
+    assert parse_formula('IF(A1,,"x")', "S") == ("call", "IF", [("ref", "S", 0, 0), ("lit", None), ("lit", "x")])
+    assert evaluate([1, 2, "=SUM(A1:B1)", '=IF(C1>2,"big","small")', "=ROUND(2.5, 0)"]) == [[1, 2, 3, "big", 3]]
+
+@pytest.mark.parametrize("formula", ["1+", "SUM(1,", "(1", "1 2", "A1$", "@"])
+def test_syntax_errors(formula):
+    with pytest.raises(FormulaSyntaxError):
+        parse_formula(formula, "S")
+    assert evaluate(["=" + formula]) == [[SYNTAX]]
+
+# Errors
+
+def test_error_values():
+    assert evaluate(["=1/0", "=NOPE(1)", '="a"+1', "=A1+1", "=IFERROR(1/0, 5)", "=ISERROR(A1)"]) == [
+        [DIV_ZERO, NAME, VALUE, DIV_ZERO, 5, True]
+    ]
+
+def test_range_error_propagates_to_aggregates():
+    assert evaluate([1, "=1/0", "=SUM(A1:B1)", "=COUNT(A1:B1)"]) == [[1, DIV_ZERO, DIV_ZERO, 1]]
+
+def test_missing_sheet_is_a_ref_error():
+    assert evaluate(["=Missing!A1", "=SUM(Missing!A:A)"]) == [[REF, REF]]
+
+# Dependencies and cycles
+
+def test_formulas_evaluate_after_their_precedents():
+    # Each formula reads the one to its right, so evaluating left to right would be wrong
+    assert evaluate(["=B1+1", "=C1+1", "=SUM(D1:D2)"], [None, None, None, 5]) == [[7, 6, 5], [None, None, None, 5]]
+
+def test_whole_column_ranges_follow_the_data():
+    workbook = Workbook([{"name": "S", "data": [[1, "=SUM(A:A)"], [2], [3]]}])
+    assert grid(workbook)[0][1] == 6
+    workbook.set_cells([("S", 5, 0, 10)])
+    assert grid(workbook)[0][1] == 16
+
+def test_cycles_and_their_dependents_get_ref():
+    assert evaluate(["=B1", "=A1", "=A1+1", 4, "=D1*2"]) == [[CYCLE, CYCLE, CYCLE, 4, 8]]
+    assert evaluate(["=SUM(A1:B1)", 1]) == [[CYCLE, 1]]
+
+def test_cross_sheet_references():
+    workbook = Workbook([
+        {"name": "Prices", "data": [[10], [20]]},
+        {"name": "Orders", "data": [["=SUM(Prices!A:A)", "=Prices!A2*2"]]},
+    ])
+    assert grid(workbook, 1) == [[30, 40]]
+    workbook.set_cells([("Prices", 1, 0, 5)])
+    assert grid(workbook, 1) == [[15, 10]]
+
+# Incremental recalculation
+
+def test_update_reevaluates_only_dependents():
+    rows = [[i, f"=A{i}*2"] for i in range(1, 101)] + [["=SUM(B1:B100)"]]
+    workbook = Workbook([{"name": "S", "data": rows}])
+    assert workbook.evaluations == 101
+    changed = [row[:] for row in rows]
+    changed[9][0] = 1000
+    assert workbook.update([{"name": "S", "data": changed}])
+    # B10 and the total
+    assert workbook.evaluations == 103
+    assert grid(workbook)[9][1] == 2000
+    assert grid(workbook)[100][0] == sum(2 * i for i in range(1, 101)) - 20 + 2000
+
+def test_update_replaces_formulas_and_their_ranges():
+    workbook = Workbook([{"name": "S", "data": [[1, 2, "=SUM(A1:A1)"]]}])
+    workbook.update([{"name": "S", "data": [[1, 2, "=SUM(B1:B1)"]]}])
+    workbook.set_cells([("S", 0, 0, 50)])
+    assert grid(workbook) == [[50, 2, 2]]
+    workbook.update([{"name": "S", "data": [[50, 2, 7]]}])
+    workbook.set_cells([("S", 0, 1, 9)])
+    assert grid(workbook) == [[50, 9, 7]]
+
+def test_update_refuses_renamed_sheets():
+    workbook = Workbook([{"name": "S", "data": [[1]]}])
+    assert not workbook.update([{"name": "T", "data": [[1]]}])
+
+def test_breaking_a_cycle_recovers():
+    workbook = Workbook([{"name": "S", "data": [["=B1", "=A1"]]}])
+    workbook.update([{"name": "S", "data": [["=B1", 3]]}])
+    assert grid(workbook) == [[3, 3]]
+
+@pytest.mark.parametrize("threshold", [0, 10000])
+def test_large_recalculations_match_a_fresh_build(monkeypatch, threshold):
+    # 0 forces the single range scan, 10000 the per-cell index lookups
+    monkeypatch.setattr(formulas, "RANGE_SCAN_MIN_CELLS", threshold)
+    rows = [[i, f"=SUM(A$1:A{i + 1})", f"=B{i + 1}-A{i + 1}", f"=SUM(A{i + 1}:C{i + 1})"] for i in range(200)]
+    rows.append(["=D1", "=A201+1"])
+    workbook = Workbook([{"name": "S", "data": rows}])
+    changed = [row[:] for row in rows]
+    for row in changed[::7]:
+        row[0] = -row[0]
+    workbook.update([{"name": "S", "data": changed}])
+    assert grid(workbook) == grid(Workbook([{"name": "S", "data": changed}]))
+
+def test_list_cells_load_as_text():
+    assert evaluate(["a"], [[1, 2]], [[3, 4]]) == [["a"], ["[1, 2]"], ["[3, 4]"]]
+
+def test_numeric_text_shows_as_typed_but_computes_as_a_number():
+    assert evaluate(["007", " 12 ", "+5", "2.50", "-3", "=A1+B1+C1"]) == [["007", " 12 ", "+5", 2.5, -3, 24]]
+    # The same column through the all-numeric fast path
+    assert evaluate(["007"], ["1"], ["=A1*2"]) == [["007"], [1], [14]]
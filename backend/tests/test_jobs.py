@@ -0,0 +1,177 @@
+import asyncio
+import threading
+from datetime import datetime
+import pytest
+from pydantic import ValidationError
+from database.database import Database
+from models.models import AIJobCreate, AIResponse, JobStatus
+from services import job_service
+from services.job_service import JobService
+
+def job_body(**fields):
+    return {"action": "summarize", "document_id": "doc-1", "text_content": "Some text", **fields}
+
+def test_priority_defaults_to_the_highest():
+    assert AIJobCreate(**job_body()).priority == 0
+    assert AIJobCreate(**job_body(priority=-10)).priority == -10
+
+@pytest.mark.parametrize("priority", [1, 100, 2 ** 31, -11, -(2 ** 40)])
+def test_priority_out_of_range_is_rejected(priority):
+    with pytest.raises(ValidationError):
+        AIJobCreate(**job_body(priority=priority))
+
+def test_submit_rejects_queue_jumping(client):
+    response = client.post("/api/ai/jobs", json=job_body(priority=2 ** 40))
+    assert response.status_code == 422
+
+class JobTable:
+    """ai_jobs in a dict, answering the statements JobService sends"""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def execute_query(self, query, params=None, fetch=False):
+        query = " ".join(query.split())
+        if query.startswith("INSERT INTO ai_jobs"):
+            fields = ("id", "user_id", "document_id", "ai_action", "status", "priority", "max_attempts", "request_data")
+            self.jobs[params[0]] = dict(
+                zip(fields, params), attempts=0, result_data=None, history_id=None, error=None,
+                created_at=datetime.now(), started_at=None, finished_at=None
+            )
+            return 1
+        if query.startswith("UPDATE ai_jobs SET status = %s, attempts = attempts + 1"):
+            status, started_at, job_id, expected_status, expected_attempts = params
+            job = self.jobs[job_id]
+            if job["status"] != expected_status or job["attempts"] != expected_attempts:
+                return 0
+            job.update(status=status, attempts=job["attempts"] + 1, started_at=started_at)
+            return 1
+        if query.startswith("UPDATE ai_jobs SET status = %s, error = %s WHERE id = %s"):
+            self.jobs[params[2]].update(status=params[0], error=params[1])
+            return 1
+        if query.startswith("UPDATE ai_jobs SET status = %s, result_data"):
+            status, result_data, history_id, error, finished_at, job_id = params
+            self.jobs[job_id].update(status=status, result_data=result_data, history_id=history_id,
+                                     error=error, finished_at=finished_at)
+            return 1
+        if query.startswith("UPDATE ai_jobs SET status = %s WHERE status = %s AND id IN"):
+            status, expected_status, *job_ids = params
+            requeued = [self.jobs[job_id] for job_id in job_ids if self.jobs[job_id]["status"] == expected_status]
+            for job in requeued:
+                job["status"] = status
+            return len(requeued)
+        raise AssertionError(f"unexpected query {query}")
+
+    def execute_single_query(self, query, params=None):
+        query = " ".join(query.split())
+        job = self.jobs.get(params[0])
+        if query == "SELECT * FROM ai_jobs WHERE id = %s":
+            return dict(job) if job else None
+        if query == "SELECT * FROM ai_jobs WHERE id = %s AND user_id = %s":
+            return dict(job) if job and job["user_id"] == params[1] else None
+        raise AssertionError(f"unexpected query {query}")
+
+class ScriptedAI:
+    """Raises the given errors in turn, then answers"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def process_ai_request(self, request, user_id):
+        self.calls.append((request.document_id, user_id))
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIResponse(id=f"history-{len(self.calls)}", action=request.action, output_data={"summary": "ok"},
+                          processing_time_ms=1, created_at=datetime.now())
+
+@pytest.fixture
+def jobs(monkeypatch):
+    table = JobTable()
+    monkeypatch.setattr(Database, "execute_query", staticmethod(table.execute_query))
+    monkeypatch.setattr(Database, "execute_single_query", staticmethod(table.execute_single_query))
+    monkeypatch.setattr(job_service, "AI_JOB_RETRY_DELAY", 0)
+    return table
+
+async def submitted(service, **fields):
+    service._queue = asyncio.PriorityQueue()
+    return await service.submit(AIJobCreate(**job_body(**fields)), "user-1")
+
+@pytest.mark.asyncio
+async def test_a_job_is_claimed_once(jobs):
+    job = await submitted(JobService(ScriptedAI()))
+    claimed = JobService(ScriptedAI())._claim_job(job.id)
+    assert claimed["attempts"] == 0 and jobs.jobs[job.id]["status"] == JobStatus.RUNNING
+    # Another process, or a worker holding the job from a stale queue entry
+    assert JobService(ScriptedAI())._claim_job(job.id) is None
+
+@pytest.mark.asyncio
+async def test_a_claim_racing_a_retry_loses(jobs, monkeypatch):
+    job = await submitted(JobService(ScriptedAI()))
+    read_before_retry = dict(jobs.jobs[job.id])
+    # Meanwhile another process ran the first attempt, which failed and was queued again
+    jobs.jobs[job.id].update(attempts=1)
+    monkeypatch.setattr(Database, "execute_single_query", staticmethod(lambda query, params=None: read_before_retry))
+    assert JobService(ScriptedAI())._claim_job(job.id) is None
+    assert jobs.jobs[job.id]["status"] == JobStatus.QUEUED and jobs.jobs[job.id]["attempts"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_attempts_are_retried_until_one_succeeds(jobs):
+    ai = ScriptedAI(RuntimeError("upstream 503"), RuntimeError("timeout"))
+    service = JobService(ai, workers=1)
+    job = await submitted(service)
+    for _ in range(3):
+        await service._run_job(job.id)
+        await asyncio.sleep(0)
+    stored = jobs.jobs[job.id]
+    assert stored["status"] == JobStatus.SUCCEEDED and stored["attempts"] == 3
+    assert stored["history_id"] == "history-3" and stored["error"] is None
+    assert service.get_job(job.id, "user-1").result.output_data == {"summary": "ok"}
+
+@pytest.mark.asyncio
+async def test_a_job_fails_after_its_last_attempt(jobs):
+    service = JobService(ScriptedAI(*[RuntimeError(f"attempt {n}") for n in range(1, 4)]), workers=1)
+    job = await submitted(service)
+    await service._run_job(job.id)
+    assert jobs.jobs[job.id]["status"] == JobStatus.QUEUED and jobs.jobs[job.id]["error"] == "attempt 1"
+    assert job.id in service._retry_handles
+    await service._run_job(job.id)
+    await service._run_job(job.id)
+    stored = jobs.jobs[job.id]
+    assert stored["status"] == JobStatus.FAILED and stored["attempts"] == 3
+    assert stored["error"] == "attempt 3" and stored["result_data"] is None
+    # Finished jobs are never claimed again
+    assert service._claim_job(job.id) is None
+
+@pytest.mark.asyncio
+async def test_workers_run_higher_priority_jobs_first(jobs):
+    ai = ScriptedAI()
+    service = JobService(ai, workers=1)
+    service._queue = asyncio.PriorityQueue()
+    for document_id, priority in (("low", -5), ("default", 0), ("lowest", -10), ("default-2", 0)):
+        await service.submit(AIJobCreate(**job_body(document_id=document_id, priority=priority)), "user-1")
+    service._workers = [asyncio.create_task(service._worker())]
+    await asyncio.wait_for(service._queue.join(), timeout=5)
+    await service.stop()
+    assert [document_id for document_id, _ in ai.calls] == ["default", "default-2", "low", "lowest"]
+
+@pytest.mark.asyncio
+async def test_stop_returns_unfinished_jobs_to_the_queue(jobs):
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowAI(ScriptedAI):
+        def process_ai_request(self, request, user_id):
+            started.set()
+            release.wait(5)
+            return super().process_ai_request(request, user_id)
+
+    service = JobService(SlowAI(), workers=1)
+    job = await submitted(service)
+    service._workers = [asyncio.create_task(service._worker())]
+    await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+    try:
+        await service.stop(drain_timeout=0.05)
+        assert jobs.jobs[job.id]["status"] == JobStatus.QUEUED
+    finally:
+        release.set()
@@ -0,0 +1,51 @@
+from services.metrics import REGISTRY, MetricsRegistry
+
+def test_render_in_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests", "Requests served", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    in_use = registry.gauge("in_use", "Connections in use")
+    registry.register_collector("cache_size", "gauge", "Entries", lambda: [("cache_size", {"cache": 'a"b'}, 3)])
+    requests.inc("/api/documents/{document_id}")
+    requests.inc("/api/documents/{document_id}", amount=2)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+    in_use.inc()
+    in_use.dec(amount=0.5)
+
+    assert registry.counter("requests", "again") is requests
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests served",
+        "# TYPE requests_total counter",
+        'requests_total{route="/api/documents/{document_id}"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+        "# HELP in_use Connections in use",
+        "# TYPE in_use gauge",
+        "in_use 0.5",
+        "# HELP cache_size Entries",
+        "# TYPE cache_size gauge",
+        'cache_size{cache="a\\"b"} 3',
+    ]
+
+def test_a_failing_collector_does_not_break_the_scrape():
+    registry = MetricsRegistry()
+    registry.register_collector("broken", "gauge", "Fails", lambda: 1 / 0)
+    registry.gauge("ok", "Works").set(1)
+    rendered = registry.render()
+    assert "# collector broken failed: division by zero" in rendered and "\nok 1\n" in rendered
+
+def test_requests_are_recorded_per_route_template(client):
+    # An unknown format is rejected before anything touches the database
+    assert client.get("/api/documents/doc-404/export/bogus").status_code == 422
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/api/documents/{document_id}/export/{export_format}",status="422"' in response.text
+    assert "doc-404" not in response.text
+    assert REGISTRY.render().count("# TYPE http_request_duration_seconds histogram") == 1
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import pytest
+from services.circuit_breaker import CircuitOpenError, UpstreamTimeoutError
+from services.model_router import ModelClient, ModelRouter
+
+class FakeModel:
+    def __init__(self, reply, delay=0.0, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(text=self.reply)
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+def router(executor, fast=None, large=None):
+    return ModelRouter(
+        fast=ModelClient("fast", "flash", fast or FakeModel("fast"), 0.1, 0.3),
+        large=ModelClient("large", "pro", large or FakeModel("large"), 0.5, 1.5),
+        executor=executor,
+    )
+
+def test_short_simple_prompts_go_to_the_fast_model(executor):
+    models = router(executor)
+    assert [model.tier for model in models.route("grammar_check", 100)] == ["fast", "large"]
+    assert [model.tier for model in models.route("grammar_check", 100000)] == ["large", "fast"]
+    assert [model.tier for model in models.route("summarize", 100)] == ["large", "fast"]
+    assert models.generate("Fix this", "grammar_check").text == "fast"
+    stats = models.stats()["models"]["fast"]
+    assert stats["calls"] == 1 and stats["input_tokens"] == 2 and stats["output_tokens"] == 1
+
+def test_open_breaker_sends_calls_to_the_other_model(executor):
+    models = router(executor)
+    models.fast.breaker._open()
+    assert models.generate("Fix this", "grammar_check").text == "large"
+    models.large.breaker._open()
+    with pytest.raises(CircuitOpenError):
+        models.generate("Fix this", "grammar_check")
+
+def test_slow_calls_time_out_and_count_against_the_breaker(executor):
+    models = router(executor, large=FakeModel("late", delay=0.3))
+    models.timeouts._timeouts["large:summarize"] = 0.05
+    with pytest.raises(UpstreamTimeoutError):
+        models.generate("Summarize", "summarize")
+    assert list(models.large.breaker._calls) == [(True, False)]
+
+def test_a_hedge_wins_when_the_first_model_is_slow(executor):
+    models = router(executor, large=FakeModel("late", delay=0.5), fast=FakeModel("hedge"))
+    for _ in range(20):
+        models.timeouts.observe("large:summarize", 0.02)
+    assert models.generate("Summarize", "summarize").text == "hedge"
+    assert (models.hedges_sent, models.hedges_won) == (1, 1)
+
+def test_failed_calls_raise(executor):
+    models = router(executor, large=FakeModel("", error=RuntimeError("quota")))
+    with pytest.raises(RuntimeError):
+        models.generate("Summarize", "summarize")
+    assert models.stats()["models"]["large"]["errors"] == 1
@@ -0,0 +1,113 @@
+import copy
+import random
+import pytest
+from services.operations import (
+    OperationError, _transform_lists, apply_operation, parse_operation, transform, transform_all
+)
+
+def insert(offset, text, path=("text",)):
+    return {"op": "insert", "path": list(path), "offset": offset, "text": text}
+
+def delete(offset, length, path=("text",)):
+    return {"op": "delete", "path": list(path), "offset": offset, "length": length}
+
+def set_value(path, value):
+    return {"op": "set", "path": list(path), "value": value}
+
+def applied(document, ops):
+    document = copy.deepcopy(document)
+    for op in ops:
+        apply_operation(document, op)
+    return document
+
+@pytest.mark.parametrize("raw", [
+    None,
+    {"op": "insert", "path": [], "offset": 0, "text": "a"},
+    {"op": "insert", "path": ["text", True], "offset": 0, "text": "a"},
+    {"op": "insert", "path": ["text"], "offset": -1, "text": "a"},
+    {"op": "insert", "path": ["text"], "offset": 0, "text": ""},
+    {"op": "delete", "path": ["text"], "offset": 0, "length": 0},
+    {"op": "set", "path": ["text"]},
+    {"op": "move", "path": ["text"], "offset": 0},
+])
+def test_parse_rejects_malformed_operations(raw):
+    with pytest.raises(OperationError):
+        parse_operation(raw)
+
+def test_parse_keeps_only_known_fields():
+    assert parse_operation({**insert(1, "x"), "extra": 1}) == insert(1, "x")
+
+def test_apply():
+    document = {"text": "hello", "items": ["a"]}
+    apply_operation(document, insert(5, " world"))
+    apply_operation(document, delete(0, 1))
+    apply_operation(document, set_value(["items", 1], "b"))
+    apply_operation(document, set_value(["title"], "T"))
+    assert document == {"text": "ello world", "items": ["a", "b"], "title": "T"}
+
+@pytest.mark.parametrize("op", [
+    insert(6, "x"),
+    delete(3, 3),
+    insert(0, "x", path=("items",)),
+    set_value(["items", 5], 1),
+    set_value(["missing", "key"], 1),
+])
+def test_apply_leaves_the_document_alone_when_it_fails(op):
+    document = {"text": "hello", "items": ["a"]}
+    with pytest.raises(OperationError):
+        apply_operation(document, op)
+    assert document == {"text": "hello", "items": ["a"]}
+
+def test_transform_inserts_at_the_same_offset_by_order():
+    assert transform(insert(2, "a"), insert(2, "b")) == [insert(3, "a")]
+    assert transform(insert(2, "a"), insert(2, "b"), op_first=True) == [insert(2, "a")]
+
+def test_transform_delete_around_an_insert():
+    assert transform(delete(1, 4), insert(3, "xy")) == [delete(1, 2), delete(3, 2)]
+
+def test_transform_overlapping_deletes():
+    assert transform(delete(2, 4), delete(4, 4)) == [delete(2, 2)]
+    assert transform(delete(2, 2), delete(0, 6)) == []
+
+def test_transform_against_a_set():
+    assert transform(insert(0, "x", path=("a", "b")), set_value(["a"], {})) == []
+    assert transform(insert(0, "x"), set_value(["other"], 1)) == [insert(0, "x")]
+    # Of two sets of one path the later wins
+    assert transform(set_value(["a"], 1), set_value(["a"], 2)) == [set_value(["a"], 1)]
+    assert transform(set_value(["a"], 1), set_value(["a"], 2), op_first=True) == []
+    assert transform(set_value(["a"], 1), set_value(["a", "b"], 2)) == [set_value(["a"], 1)]
+
+def test_transform_all_rebases_each_op_on_the_ones_before():
+    ops = [insert(0, "a"), insert(1, "b")]
+    assert transform_all(ops, [insert(0, "XY"), delete(0, 1)]) == [insert(1, "a"), insert(2, "b")]
+    assert transform_all(ops, []) == ops
+
+def random_ops(rng, document, count):
+    """A sequence of valid ops, each relative to the document after the ones before it"""
+    document = copy.deepcopy(document)
+    ops = []
+    for _ in range(count):
+        path = [rng.choice(["text", "title"])]
+        if rng.random() < 0.1:
+            op = set_value(path, rng.choice(["", "set", "reset value"]))
+        else:
+            text = document[path[0]]
+            if text and rng.random() < 0.45:
+                offset = rng.randrange(len(text))
+                op = delete(offset, rng.randint(1, len(text) - offset), path)
+            else:
+                op = insert(rng.randint(0, len(text)), rng.choice(["a", "bc", "xyz"]), path)
+        apply_operation(document, op)
+        ops.append(op)
+    return ops
+
+@pytest.mark.parametrize("seed", range(300))
+def test_concurrent_edits_converge(seed):
+    # The server applies its ops then the client's rebased ones; the client the other way round
+    rng = random.Random(seed)
+    document = {"text": "".join(rng.choice("abcdef") for _ in range(rng.randint(0, 12))), "title": "draft"}
+    server_ops = random_ops(rng, document, rng.randint(1, 6))
+    client_ops = random_ops(rng, document, rng.randint(1, 6))
+    client_rebased, server_rebased = _transform_lists(client_ops, server_ops)
+    assert client_rebased == transform_all(client_ops, server_ops)
+    assert applied(document, server_ops + client_rebased) == applied(document, client_ops + server_rebased)
@@ -0,0 +1,70 @@
+import hashlib
+import io
+import os
+import pytest
+from PyPDF2 import PdfReader
+from services import pdf_service
+from services.blob_store import BlobStore
+from services.export_service import _PdfTextWriter
+from services.pdf_service import PdfService
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path))
+
+def stored_pdf(store, page_count):
+    output = io.BytesIO()
+    writer = _PdfTextWriter(output)
+    writer.begin()
+    for number in range(1, page_count + 1):
+        writer.add_page([f"Text of page {number}"])
+    writer.end("Quarterly report")
+    data = output.getvalue()
+    blob_key = store.blob_key(hashlib.sha256(data).hexdigest())
+    path = store.blob_path(blob_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return blob_key
+
+def test_pages_are_extracted_once_and_read_by_range(store, monkeypatch):
+    blob_key = stored_pdf(store, 5)
+    service = PdfService(store)
+    content = service.document_content(blob_key)
+    assert content["page_count"] == 5 and content["metadata"]["title"] == "Quarterly report"
+    assert content["pages"][0]["width"] == 612 and "text" not in content["pages"][0]
+
+    pages = service.get_pages(blob_key, 2, 3)
+    assert [page["number"] for page in pages] == [2, 3]
+    assert "Text of page 3" in pages[1]["text"]
+
+    # Another process finds the stored extraction without parsing the PDF again
+    monkeypatch.setattr(pdf_service, "PDF_MAX_PAGES_PER_REQUEST", 2)
+    fresh = PdfService(store)
+    monkeypatch.setattr(fresh, "blob_store", None)
+    assert fresh.get_text(blob_key, "4-5, 1").split("\n\n")[0] == "[Page 4]\nText of page 4"
+    assert [page["number"] for page in fresh.get_pages(blob_key, 0, 9)] == [1, 2, 3, 4, 5]
+
+def test_render_pages_builds_a_smaller_pdf(store):
+    blob_key = stored_pdf(store, 4)
+    rendered = PdfReader(io.BytesIO(PdfService(store).render_pages(blob_key, 2, 3)))
+    assert len(rendered.pages) == 2
+    assert "Text of page 2" in rendered.pages[0].extract_text()
+
+@pytest.mark.parametrize("spec, ranges", [
+    ("1-3,7", [(1, 3), (7, 7)]),
+    (" 2 , 4-100", [(2, 2), (4, 10)]),
+    ("0-2", [(1, 2)]),
+])
+def test_parse_page_spec(spec, ranges):
+    assert PdfService.parse_page_spec(spec, 10) == ranges
+
+@pytest.mark.parametrize("spec", ["a-b", ",", "11-12", "5-3"])
+def test_invalid_page_specs(spec):
+    with pytest.raises(ValueError):
+        PdfService.parse_page_spec(spec, 10)
+
+def test_clamp_range():
+    assert PdfService.clamp_range(1, 500, 200, max_pages=50) == (1, 50)
+    with pytest.raises(ValueError):
+        PdfService.clamp_range(1, 1, 0)
@@ -0,0 +1,71 @@
+import pytest
+from models.models import AIAction, AIRequest
+from services import rate_limiter
+from services.rate_limiter import InMemoryRateLimitBackend, RateLimiter, RateLimitExceeded, estimate_tokens
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "AI_USER_TOKENS_PER_MINUTE", 6000)
+    monkeypatch.setattr(rate_limiter, "AI_ACTION_REQUESTS_PER_MINUTE", 5)
+    monkeypatch.setattr(rate_limiter, "AI_MAX_PROMPT_TOKENS", 3000)
+
+def request(chars: int = 400, action: AIAction = AIAction.SUMMARIZE) -> AIRequest:
+    return AIRequest(action=action, document_id="doc-1", text_content="x" * chars)
+
+def test_estimate_counts_output_for_text_transforms():
+    summary = estimate_tokens(request(4000))
+    rewrite = estimate_tokens(request(4000, AIAction.IMPROVE_WRITING))
+    assert summary == 1000 + rate_limiter.PROMPT_OVERHEAD_TOKENS + rate_limiter.DEFAULT_OUTPUT_TOKENS
+    assert rewrite == 2 * (1000 + rate_limiter.PROMPT_OVERHEAD_TOKENS)
+
+def test_new_user_cannot_exceed_the_budget_in_one_batch(limits):
+    limiter = RateLimiter(InMemoryRateLimitBackend())
+    batch = [request(8000)] * 5
+    assert all(estimate_tokens(item) <= rate_limiter.AI_MAX_PROMPT_TOKENS for item in batch)
+    with pytest.raises(ValueError, match="too large"):
+        limiter.check("new-user", batch)
+    # Nothing was charged, so a batch that fits is still admitted
+    limiter.check("new-user", batch[:2])
+
+def test_single_request_over_the_prompt_limit(limits):
+    with pytest.raises(ValueError, match="Request too large"):
+        RateLimiter(InMemoryRateLimitBackend()).check("user-1", [request(20000)])
+
+def test_too_many_requests_for_one_action(limits):
+    with pytest.raises(ValueError, match="Too many summarize"):
+        RateLimiter(InMemoryRateLimitBackend()).check("user-1", [request(10)] * 6)
+
+def test_budget_is_shared_and_reports_retry_after(limits):
+    limiter = RateLimiter(InMemoryRateLimitBackend())
+    limiter.check("user-1", [request(8000)] * 2)
+    with pytest.raises(RateLimitExceeded) as raised:
+        limiter.check("user-1", [request(8000)] * 2)
+    assert raised.value.retry_after > 0
+    assert limiter.rejected == 1
+    # Other users have their own buckets
+    limiter.check("user-2", [request(8000)] * 2)
+
+def test_buckets_refill_over_time(limits, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: clock[0])
+    limiter = RateLimiter(InMemoryRateLimitBackend())
+    limiter.check("user-1", [request(8000)] * 2)
+    with pytest.raises(RateLimitExceeded) as raised:
+        limiter.check("user-1", [request(8000)] * 2)
+    clock[0] += raised.value.retry_after
+    limiter.check("user-1", [request(8000)] * 2)
+
+def test_refilled_buckets_are_pruned(limits, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: clock[0])
+    backend = InMemoryRateLimitBackend()
+    limiter = RateLimiter(backend)
+    for user in range(50):
+        limiter.check(f"user-{user}", [request()])
+    assert len(backend._state) == 100
+    clock[0] += rate_limiter.PRUNE_INTERVAL_SECONDS - 1
+    limiter.check("user-0", [request(8000)] * 2)
+    clock[0] += 1
+    limiter.check("user-1", [request()])
+    # Only buckets charged within the last minute are still refilling
+    assert set(backend._state) == {"tokens:user-0", "action:user-0:summarize", "tokens:user-1", "action:user-1:summarize"}
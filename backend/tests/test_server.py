@@ -0,0 +1,19 @@
+import os
+import server
+
+def test_gunicorn_workers_recycle_and_import_the_app_themselves(monkeypatch):
+    monkeypatch.setattr(server, "MAX_REQUESTS", 0)
+    options = server.gunicorn_options()
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert options["preload_app"] is False
+    assert options["max_requests_jitter"] == 0
+    monkeypatch.setattr(server, "MAX_REQUESTS", 100)
+    assert server.gunicorn_options()["max_requests_jitter"] == server.MAX_REQUESTS_JITTER
+
+def test_schema_is_created_once_before_forking(monkeypatch):
+    from database import init
+    created = []
+    monkeypatch.setattr(init, "create_database", lambda: created.append(True))
+    monkeypatch.setenv("DB_INIT_ON_STARTUP", "true")
+    server.init_schema_once()
+    assert created == [True] and os.environ["DB_INIT_ON_STARTUP"] == "false"
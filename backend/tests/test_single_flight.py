@@ -0,0 +1,45 @@
+import threading
+import time
+import pytest
+from services.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        return {"summary": ["ok"]}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", fetch)))
+    leader.start()
+    entered.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    deadline = time.monotonic() + 5
+    while flight.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    # Each follower gets its own copy
+    values = [value for value, _ in results]
+    assert all(value == {"summary": ["ok"]} for value in values)
+    assert len({id(value["summary"]) for value in values}) == 4
+    assert flight.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+
+def test_failures_reach_every_waiter_and_are_not_kept():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do("key", lambda: (_ for _ in ()).throw(RuntimeError("upstream")))
+    assert flight.do("key", lambda: 42) == (42, False)
+    assert flight.stats()["executed"] == 2
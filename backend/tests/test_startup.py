@@ -0,0 +1,16 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["google.generativeai", "openpyxl", "docx", "PyPDF2", "numpy"]
+
+def test_importing_the_app_leaves_heavy_dependencies_unloaded():
+    script = (
+        "import json, sys; import main; "
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import pytest
+from services import tracing
+from services.tracing import TracingMiddleware, normalize_sql
+
+@pytest.mark.parametrize("query, normalized", [
+    ("SELECT * FROM documents\n  WHERE id = 'abc' AND version > 3", "SELECT * FROM documents WHERE id = ? AND version > ?"),
+    ("SELECT id FROM users WHERE id IN (%s, %s, %s)", "SELECT id FROM users WHERE id IN (...)"),
+    ("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)", "INSERT INTO t (a, b) VALUES (...), ..."),
+    ("SELECT \"it's\" FROM t2", "SELECT ? FROM t2"),
+])
+def test_normalize_sql(query, normalized):
+    assert normalize_sql(query) == normalized
+
+async def endpoint(scope, receive, send):
+    with tracing.span("db", "lookup"):
+        pass
+    tracing.record("ai", 0, 0.002)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def serve(middleware, headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/documents", "headers": list(headers)}
+    asyncio.run(middleware(scope, None, send))
+    return dict(sent[0]["headers"])
+
+def test_sampled_requests_get_server_timing():
+    headers = serve(TracingMiddleware(endpoint, sample_rate=1.0))
+    timing = headers[b"server-timing"].decode()
+    assert timing.startswith('db;dur=') and 'desc="1 call"' in timing
+    assert ', ai;dur=2.0;desc="1 call", total;dur=' in timing
+    assert tracing.current_trace() is None
+
+def test_x_trace_header_overrides_sampling():
+    assert b"server-timing" not in serve(TracingMiddleware(endpoint, sample_rate=1.0), [(b"x-trace", b"0")])
+    assert b"server-timing" in serve(TracingMiddleware(endpoint, sample_rate=0.0), [(b"x-trace", b"1")])
+    assert b"server-timing" not in serve(TracingMiddleware(endpoint, sample_rate=0.0))
+
+def test_slow_requests_are_logged_with_their_spans(monkeypatch, caplog):
+    monkeypatch.setattr(tracing, "SLOW_REQUEST_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="services.tracing"):
+        serve(TracingMiddleware(endpoint, sample_rate=1.0))
+    assert "Slow request GET /api/documents" in caplog.text and "db " in caplog.text
+
+def test_spans_from_worker_threads_reach_the_trace():
+    from concurrent.futures import ThreadPoolExecutor
+    trace = tracing.Trace("GET", "/")
+    token = tracing._current_trace.set(trace)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(tracing.propagate(tracing.record), "ai", trace.started, 0.001).result()
+            executor.submit(tracing.record, "lost", trace.started, 0.001).result()
+    finally:
+        tracing._current_trace.reset(token)
+    assert [span.name for span in trace.spans] == ["ai"]
@@ -0,0 +1,100 @@
+import pytest
+from mysql.connector import Error
+from database.database import Database
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self.closed = False
+
+    def execute(self, query, params=()):
+        if "fail" in query:
+            raise Error("statement failed")
+        self.connection.log.append(("execute", query, tuple(params)))
+        self.rowcount = 1
+
+    def executemany(self, query, seq_params):
+        self.connection.log.append(("executemany", query, [tuple(params) for params in seq_params]))
+        self.rowcount = len(seq_params)
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def is_connected(self):
+        return True
+
+    def start_transaction(self):
+        self.log.append("begin")
+
+    def commit(self):
+        self.log.append("commit")
+
+    def rollback(self):
+        self.log.append("rollback")
+
+    def close(self):
+        self.log.append("release")
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def get_connection(cls):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(Database, "get_connection", classmethod(get_connection))
+    monkeypatch.setattr(Database, "_in_use", 1000)
+    return opened
+
+def test_statements_in_a_transaction_share_one_commit(connections):
+    with Database.transaction():
+        Database.execute_query("INSERT INTO documents (id) VALUES (%s)", ("doc-1",))
+        with Database.transaction():
+            Database.execute_query("UPDATE users SET name = %s", ("x",))
+        Database.execute_single_query("SELECT * FROM documents WHERE id = %s", ("doc-1",))
+    assert len(connections) == 1
+    assert connections[0].log == [
+        "begin",
+        ("execute", "INSERT INTO documents (id) VALUES (%s)", ("doc-1",)),
+        ("execute", "UPDATE users SET name = %s", ("x",)),
+        ("execute", "SELECT * FROM documents WHERE id = %s", ("doc-1",)),
+        "commit",
+        "release",
+    ]
+
+def test_an_error_rolls_everything_back(connections):
+    with pytest.raises(Error):
+        with Database.transaction():
+            Database.execute_query("INSERT INTO documents (id) VALUES (%s)", ("doc-1",))
+            Database.execute_query("fail")
+    assert connections[0].log[-2:] == ["rollback", "release"]
+    assert "commit" not in connections[0].log
+    # The next statement runs on its own again
+    Database.execute_query("DELETE FROM documents WHERE id = %s", ("doc-1",))
+    assert len(connections) == 2 and connections[1].log[-2:] == ["commit", "release"]
+
+def test_executemany_sends_one_batch(connections):
+    rows = [("a", 1), ("b", 2)]
+    assert Database.executemany("INSERT INTO t (k, v) VALUES (%s, %s)", rows) == 2
+    assert connections[0].log == ["begin", ("executemany", "INSERT INTO t (k, v) VALUES (%s, %s)", rows), "commit", "release"]
+    assert Database.executemany("INSERT INTO t (k, v) VALUES (%s, %s)", []) == 0
+    assert len(connections) == 1
+
+def test_execute_statements_returns_each_row_count(connections):
+    assert Database.execute_statements([("UPDATE a SET x = 1", None), ("UPDATE b SET y = %s", (2,))]) == [1, 1]
+    assert connections[0].log[0] == "begin" and connections[0].log[-2:] == ["commit", "release"]